@@ -98,9 +98,21 @@ import arcpy
 import os
 import sys
 import shutil
+import numpy as np
 from arcpy import env
 from arcpy.sa import *
 
+# Dependent scripts
+from imageEnhancements import enhancementSource, writeEnhancements, enhancementComposite
+from tableJoin import one_to_one_join
+from thresholdsLib import get_thresholds
+from terrainLib import saveTerrain
+from burnJoin import joinBurnMetrics
+from flamMapLib import genLCP, runFlamMap, collectBurns
+from rasterArrays import rasterToArray, writeIntermediate, alignToGrid
+from corridorLib import assetCorridor, applyCorridor
+from zoneLib import shareRasters, openShared, zoneRings, zoneView
+
 # Overwrite Setting
 script_db = "K:\\TFS_Fire\\Tools"
 #-----------------------------------------------
@@ -123,6 +135,15 @@ dependent_scripts = [
   "imageEnhancements.py",
   "thresholdsLib.py",
   "tableJoin.py",
+  "rasterArrays.py",
+  "terrainLib.py",
+  "burnJoin.py",
+  "flamMapLib.py",
+  "mitigationLib.py",
+  "scenarioLib.py",
+  "corridorLib.py",
+  "zoneLib.py",
+  "runPipeline.py",
   #"mitigation_ts.py"
 ]
 
@@ -131,112 +152,123 @@ dependent_dlls = [
   "GenLCPv2.dll",
   "FlamMapF.dll"
 ]
-# Create new project folder and set environment
-scriptpath = sys.path[0] # Find script
-toolpath = os.path.dirname(scriptpath)  # Find parent directory
-current_project = os.path.join(toolpath)
-if os.path.basename(toolpath) == date:
-  arcpy.AddMessage("File structure is setup.")
-elif os.path.basename(scriptpath) != date:
-    if os.path.basename(scriptpath) == "Scripts":
-      new_toolpath = os.path.dirname(toolpath)
-      current_project = os.path.join(new_toolpath,date)
-    else:
-      current_project = os.path.join(toolpath,date)
-    os.makedirs(current_project)        # Make new project folder
-    for folder_name in folder_structure:
-      folder = os.path.join(current_project, folder_name)
-      os.makedirs(folder)
-      if folder_name == "01_Inputs":
-        if os.path.basename(scriptpath) == "Scripts":
-          input_path = os.path.join(toolpath, "01_Inputs")
-          for root, dirs, inputs in os.walk(scriptpath):
+
+# Settings (above) that a runPipeline.py config can replace
+setting_names = [
+  "date", "location_name", "bioregion", "projection", "coarsening_size",
+  "tile_size", "model", "buff_distance", "input_bnd", "input_naip",
+  "input_heights", "input_dem", "input_pipeline", "input_fuel_moisture",
+  "input_wind", "input_weather", "align_inputs", "pipe_analysis",
+  "create_obia", "classify_landscape", "run_svm", "classify_fuels",
+  "create_LCP", "run_FlamMap", "join_burns", "create_MXD"
+]
+#-----------------------------------------------
+#-----------------------------------------------
+
+#-----------------------------------------------
+#-----------------------------------------------
+def pipelineSettings(overrides=None):
+  # Settings above as a dict, with overrides (e.g. the "settings" of a
+  # runPipeline.py config) replacing them
+  settings = dict((name, globals()[name]) for name in setting_names)
+  overrides = overrides or {}
+  unknown = [name for name in overrides if name not in settings]
+  if unknown:
+    raise ValueError("Unknown settings: " + ", ".join(sorted(unknown)))
+  settings.update(overrides)
+  return settings
+
+def setupProject(date):
+  # Creates the project folder for date (folder structure, inputs, scripts
+  # and dlls) unless the script already runs from it. Returns its path.
+  scriptpath = sys.path[0] # Find script
+  toolpath = os.path.dirname(scriptpath)  # Find parent directory
+  current_project = os.path.join(toolpath)
+  if os.path.basename(toolpath) == date:
+    arcpy.AddMessage("File structure is setup.")
+  elif os.path.basename(scriptpath) != date:
+      if os.path.basename(scriptpath) == "Scripts":
+        new_toolpath = os.path.dirname(toolpath)
+        current_project = os.path.join(new_toolpath,date)
+      else:
+        current_project = os.path.join(toolpath,date)
+      os.makedirs(current_project)        # Make new project folder
+      for folder_name in folder_structure:
+        folder = os.path.join(current_project, folder_name)
+        os.makedirs(folder)
+        if folder_name == "01_Inputs":
+          if os.path.basename(scriptpath) == "Scripts":
+            input_path = os.path.join(toolpath, "01_Inputs")
+            for root, dirs, inputs in os.walk(scriptpath):
+              for input_file in inputs:
+                script_folder = os.path.join(current_project, "05_Scripts")
+                base=os.path.basename(input_file)
+                extension = os.path.splitext(input_file)[1]
+                if extension == ".py" and input_file not in dependent_scripts:
+                  arcpy.Copy_management(input_file, os.path.join(script_folder, date+".py")) # copies main to script folde
+                else:
+                  arcpy.Copy_management(input_file, os.path.join(script_folder, base))
+          else:
+            input_path = scriptpath
+          for root, dirs, inputs in os.walk(input_path):
             for input_file in inputs:
-              script_folder = os.path.join(current_project, "05_Scripts")
               base=os.path.basename(input_file)
               extension = os.path.splitext(input_file)[1]
-              if extension == ".py" and input_file not in dependent_scripts:
-                arcpy.Copy_management(input_file, os.path.join(script_folder, date+".py")) # copies main to script folde
-              else:
-                arcpy.Copy_management(input_file, os.path.join(script_folder, base))
-        else:
-          input_path = scriptpath
-        for root, dirs, inputs in os.walk(input_path):
-          for input_file in inputs:
-            base=os.path.basename(input_file)
-            extension = os.path.splitext(input_file)[1]
             
-            if extension not in [".py", ".tbx"]:
+              if extension not in [".py", ".tbx"]:
                               
-              input_folder = os.path.join(current_project, folder_name)
-              arcpy.Copy_management(os.path.join(input_path,input_file), os.path.join(input_folder, base)) # copies main to script folder
-            else:
-              input_folder = os.path.join(current_project, "05_Scripts")
-              if extension == ".py":
-                arcpy.Copy_management(input_file, os.path.join(input_folder, date+".py")) # copies main to script folde
+                input_folder = os.path.join(current_project, folder_name)
+                arcpy.Copy_management(os.path.join(input_path,input_file), os.path.join(input_folder, base)) # copies main to script folder
               else:
-                arcpy.Copy_management(input_file, os.path.join(input_folder, base)) # copies main to script folde
-      elif folder_name == "04_Scratch":
-        arcpy.CreateFileGDB_management(folder, "Scratch.gdb")
-      elif folder_name == "05_Scripts":
-        input_folder = os.path.join(current_project, folder_name)
+                input_folder = os.path.join(current_project, "05_Scripts")
+                if extension == ".py":
+                  arcpy.Copy_management(input_file, os.path.join(input_folder, date+".py")) # copies main to script folde
+                else:
+                  arcpy.Copy_management(input_file, os.path.join(input_folder, base)) # copies main to script folde
+        elif folder_name == "04_Scratch":
+          arcpy.CreateFileGDB_management(folder, "Scratch.gdb")
+        elif folder_name == "05_Scripts":
+          input_folder = os.path.join(current_project, folder_name)
               
-        for dependent_script in dependent_scripts:
-          shutil.copy2(os.path.join(script_db, dependent_script), os.path.join(input_folder, dependent_script)) # copies main to script folder 
-        for dependent_dll in dependent_dlls:
-          shutil.copy2(os.path.join(script_db, dependent_dll), os.path.join(input_folder, dependent_dll)) # copies main to script folder 
-  #os.remove(scriptpath)
-
-# Dependent scripts
-from imageEnhancements import createImageEnhancements
-from tableJoin import one_to_one_join
-from thresholdsLib import get_thresholds
-
-#Setting inputs, outputs, scratchws, scratch.gdb
-arcpy.env.workspace = current_project
-arcpy.env.overwriteOutput = True
-inputs = os.path.join(current_project, "01_Inputs")
-outputs = os.path.join(current_project, "02_Unmitigated_Outputs")
-scratchws = os.path.join(current_project, "04_Scratch") 
-scratchgdb = os.path.join(scratchws, "Scratch.gdb")   
-dll_path = os.path.join(current_project, "05_Scripts")
-
-#-----------------------------------------------
-#-----------------------------------------------
-# Set Global Variables
-# Raw inputs
-raw_naip = os.path.join(inputs, input_naip) # NAIP Imagery at 1m res
-raw_heights = os.path.join(inputs, input_heights) # Heights
-raw_dem = os.path.join(inputs, input_dem) # DEM
-pipeline = os.path.join(inputs, input_pipeline) # Pipeline 
-fuel_moisture = os.path.join(inputs, input_fuel_moisture) # Fuel Moisture
-wind = os.path.join(inputs, input_wind) # Wind
-weather = os.path.join(inputs, input_weather) # Weather
-
-#-----------------------------------------------
-#-----------------------------------------------
-
-#-----------------------------------------------
-#-----------------------------------------------
-# Set Create Layers
-# Inputs
-bnd_zones = os.path.join(inputs, input_bnd) # Bounding box for each tile
-
-# Outputs
-classified = os.path.join(outputs, "classified.shp")
-analysis_area = bnd_zones  # analysis area/ area of interest
-dem = os.path.join(outputs, "dem.tif")  # Resampled DEM in native units 
-heights = os.path.join(outputs, "heights.tif")  # Resampled heights in native units
-scaled_heights = os.path.join(outputs, "scaled_heights.tif")  # Heights in project units
-scaled_dem = os.path.join(outputs, "scaled_dem.tif")  # DEM in project units
-
-
-
-naip = os.path.join(outputs, "naip_"+coarsening_size+"m.tif")  # NAIP in project units
-naip_b1 = os.path.join(naip, "Band_1")
-naip_b2 = os.path.join(naip, "Band_2")
-naip_b3 = os.path.join(naip, "Band_3")
-naip_b4 = os.path.join(naip, "Band_4")
+          for dependent_script in dependent_scripts:
+            shutil.copy2(os.path.join(script_db, dependent_script), os.path.join(input_folder, dependent_script)) # copies main to script folder 
+          for dependent_dll in dependent_dlls:
+            shutil.copy2(os.path.join(script_db, dependent_dll), os.path.join(input_folder, dependent_dll)) # copies main to script folder 
+    #os.remove(scriptpath)
+  return current_project
+
+def projectPaths(current_project, settings):
+  # Paths of the project folders, inputs and outputs
+  inputs = os.path.join(current_project, "01_Inputs")
+  outputs = os.path.join(current_project, "02_Unmitigated_Outputs")
+  scratchws = os.path.join(current_project, "04_Scratch")
+  return {
+    "current_project": current_project,
+    "inputs": inputs,
+    "outputs": outputs,
+    "scratchws": scratchws,
+    "scratchgdb": os.path.join(scratchws, "Scratch.gdb"),
+    "dll_path": os.path.join(current_project, "05_Scripts"),
+
+    # Raw inputs
+    "raw_naip": os.path.join(inputs, settings["input_naip"]), # NAIP Imagery at 1m res
+    "raw_heights": os.path.join(inputs, settings["input_heights"]), # Heights
+    "raw_dem": os.path.join(inputs, settings["input_dem"]), # DEM
+    "pipeline": os.path.join(inputs, settings["input_pipeline"]), # Pipeline
+    "fuel_moisture": os.path.join(inputs, settings["input_fuel_moisture"]), # Fuel Moisture
+    "wind": os.path.join(inputs, settings["input_wind"]), # Wind
+    "weather": os.path.join(inputs, settings["input_weather"]), # Weather
+    "bnd_zones": os.path.join(inputs, settings["input_bnd"]), # Bounding box for each tile
+
+    # Outputs
+    "classified": os.path.join(outputs, "classified.shp"),
+    "dem": os.path.join(outputs, "dem.tif"),  # Resampled DEM in native units
+    "heights": os.path.join(outputs, "heights.tif"),  # Resampled heights in native units
+    "scaled_heights": os.path.join(outputs, "scaled_heights.tif"),  # Heights in project units
+    "scaled_dem": os.path.join(outputs, "scaled_dem.tif"),  # DEM in project units
+    "landscape_file": os.path.join(outputs, "landscape.lcp"),  # LCP for FlamMap
+    "naip": os.path.join(outputs, "naip_"+settings["coarsening_size"]+"m.tif")  # NAIP in project units
+  }
 #-----------------------------------------------
 #-----------------------------------------------
 
@@ -255,56 +287,63 @@ def newProcess(text):
   arcpy.AddMessage("-----------------------------")
   arcpy.AddMessage("Process: "+text)
   arcpy.AddMessage("-----------------------------")
-
-
-# Details
-arcpy.AddMessage("Site: "+location_name)
-arcpy.AddMessage("Projection: "+projection)
-arcpy.AddMessage("Resolution: "+coarsening_size + "m")
-arcpy.AddMessage("Fuel Model: "+model)
-arcpy.AddMessage("-----------------------------")
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
 # Projection and scaling information
-if projection == "UTMZ10":
-  scale_height = 1
-  scale_naip = 1
-  unit = "Meters"
-  projection = "PROJCS['NAD_1983_UTM_Zone_10N',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Transverse_Mercator'],PARAMETER['False_Easting',500000.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-123.0],PARAMETER['Scale_Factor',0.9996],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]"
-elif projection == "UTMZ11":
-  scale_height = 1
-  scale_naip = 1
-  unit = "Meters"
-  projection = "PROJCS['NAD_1983_UTM_Zone_11N',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Transverse_Mercator'],PARAMETER['False_Easting',500000.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-117.0],PARAMETER['Scale_Factor',0.9996],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]"
-elif projection == "SPIII":
-  scale_height = 1
-  scale_naip = 3.28084
-  unit = "Feet"
-  projection = "PROJCS['NAD_1983_StatePlane_California_III_FIPS_0403_Feet',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',6561666.666666666],PARAMETER['False_Northing',1640416.666666667],PARAMETER['Central_Meridian',-120.5],PARAMETER['Standard_Parallel_1',37.06666666666667],PARAMETER['Standard_Parallel_2',38.43333333333333],PARAMETER['Latitude_Of_Origin',36.5],UNIT['Foot_US',0.3048006096012192]]"
-elif projection == "SPIV":
-  scale_height = 1
-  scale_naip = 3.28084
-  unit = "Feet"
-  projection = "PROJCS['NAD_1983_StatePlane_California_VI_FIPS_0406_Feet',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',6561666.666666666],PARAMETER['False_Northing',1640416.666666667],PARAMETER['Central_Meridian',-116.25],PARAMETER['Standard_Parallel_1',32.78333333333333],PARAMETER['Standard_Parallel_2',33.88333333333333],PARAMETER['Latitude_Of_Origin',32.16666666666666],UNIT['Foot_US',0.3048006096012192]]"
-#-----------------------------------------------
-#-----------------------------------------------
-
-#-----------------------------------------------
-#-----------------------------------------------
-arcpy.AddMessage("-----------------------------")
-arcpy.AddMessage("Processing Started.")
-arcpy.AddMessage("-----------------------------")
-
-
+def projectionInfo(projection):
+  # (projection WKT, unit, height scale, NAIP scale) of a projection name
+  if projection == "UTMZ10":
+    scale_height = 1
+    scale_naip = 1
+    unit = "Meters"
+    wkt = "PROJCS['NAD_1983_UTM_Zone_10N',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Transverse_Mercator'],PARAMETER['False_Easting',500000.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-123.0],PARAMETER['Scale_Factor',0.9996],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]"
+  elif projection == "UTMZ11":
+    scale_height = 1
+    scale_naip = 1
+    unit = "Meters"
+    wkt = "PROJCS['NAD_1983_UTM_Zone_11N',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Transverse_Mercator'],PARAMETER['False_Easting',500000.0],PARAMETER['False_Northing',0.0],PARAMETER['Central_Meridian',-117.0],PARAMETER['Scale_Factor',0.9996],PARAMETER['Latitude_Of_Origin',0.0],UNIT['Meter',1.0]]"
+  elif projection == "SPIII":
+    scale_height = 1
+    scale_naip = 3.28084
+    unit = "Feet"
+    wkt = "PROJCS['NAD_1983_StatePlane_California_III_FIPS_0403_Feet',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',6561666.666666666],PARAMETER['False_Northing',1640416.666666667],PARAMETER['Central_Meridian',-120.5],PARAMETER['Standard_Parallel_1',37.06666666666667],PARAMETER['Standard_Parallel_2',38.43333333333333],PARAMETER['Latitude_Of_Origin',36.5],UNIT['Foot_US',0.3048006096012192]]"
+  elif projection == "SPIV":
+    scale_height = 1
+    scale_naip = 3.28084
+    unit = "Feet"
+    wkt = "PROJCS['NAD_1983_StatePlane_California_VI_FIPS_0406_Feet',GEOGCS['GCS_North_American_1983',DATUM['D_North_American_1983',SPHEROID['GRS_1980',6378137.0,298.257222101]],PRIMEM['Greenwich',0.0],UNIT['Degree',0.0174532925199433]],PROJECTION['Lambert_Conformal_Conic'],PARAMETER['False_Easting',6561666.666666666],PARAMETER['False_Northing',1640416.666666667],PARAMETER['Central_Meridian',-116.25],PARAMETER['Standard_Parallel_1',32.78333333333333],PARAMETER['Standard_Parallel_2',33.88333333333333],PARAMETER['Latitude_Of_Origin',32.16666666666666],UNIT['Foot_US',0.3048006096012192]]"
+  else:
+    raise ValueError("Unknown projection " + projection)
+  return wkt, unit, scale_height, scale_naip
+
+def startProject(settings):
+  # Sets up the project and the arcpy environment and reports the settings.
+  # Returns the project paths (see projectPaths).
+  current_project = setupProject(settings["date"])
+  arcpy.env.workspace = current_project
+  arcpy.env.overwriteOutput = True
+
+  # Details
+  arcpy.AddMessage("Site: "+settings["location_name"])
+  arcpy.AddMessage("Projection: "+settings["projection"])
+  arcpy.AddMessage("Resolution: "+settings["coarsening_size"] + "m")
+  arcpy.AddMessage("Fuel Model: "+settings["model"])
+  arcpy.AddMessage("-----------------------------")
+  arcpy.AddMessage("-----------------------------")
+  arcpy.AddMessage("Processing Started.")
+  arcpy.AddMessage("-----------------------------")
+  return projectPaths(current_project, settings)
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def align():
+def align(raw_naip, raw_heights, raw_dem, pipeline, bnd_zones, naip, heights, scaled_heights, dem, scaled_dem,
+          outputs, scratchgdb, coarsening_size, pipe_analysis, buff_distance, projection, unit,
+          scale_height, scale_naip):
   text = "Aligning cells."
   newProcess(text)
   # Resample NAIP Imagery, heights, and DEM to 
@@ -316,7 +355,6 @@ def align():
   text = "Resampling NAIP image."
   generateMessage(text)
 
-  naip = os.path.join(outputs,"naip_"+coarsening_size+"m.tif")
   bnd_zones_rast = os.path.join(scratchgdb, "bnd_zones_rast")
   cell_size = int(int(coarsening_size)*scale_naip)
   naip_cell_size = str(cell_size) +" "+str(cell_size)
@@ -375,51 +413,36 @@ def align():
 
     #-----------------------------------------------
     #-----------------------------------------------
-    text = "Creating "+str(buff_distance)+" buffer around the pipeline."
+    text = "Creating "+str(buff_distance)+" corridor around the pipeline."
     generateMessage(text)
 
     #Variables
-    pipe_seg = os.path.join(outputs, "pipe_seg.shp")
-    pipe_buffer = os.path.join(outputs, "pipe_buffer.shp")
     pipe_rast = os.path.join(scratchgdb, "pipe_rast")
-    naip_pipe = os.path.join(scratchgdb, "naip_pipe")
-    height_pipe = os.path.join(scratchgdb, "height_pipe")
-    pipe_proj = os.path.join(scratchgdb, "pipe_proj")
-    bnd_rast = os.path.join(scratchgdb, "bnd_rast")
-    bands = ["Band_1","Band_2","Band_3","Band_4"]  
+    bands = ["Band_1","Band_2","Band_3","Band_4"]
     pipe_bands = []
-    analysis_area = pipe_buffer
 
-    # Clip pipeline to study area, buffer pipeline
-    arcpy.Clip_analysis(pipeline, bnd_zones, pipe_seg)
-    arcpy.PolygonToRaster_conversion(bnd_zones, "FID", bnd_rast, "CELL_CENTER", "", int(coarsening_size))
-    arcpy.Buffer_analysis(pipe_seg, pipe_buffer, buff_distance, "", "", "ALL")
-    arcpy.PolygonToRaster_conversion(pipe_buffer, "FID", pipe_rast, "CELL_CENTER")
-    arcpy.ProjectRaster_management(pipe_rast, pipe_proj, bnd_zones, "BILINEAR", str(cell_size) +" "+str(cell_size))
-    arcpy.RasterToPolygon_conversion(pipe_proj, pipe_buffer, "NO_SIMPLIFY")
+    # Buffer the rasterized pipeline on the NAIP grid (no vector buffer)
+    naip_bands, naip_info = rasterToArray(naip)
+    corridor = assetCorridor(pipeline, naip_info, buff_distance, unit)
+    writeIntermediate(corridor.astype("int32"), naip_info, pipe_rast, nodata=0, projection=projection)
 
-      
-    # Extract NAIP and heights to pipeline buffer
-    this = ExtractByMask(naip, pipe_buffer)
-    this.save(naip_pipe)
-
-    for band in bands:
+    # Mask NAIP and heights to the corridor, 0 outside (a valid value, so
+    # the bands have no NoData)
+    naip_bands = applyCorridor(naip_bands, corridor)
+    for band, values in zip(bands, naip_bands):
       band_ras = os.path.join(scratchgdb, band)
-      naip_band = os.path.join(naip_pipe, band)
-      outRas = Con(IsNull(naip_band),0, naip_band)
-      outRas.save(band_ras)
+      writeIntermediate(values.astype("uint8"), naip_info, band_ras, nodata=None, projection=projection, overviews=False)
       pipe_bands.append(band_ras)
     arcpy.CompositeBands_management(pipe_bands, naip)
     arcpy.DefineProjection_management(naip, projection)
 
-    this = ExtractByMask(scaled_heights, pipe_buffer)
-    this.save(height_pipe)
-    outRas = Con(IsNull(height_pipe),0, Raster(height_pipe))
-    outRas.save(scaled_heights)
+    height_values, height_info = rasterToArray(scaled_heights)
+    height_corridor = alignToGrid(corridor.astype("float32"), naip_info, height_info) == 1
+    writeIntermediate(applyCorridor(height_values, height_corridor), height_info, scaled_heights, projection=projection)
     #-----------------------------------------------
     #-----------------------------------------------
-if align_inputs == "Yes":
-  align()
+
+  return naip, scaled_heights, scaled_dem, bnd_zones
 #-----------------------------------------------
 #-----------------------------------------------
 
@@ -427,453 +450,469 @@ if align_inputs == "Yes":
 #-----------------------------------------------
 #-----------------------------------------------
 # Iterate through all zones (if possible)
+def sharedSite(naip, scaled_heights, scratchws):
+  # Aligned NAIP and heights as shared memory maps (staged once per change)
+  return openShared(shareRasters([naip, scaled_heights], scratchws, ["uint8", "float32"]))
+
+def zones(bnd_zones, naip, scaled_heights, outputs, scratchws, scratchgdb, create_obia, classify_landscape,
+          bioregion, projection, unit):
+  # OBIA and fuzzy classification of each zone of bnd_zones. Returns the
+  # confused objects left for the SVM.
+  shared = sharedSite(naip, scaled_heights, scratchws)
+  confused = os.path.join(outputs, "confused.shp")
+  searchcursor = arcpy.SearchCursor(bnd_zones)
+  zones = searchcursor.next()
+  while zones:
+    zone_num = zones.getValue("FID")
+    sms_fc = os.path.join(scratchgdb, "sms_fc_"+str(zone_num))
+    if create_obia == "Yes":
+      sms_fc = obia(zone_num, zoneRings(zones.getValue("Shape")), shared, bnd_zones, naip, scaled_heights,
+                    outputs, scratchws, scratchgdb, projection, unit)
+    if classify_landscape == "Yes":
+      confused = classify_objects(zone_num, sms_fc, outputs, scratchgdb, bioregion, unit)
+    # iterate through next zone if possible
+    zones = searchcursor.next()
+  return confused
+#-----------------------------------------------
+#-----------------------------------------------
 
-searchcursor = arcpy.SearchCursor(bnd_zones)
-zones = searchcursor.next()
-while zones:
-  zone_num = zones.getValue("FID")
+#-----------------------------------------------
+#-----------------------------------------------
+def obia(zone_num, zone_rings, shared, bnd_zones, naip, scaled_heights, outputs, scratchws, scratchgdb,
+         projection, unit):
+  # Segments one zone of bnd_zones into objects (shared from sharedSite) and
+  # joins the zonal mean of the image enhancements. Returns the objects.
+  text = "Running an OBIA for zone "+str(zone_num)
+  newProcess(text)
+
+  #Variables
+  bnd = os.path.join(outputs, "zone_"+str(zone_num)+".shp")
+  bnd_rast = os.path.join(outputs, "bnd.tif")
+  where_clause = "FID = " + str(zone_num)
+  naip_zone = os.path.join(outputs, "naip_zone_"+str(zone_num)+".tif")
+  naip_zone_b1 = os.path.join(naip_zone, "Band_1")
+  naip_zone_b2 = os.path.join(naip_zone, "Band_2")
+  naip_zone_b3 = os.path.join(naip_zone, "Band_3")
+  naip_zone_b4 = os.path.join(naip_zone, "Band_4")                        
+  heights_zone = os.path.join(outputs, "height_zone_"+str(zone_num)+".tif")
+  naip_sms = os.path.join(scratchgdb, "naip_sms_"+str(zone_num))
   sms_fc = os.path.join(scratchgdb, "sms_fc_"+str(zone_num))
 
-  def obia():
-    text = "Running an OBIA for zone "+str(zone_num)
-    newProcess(text)
 
-    #Variables
-    bnd = os.path.join(outputs, "zone_"+str(zone_num)+".shp")
-    bnd_rast = os.path.join(outputs, "bnd.tif")
-    where_clause = "FID = " + str(zone_num)
-    naip_zone = os.path.join(outputs, "naip_zone_"+str(zone_num)+".tif")
-    naip_zone_b1 = os.path.join(naip_zone, "Band_1")
-    naip_zone_b2 = os.path.join(naip_zone, "Band_2")
-    naip_zone_b3 = os.path.join(naip_zone, "Band_3")
-    naip_zone_b4 = os.path.join(naip_zone, "Band_4")                        
-    heights_zone = os.path.join(outputs, "height_zone_"+str(zone_num)+".tif")
-    naip_sms = os.path.join(scratchgdb, "naip_sms_"+str(zone_num))
-    sms_fc = os.path.join(scratchgdb, "sms_fc_"+str(zone_num))
 
+  # Create zone boundary and extract NAIP and heights (only the zone's
+  # window of the site rasters is read)
 
+  arcpy.Select_analysis(bnd_zones, bnd, where_clause)
+  zone_naip, naip_info, zone_mask = zoneView(shared, naip, zone_rings)
+  # 0 is a valid NAIP value, so cells outside the zone are NoData 256 on a
+  # 16 bit raster, as ExtractByMask wrote them
+  writeIntermediate(np.where(zone_mask, zone_naip, 256).astype("uint16"), naip_info, naip_zone, nodata=256,
+                    projection=projection, overviews=False)
+  zone_heights, heights_info, heights_mask = zoneView(shared, scaled_heights, zone_rings)
+  writeIntermediate(np.where(heights_mask, zone_heights, np.nan), heights_info, heights_zone, projection=projection,
+                    overviews=False)
+  #-----------------------------------------------
+  #-----------------------------------------------
 
-    # Create zone boundary and extract NAIP and heights
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Creating ground and nonground surfaces."
+  generateMessage(text)
 
-    arcpy.Select_analysis(bnd_zones, bnd, where_clause)
-    this = ExtractByMask(naip, bnd)
-    this.save(naip_zone)
-    this = ExtractByMask(scaled_heights, bnd)
-    this.save(heights_zone)
-    #-----------------------------------------------
-    #-----------------------------------------------
+  #Variables
+  ground_mask_poly = os.path.join(scratchgdb, "ground_mask_poly")
+  nonground_mask_poly = os.path.join(scratchgdb, "nonground_mask_poly")
+  ground_mask_raw = os.path.join(scratchgdb, "ground_mask_raw")
+  nonground_mask_raw = os.path.join(scratchgdb, "nonground_mask_raw")
+  ground_dissolve_output = os.path.join(scratchgdb, "ground_mask_dis")
+  nonground_dissolve_output = os.path.join(scratchgdb, "nonground_mask_dis")
+  ground_mask_raster = os.path.join(scratchgdb, "ground_mask_raster")
+  nonground_mask_raster = os.path.join(scratchgdb, "nonground_mask_raster")
+  nonground_mask_resample = os.path.join(scratchgdb, "nonground_mask_resample")
+  ground_mask_resample = os.path.join(scratchgdb, "ground_mask_resample")
+
+  #Find minimum cell area
+  min_cell_area = int(float(str(arcpy.GetRasterProperties_management(naip, "CELLSIZEX", "")))**2)+1
+  where_clause = "Shape_Area > " + str(min_cell_area)
+
+  # Create masks for ground and nonground features according to ground_ht_threshold
+  if unit == "Meters":
+    ground_ht_threshold = 0.6096
+  elif unit == "Feet":
+    ground_ht_threshold = 2
+
+  mask = SetNull(Int(heights_zone),Int(heights_zone),"VALUE > " + str(ground_ht_threshold))
+  arcpy.RasterToPolygon_conversion(mask, ground_mask_raw, "NO_SIMPLIFY", "VALUE", )
+  arcpy.Dissolve_management(ground_mask_raw, ground_dissolve_output)
+
+  # Find cell size of imagery
+  cell_size = str(arcpy.GetRasterProperties_management(naip, "CELLSIZEX", ""))
+
+  # A process of clipping polygons and erasing rasters
+  arcpy.Erase_analysis(bnd, ground_dissolve_output, nonground_mask_raw)
+  arcpy.PolygonToRaster_conversion(nonground_mask_raw, "OBJECTID", nonground_mask_raster, "CELL_CENTER", "", cell_size)
+  arcpy.RasterToPolygon_conversion(nonground_mask_raster, nonground_mask_raw, "NO_SIMPLIFY", "VALUE")
+  arcpy.Select_analysis(nonground_mask_raw, nonground_mask_poly, where_clause)
+  arcpy.Erase_analysis(bnd, nonground_mask_poly, ground_mask_poly)
+  arcpy.PolygonToRaster_conversion(ground_mask_poly, "OBJECTID", ground_mask_raster, "CELL_CENTER", "", cell_size)
+  arcpy.RasterToPolygon_conversion(ground_mask_raster, ground_mask_raw, "NO_SIMPLIFY", "VALUE")
+  arcpy.Select_analysis(ground_mask_raw, ground_mask_poly, where_clause)
+  arcpy.Erase_analysis(bnd, ground_mask_poly, nonground_mask_poly)
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  # Segment each surface separately using SMS
+  spectral_detail = 20
+  spatial_detail = 20
+  min_seg_size = 1
+
+  surfaces = ["ground", "nonground"]
+  naip_lst = []
+  ground_mask_poly = []
+
+  for surface in surfaces:
 
     #-----------------------------------------------
     #-----------------------------------------------
-    text = "Creating ground and nonground surfaces."
+    text = "Extracting NAIP imagery by "+ surface + " mask."
     generateMessage(text)
-
+    
     #Variables
-    ground_mask_poly = os.path.join(scratchgdb, "ground_mask_poly")
-    nonground_mask_poly = os.path.join(scratchgdb, "nonground_mask_poly")
-    ground_mask_raw = os.path.join(scratchgdb, "ground_mask_raw")
-    nonground_mask_raw = os.path.join(scratchgdb, "nonground_mask_raw")
-    ground_dissolve_output = os.path.join(scratchgdb, "ground_mask_dis")
-    nonground_dissolve_output = os.path.join(scratchgdb, "nonground_mask_dis")
-    ground_mask_raster = os.path.join(scratchgdb, "ground_mask_raster")
-    nonground_mask_raster = os.path.join(scratchgdb, "nonground_mask_raster")
-    nonground_mask_resample = os.path.join(scratchgdb, "nonground_mask_resample")
-    ground_mask_resample = os.path.join(scratchgdb, "ground_mask_resample")
-
-    #Find minimum cell area
-    min_cell_area = int(float(str(arcpy.GetRasterProperties_management(naip, "CELLSIZEX", "")))**2)+1
-    where_clause = "Shape_Area > " + str(min_cell_area)
-
-    # Create masks for ground and nonground features according to ground_ht_threshold
-    if unit == "Meters":
-      ground_ht_threshold = 0.6096
-    elif unit == "Feet":
-      ground_ht_threshold = 2
-
-    mask = SetNull(Int(heights_zone),Int(heights_zone),"VALUE > " + str(ground_ht_threshold))
-    arcpy.RasterToPolygon_conversion(mask, ground_mask_raw, "NO_SIMPLIFY", "VALUE", )
-    arcpy.Dissolve_management(ground_mask_raw, ground_dissolve_output)
-
-    # Find cell size of imagery
-    cell_size = str(arcpy.GetRasterProperties_management(naip, "CELLSIZEX", ""))
-
-    # A process of clipping polygons and erasing rasters
-    arcpy.Erase_analysis(bnd, ground_dissolve_output, nonground_mask_raw)
-    arcpy.PolygonToRaster_conversion(nonground_mask_raw, "OBJECTID", nonground_mask_raster, "CELL_CENTER", "", cell_size)
-    arcpy.RasterToPolygon_conversion(nonground_mask_raster, nonground_mask_raw, "NO_SIMPLIFY", "VALUE")
-    arcpy.Select_analysis(nonground_mask_raw, nonground_mask_poly, where_clause)
-    arcpy.Erase_analysis(bnd, nonground_mask_poly, ground_mask_poly)
-    arcpy.PolygonToRaster_conversion(ground_mask_poly, "OBJECTID", ground_mask_raster, "CELL_CENTER", "", cell_size)
-    arcpy.RasterToPolygon_conversion(ground_mask_raster, ground_mask_raw, "NO_SIMPLIFY", "VALUE")
-    arcpy.Select_analysis(ground_mask_raw, ground_mask_poly, where_clause)
-    arcpy.Erase_analysis(bnd, ground_mask_poly, nonground_mask_poly)
+    sms_raster = os.path.join(scratchgdb, surface+"_sms_raster")
+    naip_fc =  os.path.join(scratchgdb, surface + "_naip_fc")
+    mask_poly = os.path.join(scratchgdb, surface+ "_mask_poly")
+    mask = mask_poly
+    sms = os.path.join(scratchgdb, surface+"_sms")
+    naip_mask = os.path.join(scratchgdb,surface + "_naip")
+    mask_raw = os.path.join(scratchgdb, surface + "_mask_raw")
+    dissolve_output = os.path.join(scratchgdb, surface + "_mask_dis")
+
+    this = ExtractByMask(naip_zone, mask)
+    this.save(naip_mask)
+    surface_raster_slide = Con(IsNull(Float(naip_mask)), -10000, Float(naip_mask))
     #-----------------------------------------------
     #-----------------------------------------------
 
     #-----------------------------------------------
     #-----------------------------------------------
-    # Segment each surface separately using SMS
-    spectral_detail = 20
-    spatial_detail = 20
-    min_seg_size = 1
-
-    surfaces = ["ground", "nonground"]
-    naip_lst = []
-    ground_mask_poly = []
-
-    for surface in surfaces:
+    text = "Segmenting "+ surface +" objects."
+    generateMessage(text)
+    
+    # Creating objects and clipping to surface type
+    seg_naip = SegmentMeanShift(surface_raster_slide, spectral_detail, spatial_detail, min_seg_size) #, band_inputs)
+    seg_naip.save(sms_raster)
+    arcpy.RasterToPolygon_conversion(sms_raster, naip_fc, "NO_SIMPLIFY", "VALUE")
+    arcpy.Clip_analysis(naip_fc, mask_poly, sms)
+    naip_lst.extend([sms])
+    #-----------------------------------------------
+    #-----------------------------------------------
 
-      #-----------------------------------------------
-      #-----------------------------------------------
-      text = "Extracting NAIP imagery by "+ surface + " mask."
-      generateMessage(text)
-      
-      #Variables
-      sms_raster = os.path.join(scratchgdb, surface+"_sms_raster")
-      naip_fc =  os.path.join(scratchgdb, surface + "_naip_fc")
-      mask_poly = os.path.join(scratchgdb, surface+ "_mask_poly")
-      mask = mask_poly
-      sms = os.path.join(scratchgdb, surface+"_sms")
-      naip_mask = os.path.join(scratchgdb,surface + "_naip")
-      mask_raw = os.path.join(scratchgdb, surface + "_mask_raw")
-      dissolve_output = os.path.join(scratchgdb, surface + "_mask_dis")
-
-      this = ExtractByMask(naip_zone, mask)
-      this.save(naip_mask)
-      surface_raster_slide = Con(IsNull(Float(naip_mask)), -10000, Float(naip_mask))
-      #-----------------------------------------------
-      #-----------------------------------------------
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Merging ground and nonground objects."
+  generateMessage(text)
 
-      #-----------------------------------------------
-      #-----------------------------------------------
-      text = "Segmenting "+ surface +" objects."
-      generateMessage(text)
-      
-      # Creating objects and clipping to surface type
-      seg_naip = SegmentMeanShift(surface_raster_slide, spectral_detail, spatial_detail, min_seg_size) #, band_inputs)
-      seg_naip.save(sms_raster)
-      arcpy.RasterToPolygon_conversion(sms_raster, naip_fc, "NO_SIMPLIFY", "VALUE")
-      arcpy.Clip_analysis(naip_fc, mask_poly, sms)
-      naip_lst.extend([sms])
-      #-----------------------------------------------
-      #-----------------------------------------------
+  # Merge surface layers, clip to pipe buffer
+  sms_full = os.path.join(scratchgdb, "sms_full")
+  sms_fc_multi = os.path.join(scratchws,"sms_fc_multi.shp")
 
-    #-----------------------------------------------
-    #-----------------------------------------------
-    text = "Merging ground and nonground objects."
-    generateMessage(text)
+  arcpy.Merge_management(naip_lst, sms_full)
+  arcpy.Clip_analysis(sms_full, bnd, sms_fc_multi)
+  arcpy.MultipartToSinglepart_management(sms_fc_multi, sms_fc)
 
-    # Merge surface layers, clip to pipe buffer
-    sms_full = os.path.join(scratchgdb, "sms_full")
-    sms_fc_multi = os.path.join(scratchws,"sms_fc_multi.shp")
+  # Update Join IDs
+  arcpy.AddField_management(sms_fc, "JOIN", "INTEGER")
+  rows = arcpy.UpdateCursor(sms_fc)
+  i = 1
+  for row in rows:
+    row.setValue("JOIN", i)
+    rows.updateRow(row)
+    i+= 1
 
-    arcpy.Merge_management(naip_lst, sms_full)
-    arcpy.Clip_analysis(sms_full, bnd, sms_fc_multi)
-    arcpy.MultipartToSinglepart_management(sms_fc_multi, sms_fc)
+  #-----------------------------------------------
+  #-----------------------------------------------
+  # Create Image Enhancements and join to objects
+  text = "Creating image enhancements."
+  generateMessage(text)
 
-    # Update Join IDs
-    arcpy.AddField_management(sms_fc, "JOIN", "INTEGER")
-    rows = arcpy.UpdateCursor(sms_fc)
-    i = 1
-    for row in rows:
-      row.setValue("JOIN", i)
-      rows.updateRow(row)
-      i+= 1
+  image_enhancements = ["ndvi", "ndwi", "gndvi", "osavi", "height"]
+  zone_source = enhancementSource(shared, naip, scaled_heights)
+  # Indices are on the NAIP grid, so the zone's NAIP window and mask are used
+  created_enhancements_1m = writeEnhancements(zone_source, image_enhancements, zone_num, scratchgdb, naip_info, zone_mask, projection)
 
-    #-----------------------------------------------
-    #-----------------------------------------------
-    # Create Image Enhancements and join to objects
-    text = "Creating image enhancements."
-    generateMessage(text)
+  text = "Joining zonal mean of image enhancements to objects."
+  generateMessage(text)
+  for ie in created_enhancements_1m:
+    field = image_enhancements.pop(0)
+    outTable = os.path.join(scratchgdb, "zonal_"+os.path.basename(ie))
+    z_stat = ZonalStatisticsAsTable(sms_fc, "JOIN", ie, outTable, "NODATA", "MEAN")
+    arcpy.AddField_management(outTable, field, "FLOAT")
+    arcpy.CalculateField_management(outTable, field, "[MEAN]")
+    one_to_one_join(sms_fc, outTable, field, "FLOAT")
+
+  arcpy.DefineProjection_management(sms_fc, projection)
+  return sms_fc
+#-----------------------------------------------
+#-----------------------------------------------
 
-    image_enhancements = ["ndvi", "ndwi", "gndvi", "osavi", "height"]
-    created_enhancements_1m = createImageEnhancements(image_enhancements, naip_zone, heights_zone, zone_num, scratchgdb)
+#-----------------------------------------------
+#-----------------------------------------------
+# Fuzzy rule classifier
+#
+#Primitive types = [vegetation, impervious, water, confusion]
+#Land cover types = [tree, shrub, grass, pavement, building, water]
+#
+# Stages:
+#   1. Classify object based on majority primitive type
+#   2. Classify each primitive object based on IE and height
+class_stages = ["S1","S2"]
+class_structure = [
+                   ["vegetation",
+                        ["grass", "shrub", "tree"]],
+                   ["impervious",
+                        ["building", "path"]]
+                  ]
+
+# Indices used for each stage of classification
+s1_indices = ["ndvi", "ndwi", "gndvi", "osavi"]#, "gridcode"]
+s2_indices = ["height"]#, "gridcode"]
+
+def classify(stage, landcover, field, bioregion, unit):
+  if stage == "S1":
+    if field == "S1_grid":
+      threshold = get_thresholds(bioregion, stage, landcover, field, unit)
+      healthy = threshold[0]
+      dry = threshold[1]
+      return("def landcover(x):\\n"+
+             "  if x "+healthy+":\\n"+
+             "    return \"healthy\"\\n"+
+             "  elif x "+dry+":\\n"+
+             "    return \"senescent\"\\n"+
+             "  return \"impervious\""
+             )
+  
+    elif field == "S1_ndvi":
+      threshold = get_thresholds(bioregion, stage, landcover, field, unit)
+      imp = threshold[0]
+      veg = threshold[1]
+      return ("def landcover(x):\\n"+
+             "  membership = \"\"\\n"+
+             "  if "+imp+":\\n"+
+             "    membership += \"I\"\\n"+
+             "  if "+veg+":\\n"+
+             "    membership += \"V\"\\n"+
+             "  return membership\\n"
+             )
 
-    text = "Joining zonal mean of image enhancements to objects."
-    generateMessage(text)
-    for ie in created_enhancements_1m:
-      field = image_enhancements.pop(0)
-      outTable = os.path.join(scratchgdb, "zonal_"+os.path.basename(ie))
-      z_stat = ZonalStatisticsAsTable(sms_fc, "JOIN", ie, outTable, "NODATA", "MEAN")
-      arcpy.AddField_management(outTable, field, "FLOAT")
-      arcpy.CalculateField_management(outTable, field, "[MEAN]")
-      one_to_one_join(sms_fc, outTable, field, "FLOAT")
-
-    arcpy.DefineProjection_management(sms_fc, projection)
-    #-----------------------------------------------
-    #-----------------------------------------------
+    elif field == "S1_ndwi":
+      threshold = get_thresholds(bioregion, stage, landcover, field, unit)
+      imp = threshold[0]
+      veg = threshold[1]
+      return ("def landcover(x):\\n"+
+             "  membership = \"\"\\n"+
+             "  if "+imp+":\\n"+
+             "    membership += \"I\"\\n"+
+             "  if "+veg+":\\n"+
+             "    membership += \"V\"\\n"+
+             "  return membership\\n"
+             )
+    
+    elif field == "S1_gndv":
+      threshold = get_thresholds(bioregion, stage, landcover, field, unit)
+      imp = threshold[0]
+      veg = threshold[1]
+      return ("def landcover(x):\\n"+
+             "  membership = \"\"\\n"+
+             "  if "+imp+":\\n"+
+             "    membership += \"I\"\\n"+
+             "  if "+veg+":\\n"+
+             "    membership += \"V\"\\n"+
+             "  return membership\\n"
+             )
 
-    #-----------------------------------------------
-    #-----------------------------------------------
-    # Fuzzy rule classifier
-    #
-    #Primitive types = [vegetation, impervious, water, confusion]
-    #Land cover types = [tree, shrub, grass, pavement, building, water]
-    #
-    # Stages:
-    #   1. Classify object based on majority primitive type
-    #   2. Classify each primitive object based on IE and height
-  if create_obia == "Yes":
-    obia()
-  #-----------------------------------------------
-  #-----------------------------------------------
+    elif field == "S1_osav":
+      threshold = get_thresholds(bioregion, stage, landcover, field, unit)
+      imp = threshold[0]
+      veg = threshold[1]
+      return ("def landcover(x):\\n"+
+             "  membership = \"\"\\n"+
+             "  if "+imp+":\\n"+
+             "    membership += \"I\"\\n"+
+             "  if "+veg+":\\n"+
+             "    membership += \"V\"\\n"+
+             "  return membership\\n"
+             )
+    
+    elif field == "S1":
+      return("def landcover(a,b,c,d):\\n"+
+             "  membership = a+b+c+d\\n"+
+             "  V,I = 0,0\\n"+
+             "  for m in membership:\\n"+
+             "    if m == \"V\":\\n"+
+             "      V += 1\\n"+
+             "    if m == \"I\":\\n"+
+             "      I += 1\\n"+                  
+             "  if V > I:\\n"+
+             "    return \"vegetation\"\\n"+
+             "  elif I > V:\\n"+
+             "    return \"impervious\"\\n"+
+             "  else:\\n"+
+             "    return \"confusion\"\\n"
+             )
 
-  #-----------------------------------------------
-  #-----------------------------------------------
-  def classify(stage, landcover, field):
-    if stage == "S1":
-      if field == "S1_grid":
+  elif stage == "S2":
+    if landcover == "vegetation":
+      if field == "S2_grid":
         threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-        healthy = threshold[0]
-        dry = threshold[1]
+        dry = threshold[0]
+        healthy = threshold[1]
         return("def landcover(x):\\n"+
-               "  if x "+healthy+":\\n"+
+               "  if x "+dry+":\\n"+
+               "    return \"dry\"\\n"+
+               "  elif x "+healthy+":\\n"+
                "    return \"healthy\"\\n"+
-               "  elif x "+dry+":\\n"+
-               "    return \"senescent\"\\n"+
-               "  return \"impervious\""
+               "  else:\\n"+
+               "    return \"confusion\""
                )
-    
-      elif field == "S1_ndvi":
+              
+      elif field == "S2_heig":
+        
         threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-        imp = threshold[0]
-        veg = threshold[1]
-        return ("def landcover(x):\\n"+
-               "  membership = \"\"\\n"+
-               "  if "+imp+":\\n"+
-               "    membership += \"I\"\\n"+
-               "  if "+veg+":\\n"+
-               "    membership += \"V\"\\n"+
-               "  return membership\\n"
+        grass = threshold[0]
+        shrub = threshold[1]
+        tree = threshold[2]
+        return("def landcover(x):\\n"+
+               "  if "+grass+":\\n"+
+               "    return \"grass\"\\n"+
+               "  elif "+shrub+":\\n"+
+               "    return \"shrub\"\\n"+
+               "  elif "+tree+":\\n"+
+               "    return \"tree\""
                )
-
-      elif field == "S1_ndwi":
-        threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-        imp = threshold[0]
-        veg = threshold[1]
-        return ("def landcover(x):\\n"+
-               "  membership = \"\"\\n"+
-               "  if "+imp+":\\n"+
-               "    membership += \"I\"\\n"+
-               "  if "+veg+":\\n"+
-               "    membership += \"V\"\\n"+
-               "  return membership\\n"
+    
+      elif field == "S2":
+        return("def landcover(x):\\n"+
+               "  return x\\n"
                )
-      
-      elif field == "S1_gndv":
+
+    elif landcover == "impervious":
+      if field == "S2_heig":
         threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-        imp = threshold[0]
-        veg = threshold[1]
-        return ("def landcover(x):\\n"+
-               "  membership = \"\"\\n"+
-               "  if "+imp+":\\n"+
-               "    membership += \"I\"\\n"+
-               "  if "+veg+":\\n"+
-               "    membership += \"V\"\\n"+
-               "  return membership\\n"
+        path = threshold[0]
+        building = threshold[1]
+        return("def landcover(x):\\n"+
+               "  if "+path+":\\n"+
+               "    return \"path\"\\n"+
+               "  elif "+building+":\\n"+
+               "    return \"building\""
                )
 
-      elif field == "S1_osav":
-        threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-        imp = threshold[0]
-        veg = threshold[1]
+      elif field == "S2":
         return ("def landcover(x):\\n"+
-               "  membership = \"\"\\n"+
-               "  if "+imp+":\\n"+
-               "    membership += \"I\"\\n"+
-               "  if "+veg+":\\n"+
-               "    membership += \"V\"\\n"+
-               "  return membership\\n"
-               )
-      
-      elif field == "S1":
-        return("def landcover(a,b,c,d):\\n"+
-               "  membership = a+b+c+d\\n"+
-               "  V,I = 0,0\\n"+
-               "  for m in membership:\\n"+
-               "    if m == \"V\":\\n"+
-               "      V += 1\\n"+
-               "    if m == \"I\":\\n"+
-               "      I += 1\\n"+                  
-               "  if V > I:\\n"+
-               "    return \"vegetation\"\\n"+
-               "  elif I > V:\\n"+
-               "    return \"impervious\"\\n"+
-               "  else:\\n"+
-               "    return \"confusion\"\\n"
-               )
+                "  return x\\n"
+                )
 
-    elif stage == "S2":
-      if landcover == "vegetation":
-        if field == "S2_grid":
-          threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-          dry = threshold[0]
-          healthy = threshold[1]
-          return("def landcover(x):\\n"+
-                 "  if x "+dry+":\\n"+
-                 "    return \"dry\"\\n"+
-                 "  elif x "+healthy+":\\n"+
-                 "    return \"healthy\"\\n"+
-                 "  else:\\n"+
-                 "    return \"confusion\""
-                 )
-                
-        elif field == "S2_heig":
-          
-          threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-          grass = threshold[0]
-          shrub = threshold[1]
-          tree = threshold[2]
-          return("def landcover(x):\\n"+
-                 "  if "+grass+":\\n"+
-                 "    return \"grass\"\\n"+
-                 "  elif "+shrub+":\\n"+
-                 "    return \"shrub\"\\n"+
-                 "  elif "+tree+":\\n"+
-                 "    return \"tree\""
-                 )
-      
-        elif field == "S2":
-          return("def landcover(x):\\n"+
-                 "  return x\\n"
-                 )
+# Assigns classess
+def createClassMembership(stage, landcover, field, field_lst, output, bioregion, unit):
+  if field in class_stages:
+    field_lst = field_lst[:-2]
+    fxn = "landcover("+field_lst+")"
 
-      elif landcover == "impervious":
-        if field == "S2_heig":
-          threshold = get_thresholds(bioregion, stage, landcover, field, unit)
-          path = threshold[0]
-          building = threshold[1]
-          return("def landcover(x):\\n"+
-                 "  if "+path+":\\n"+
-                 "    return \"path\"\\n"+
-                 "  elif "+building+":\\n"+
-                 "    return \"building\""
-                 )
+  else:
+    index = field
+    field = stage+"_"+field[:4]
+    field_lst += "!"+field+"!, "
+    fxn = "landcover(!"+index+"!)"
+      
+  label_class = classify(stage, landcover, field, bioregion, unit)
+  arcpy.AddField_management(output, field, "TEXT")
+  arcpy.CalculateField_management(output, field, fxn, "PYTHON_9.3", label_class)
+  return field_lst
+
+def classify_objects(zone_num, sms_fc, outputs, scratchgdb, bioregion, unit):
+  # Two stage fuzzy classification of one zone's objects. Returns the
+  # confused objects.
+  lst_merge = []
+  veg_lst = []
+  imp_lst = []
+  for stage in class_stages:
+    text = "Executing Stage "+str(stage)+" classification."
+    newProcess(text)
 
-        elif field == "S2":
-          return ("def landcover(x):\\n"+
-                  "  return x\\n"
-                  )
-
-  # Assigns classess
-  def createClassMembership(stage, landcover, field, field_lst, output):
-    if field in stages:
-      field_lst = field_lst[:-2]
-      fxn = "landcover("+field_lst+")"
-
-    else:
-      index = field
-      field = stage+"_"+field[:4]
-      field_lst += "!"+field+"!, "
-      fxn = "landcover(!"+index+"!)"
-        
-    label_class = classify(stage, landcover, field)
-    arcpy.AddField_management(output, field, "TEXT")
-    arcpy.CalculateField_management(output, field, fxn, "PYTHON_9.3", label_class)
-    return field_lst
-  #-----------------------------------------------
-  #-----------------------------------------------
+    # Stage 1 classification workflow
+    if stage == "S1":
+      field_lst = ""
+      for field in s1_indices + [stage]:
 
-  #-----------------------------------------------
-  #-----------------------------------------------
-  # Classifier methods
-  stages = ["S1","S2"]
-  class_structure = [
-                     ["vegetation",
-                          ["grass", "shrub", "tree"]],
-                     ["impervious",
-                          ["building", "path"]]
-                    ]
-
-  # Indices used for each stage of classification
-  s1_indices = ["ndvi", "ndwi", "gndvi", "osavi"]#, "gridcode"]
-  s2_indices = ["height"]#, "gridcode"]
-
-  def classify_objects():
-    lst_merge = []
-    veg_lst = []
-    imp_lst = []
-    for stage in stages:
-      text = "Executing Stage "+str(stage)+" classification."
-      newProcess(text)
-
-      # Stage 1 classification workflow
-      if stage == "S1":
-        s1_indices.extend([stage])
+        # Assign full membership
+        if field == "S1":
+          text = "Creating primitive-type objects."
+          generateMessage(text)
+          
+          # Classification method
+          createClassMembership(stage, "", field, field_lst, sms_fc, bioregion, unit)
+
+          # Create new shapefiles with primitive classess
+          for primitive in class_structure:
+              output = os.path.join(outputs, primitive[0]+"_"+str(zone_num)+".shp")
+              where_clause = field + " = '" + primitive[0] + "'"
+              arcpy.Select_analysis(sms_fc, output, where_clause)
+              # if primitive == "vegetation":
+              #   veg_lst.append(output)
+              # else:
+              #   imp_lst.append(output)
+              
+        # Assign partial membership     
+        else:
+          text = "Classifying objects by "+field+"."
+          generateMessage(text)
+          field_lst = createClassMembership(stage, "", field, field_lst, sms_fc, bioregion, unit)
+
+    # Stage 2 classification workflow
+    if stage == "S2":
+      merge_lst = []
+      for primitive in class_structure:
+        stage_output = os.path.join(outputs, primitive[0]+"_"+str(zone_num)+".shp")
+        landcover = primitive[0]
         field_lst = ""
-        for field in s1_indices:
 
-          # Assign full membership
-          if field == "S1":
-            text = "Creating primitive-type objects."
+        for field in s2_indices + [stage]:
+          
+          # Assign final membership
+          if field == "S2":
+            text = "Creating "+primitive[0]+"-class objects."
             generateMessage(text)
-            
-            # Classification method
-            createClassMembership(stage, "", field, field_lst, sms_fc)
-
-            # Create new shapefiles with primitive classess
-            for primitive in class_structure:
-                output = os.path.join(outputs, primitive[0]+"_"+str(zone_num)+".shp")
-                where_clause = field + " = '" + primitive[0] + "'"
-                arcpy.Select_analysis(sms_fc, output, where_clause)
-                # if primitive == "vegetation":
-                #   veg_lst.append(output)
-                # else:
-                #   imp_lst.append(output)
-                
-          # Assign partial membership     
+
+            #Classification method
+            createClassMembership(stage, landcover, field, field_lst, stage_output, bioregion, unit)
+          
+          # Assign partial memberships    
           else:
-            text = "Classifying objects by "+field+"."
+            text = "Classifying "+primitive[0]+" objects by "+field+"."
             generateMessage(text)
-            field_lst = createClassMembership(stage, "", field, field_lst, sms_fc)
-
-      # Stage 2 classification workflow
-      if stage == "S2":
-        s2_indices.extend([stage])
-        merge_lst = []
-        for primitive in class_structure:
-          stage_output = os.path.join(outputs, primitive[0]+"_"+str(zone_num)+".shp")
-          landcover = primitive[0]
-          field_lst = ""
-
-          for field in s2_indices:
-            
-            # Assign final membership
-            if field == "S2":
-              text = "Creating "+primitive[0]+"-class objects."
-              generateMessage(text)
-
-              #Classification method
-              createClassMembership(stage, landcover, field, field_lst, stage_output)
-            
-            # Assign partial memberships    
-            else:
-              text = "Classifying "+primitive[0]+" objects by "+field+"."
-              generateMessage(text)
-              field_lst = createClassMembership(stage, landcover, field, field_lst, stage_output)
-      # Variables
-    confused = os.path.join(outputs, "confused.shp")
-    merged = os.path.join(scratchgdb, "merged_imp_veg")
-    vegetation = os.path.join(outputs, "vegetation_0.shp")
-    impervious = os.path.join(outputs, "impervious_0.shp")
-
-    # Code note: make sure veg_lst is merged
-    arcpy.Merge_management([vegetation, impervious], merged) 
+            field_lst = createClassMembership(stage, landcover, field, field_lst, stage_output, bioregion, unit)
+    # Variables
+  confused = os.path.join(outputs, "confused.shp")
+  merged = os.path.join(scratchgdb, "merged_imp_veg")
+  vegetation = os.path.join(outputs, "vegetation_0.shp")
+  impervious = os.path.join(outputs, "impervious_0.shp")
 
-    # Create dataset with only confused objects                     
-    arcpy.Erase_analysis (sms_fc, merged, confused)
-    arcpy.AddField_management(confused, "S2", "TEXT")
+  # Code note: make sure veg_lst is merged
+  arcpy.Merge_management([vegetation, impervious], merged) 
 
-  if classify_landscape == "Yes":
-    classify_objects()
-  # iterate through next zone if possible
-  zones = searchcursor.next()
-  #-----------------------------------------------
-  #-----------------------------------------------
+  # Create dataset with only confused objects                     
+  arcpy.Erase_analysis (sms_fc, merged, confused)
+  arcpy.AddField_management(confused, "S2", "TEXT")
+  return confused
+#-----------------------------------------------
+#-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def SVM():
+def SVM(naip, scaled_heights, classified, outputs, scratchws, scratchgdb, projection):
   text = "Running SVM."
   newProcess(text)
 
@@ -892,9 +931,8 @@ def SVM():
   # Creating Layer composite
   text = "Creating LiDAR-Multispectral stack."
   generateMessage(text)
-  bands_5m = createImageEnhancements(band_lst, naip, scaled_heights, "5m", scratchgdb)
-  arcpy.CompositeBands_management(bands_5m, composite)
-  arcpy.DefineProjection_management(composite, projection)
+  svm_source = enhancementSource(sharedSite(naip, scaled_heights, scratchws), naip, scaled_heights)
+  enhancementComposite(svm_source, band_lst, composite, projection)
   #-----------------------------------------------
   #-----------------------------------------------
 
@@ -1016,14 +1054,13 @@ def SVM():
 
   # Merging all layers back together as classified layer
   arcpy.Merge_management([confused, vegetation, impervious], classified)
-if run_svm ==  "Yes":
-  SVM()
+  return classified
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def fuels():
+def fuels(classified, model):
 
   text = "Assigning fuel models."
   newProcess(text)
@@ -1091,15 +1128,14 @@ def fuels():
   #-----------------------------------------------
   text = "Fuel complex created."
   generateMessage(text)
-if classify_fuels == "Yes":
-  fuels()
+  return classified
 
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def LCP():
+def LCP(classified, scaled_dem, naip, outputs, scratchws, scratchgdb, dll_path, landscape_file, projection):
   text = "Creating Landscape File."
   newProcess(text)
 
@@ -1126,11 +1162,9 @@ def LCP():
         arcpy.PolygonToRaster_conversion(temp, layer, temp_raster, "CELL_CENTER", "", scaled_dem)
       elif layer in elevation_lst:
 
-        # Calculating elevation derived layers
-        if layer == "slope":
-          arcpy.Slope_3d(scaled_dem, temp_raster, "DEGREE")
-        elif layer == "aspect":
-          arcpy.Aspect_3d(scaled_dem, temp_raster)
+        # Calculating elevation derived layers (cached per DEM in scratch)
+        if layer in ["slope", "aspect"]:
+          saveTerrain(scaled_dem, layer, temp_raster, scratchws, projection)
         elif layer == "elevation":
           temp_raster = scaled_dem
 
@@ -1160,12 +1194,7 @@ def LCP():
   text = "Creating LCP file."
   generateMessage(text)
 
-  import ctypes
-  ##
-  ### Variables
-  landscape_file = os.path.join(outputs, "landscape.lcp")
-  genlcp = os.path.join(dll_path, "GenLCPv2.dll")
-  Res = landscape_file
+  # Variables
   Elev = os.path.join(outputs,"elevation.asc")
   Slope = os.path.join(outputs,"slope.asc")
   Aspect = os.path.join(outputs,"aspect.asc")
@@ -1173,135 +1202,82 @@ def LCP():
   Canopy = os.path.join(outputs,"canopy.asc")
 
   # Create LCP
-  dll = ctypes.cdll.LoadLibrary(genlcp)
-  fm = getattr(dll, "?Gen@@YAHPBD000000@Z")
-  fm.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p]
-  fm.restype = ctypes.c_int
-
-  e = fm(Res, Elev, Slope, Aspect, Fuel, Canopy, "")
+  e = genLCP(dll_path, landscape_file, Elev, Slope, Aspect, Fuel, Canopy)
   if e > 0:
     arcpy.AddError("Error {0}".format(e))
-if create_LCP == "Yes":
-  LCP()
+  return landscape_file
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def burn():
+def burn(dll_path, landscape_file, fuel_moisture, outputs):
   text = "Running FlamMap."
   newProcess(text)
 
   # Burn in FlamMap
-  #
-  flamMap = os.path.join(dll_path, "FlamMapF.dll")
-  dll = ctypes.cdll.LoadLibrary(flamMap)
-  fm = getattr(dll, "?Run@@YAHPBD000NN000HHN@Z")
-  fm.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_double, ctypes.c_double, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_double]
-  fm.restype = ctypes.c_int
-
-  Landscape = landscape_file
-  FuelMoist = fuel_moisture
   OutputFile = os.path.join(outputs, "Burn")
-  FuelModel = "-1"
   Windspeed = 30.0  # mph
   WindDir = 0.0   # Direction angle in degrees
-  Weather = "-1"
-  WindFileName = "-1"
-  DateFileName = "-1"
-  FoliarMoist = 100 # 50%
-  CalcMeth = 0    # 0 = Finney 1998, 1 = Scott & Reinhardt 2001
-  Res = -1.0
-
-  e = fm(Landscape, FuelMoist, OutputFile, FuelModel, Windspeed, WindDir, Weather, WindFileName, DateFileName, FoliarMoist, CalcMeth, Res)
+
+  e = runFlamMap(dll_path, landscape_file, fuel_moisture, OutputFile, Windspeed, WindDir)
   if e > 0:
     arcpy.AddError("Problem with parameter {0}".format(e))
 
-  burn_metrics = ["m_fli", "m_fml", "m_ros"]
-
-  for root, dirs, fm_outputs in os.walk(outputs): #Check to confirm outputs are saved here
-     for burn in fm_outputs:
-        if burn[-3:].lower() in burn_metrics:
-            metric = burn[-3:].lower()
-            burn_ascii = os.path.join(outputs, metric+".asc")
-            os.rename(os.path.join(outputs, burn), burn_ascii)
-
+  # Rename outputs to m_fli.asc, m_fml.asc, m_ros.asc
+  burns = collectBurns(OutputFile, "m_")
 
   text = "Burn complete."
   generateMessage(text)
-if run_FlamMap == "Yes":
-  burn()
+  return burns
 #-----------------------------------------------
 #-----------------------------------------------
-def burn_obia():
+def burn_obia(naip, outputs, scratchgdb):
   text = "Running OBIA on fire behavior metrics."
   newProcess(text)
-  # Set Cell Size
+  # Align object raster to NAIP
   arcpy.env.snapRaster = naip
-  cell_size = str(arcpy.GetRasterProperties_management(naip, "CELLSIZEX", ""))
-  naip_cell_size = cell_size +" " +cell_size
+  burn_metrics = ["m_fli", "m_fml", "m_ros"]
+  unit_scalars = [1, 1, 1]  # fli: 0.288894658, ros: 3.28084
   #-----------------------------------------------
   #-----------------------------------------------
 
-  for metric in burn_metrics:
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Rasterizing objects to the NAIP grid."
+  generateMessage(text)
 
-    #-----------------------------------------------
-    #-----------------------------------------------
-    text = "Calculating and joining max " + metric + " to each object."
-    generateMessage(text)
-    #-----------------------------------------------
-    #Set variables
-    in_ascii_file = os.path.join(outputs, metric + ".asc")
-    burn = os.path.join(scratchgdb, metric)
-    raw_raster = os.path.join(scratchgdb, metric  + "_raw")
-    scaled_raster = os.path.join(outputs, metric +"_scaled.tif")
-    raster_resample = os.path.join(outputs, metric + "_res.tif")
-    #shift = os.path.join(outputs, metric+".tif")
-    outTable = os.path.join(scratchgdb, "zonal_"+metric)
-    
-    #-----------------------------------------------
-    #-----------------------------------------------
-    # Convert ascii output to raster and align cells
-    arcpy.ASCIIToRaster_conversion(in_ascii_file, raw_raster, "FLOAT")
-    arcpy.DefineProjection_management(raw_raster, projection)
-    ["fli", "fml", "ros"]
-    if metric == "m_fli":
-      unit_scalar = 1#0.288894658
-    elif metric == "m_fml":
-      unit_scalar = 1
-    elif metric == "m_ros":
-      unit_scalar = 1#3.28084
-      
-    this = Raster(raw_raster)*unit_scalar
-    this.save(scaled_raster)
-    arcpy.Resample_management(scaled_raster, burn, naip_cell_size, "NEAREST")
+  # Variables
+  mitigated = os.path.join(outputs, "mitigated.shp")
+  classified = mitigated
+  object_raster = os.path.join(scratchgdb, "burn_objects")
 
-    #-----------------------------------------------
-    #-----------------------------------------------
-    
-    #-----------------------------------------------
-    #-----------------------------------------------
-    # Calculate zonal max and join to each object
-    mitigated = os.path.join(outputs, "mitigated.shp")
-    classified = mitigated
-    arcpy.CalculateField_management(classified, "JOIN", "[FID]+1")
-    z_table = ZonalStatisticsAsTable(classified, "JOIN", burn, outTable, "NODATA", "MAXIMUM")
-    arcpy.AddField_management(outTable, metric, "FLOAT")
-    arcpy.CalculateField_management(outTable, metric, "[MAX]")
-    one_to_one_join(classified, outTable, metric, "FLOAT")
-    #-----------------------------------------------
-    #-----------------------------------------------
+  arcpy.CalculateField_management(classified, "JOIN", "[FID]+1")
+  arcpy.PolygonToRaster_conversion(classified, "JOIN", object_raster, "CELL_CENTER", "", naip)
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Calculating and joining max " + ", ".join(burn_metrics) + " to each object."
+  generateMessage(text)
+
+  # Burn grids are aligned to the objects in memory; no intermediate rasters
+  burn_asciis = [os.path.join(outputs, metric + ".asc") for metric in burn_metrics]
+  joinBurnMetrics(classified, object_raster, burn_asciis, burn_metrics, unit_scalars)
+  #-----------------------------------------------
+  #-----------------------------------------------
 
   #-----------------------------------------------
   #-----------------------------------------------
   text = "All burn severity joins are complete."
   generateMessage(text)
-if join_burns == "Yes":
-  burn_obia()
+  return classified
 #-----------------------------------------------
 #-----------------------------------------------
 
-def MXD():
+def MXD(current_project, location_name, classified, pipeline, dem, scaled_dem, heights, scaled_heights,
+        raw_naip, naip):
 
   mxd_file = os.path.join(current_project, location_name+".mxd")
   
@@ -1342,10 +1318,73 @@ def MXD():
 
   #for layer in layers:
   #  arcpy.mapping.AddLayer(df, layer)
+  return mxd_file
+
+#-----------------------------------------------
 
-if create_MXD == "Yes":
-  MXD()
 #-----------------------------------------------
-text = "All processes are complete."
-generateMessage(text)
+#-----------------------------------------------
+def pipelineStages(project, settings):
+  # Stages in run order: (name, function, settings that switch it on, inputs,
+  # outputs) for the project paths (see projectPaths) and settings. Each
+  # function takes no arguments and returns the stage outputs; runPipeline.py
+  # drives the same table from a config file.
+  p = project
+  projection, unit, scale_height, scale_naip = projectionInfo(settings["projection"])
+  vegetation = os.path.join(p["outputs"], "vegetation_0.shp")
+  impervious = os.path.join(p["outputs"], "impervious_0.shp")
+  confused = os.path.join(p["outputs"], "confused.shp")
+  mitigated = os.path.join(p["outputs"], "mitigated.shp")
+  burns = [os.path.join(p["outputs"], "m_" + metric + ".asc") for metric in ["fli", "fml", "ros"]]
+  mxd_file = os.path.join(p["current_project"], settings["location_name"]+".mxd")
+  return [
+    ("align",
+     lambda: align(p["raw_naip"], p["raw_heights"], p["raw_dem"], p["pipeline"], p["bnd_zones"], p["naip"],
+                   p["heights"], p["scaled_heights"], p["dem"], p["scaled_dem"], p["outputs"], p["scratchgdb"],
+                   settings["coarsening_size"], settings["pipe_analysis"], settings["buff_distance"],
+                   projection, unit, scale_height, scale_naip),
+     ["align_inputs"], [p["raw_naip"], p["raw_heights"], p["raw_dem"]],
+     [p["naip"], p["scaled_heights"], p["scaled_dem"], p["bnd_zones"]]),
+    ("zones",
+     lambda: zones(p["bnd_zones"], p["naip"], p["scaled_heights"], p["outputs"], p["scratchws"], p["scratchgdb"],
+                   settings["create_obia"], settings["classify_landscape"], settings["bioregion"], projection, unit),
+     ["create_obia", "classify_landscape"], [p["naip"], p["scaled_heights"], p["bnd_zones"]],
+     [vegetation, impervious, confused]),
+    ("SVM",
+     lambda: SVM(p["naip"], p["scaled_heights"], p["classified"], p["outputs"], p["scratchws"], p["scratchgdb"],
+                 projection),
+     ["run_svm"], [p["naip"], p["scaled_heights"], confused], [p["classified"]]),
+    ("fuels",
+     lambda: fuels(p["classified"], settings["model"]),
+     ["classify_fuels"], [p["classified"]], [p["classified"]]),
+    ("LCP",
+     lambda: LCP(p["classified"], p["scaled_dem"], p["naip"], p["outputs"], p["scratchws"], p["scratchgdb"],
+                 p["dll_path"], p["landscape_file"], projection),
+     ["create_LCP"], [p["classified"], p["scaled_dem"]], [p["landscape_file"]]),
+    ("burn",
+     lambda: burn(p["dll_path"], p["landscape_file"], p["fuel_moisture"], p["outputs"]),
+     ["run_FlamMap"], [p["landscape_file"], p["fuel_moisture"]], burns),
+    ("burn_obia",
+     lambda: burn_obia(p["naip"], p["outputs"], p["scratchgdb"]),
+     ["join_burns"], [mitigated] + burns, [mitigated]),
+    ("MXD",
+     lambda: MXD(p["current_project"], settings["location_name"], p["classified"], p["pipeline"], p["dem"],
+                 p["scaled_dem"], p["heights"], p["scaled_heights"], p["raw_naip"], p["naip"]),
+     ["create_MXD"], [p["classified"]], [mxd_file])
+  ]
+
+def run(settings=None, names=None):
+  # Sets up the project and runs the named stages, or every stage switched on
+  # in settings (the settings above by default)
+  if settings is None:
+    settings = pipelineSettings()
+  project = startProject(settings)
+  for name, function, switches, stage_inputs, stage_outputs in pipelineStages(project, settings):
+    if (names is None and "Yes" in [settings[switch] for switch in switches]) or (names is not None and name in names):
+      function()
+  text = "All processes are complete."
+  generateMessage(text)
+
+if __name__ == "__main__":
+  run()
 #-----------------------------------------------
\ No newline at end of file
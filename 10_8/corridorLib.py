@@ -0,0 +1,108 @@
+#-------------------------------------------------------------------------------
+# Name:        corridorLib Tool
+# Purpose:     Builds the buffer around an asset (pipeline, transmission line)
+#              directly on the target grid. Asset lines are rasterized and the
+#              buffer is a Euclidean distance threshold from the line cells, so
+#              no vector buffer of the whole line is ever created. The same
+#              mask is applied to every band with one array multiply.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import arcpy
+import numpy as np
+
+try:
+  from scipy.ndimage import distance_transform_edt
+except ImportError:
+  distance_transform_edt = None
+
+# Map units per linear unit
+unit_lengths = {
+  "Meters": {"meter": 1.0, "meters": 1.0, "foot": 0.3048, "feet": 0.3048, "mile": 1609.344, "miles": 1609.344},
+  "Feet": {"meter": 3.28084, "meters": 3.28084, "foot": 1.0, "feet": 1.0, "mile": 5280.0, "miles": 5280.0}
+}
+
+
+def parseDistance(buff_distance, unit):
+  # "30 FEET" -> distance in the projection unit ("Meters" or "Feet")
+  parts = str(buff_distance).split()
+  value = float(parts[0])
+  if len(parts) == 1:
+    return value
+  if unit not in unit_lengths:
+    raise ValueError("Unknown projection unit {0} (expected {1})".format(unit, " or ".join(sorted(unit_lengths))))
+  lengths = unit_lengths[unit]
+  if parts[1].lower() not in lengths:
+    raise ValueError("Unknown distance unit in {0} (expected {1})".format(buff_distance, ", ".join(sorted(lengths))))
+  return value * lengths[parts[1].lower()]
+
+def assetLines(asset):
+  # Vertex arrays (x, y) for every part of every line in the feature class
+  lines = []
+  with arcpy.da.SearchCursor(asset, ["SHAPE@"]) as cursor:
+    for row in cursor:
+      if row[0] is None:
+        continue
+      for part in row[0]:
+        vertices = [(p.X, p.Y) for p in part if p is not None]
+        if len(vertices) > 1:
+          lines.append(np.array(vertices, dtype="float64"))
+  return lines
+
+def rasterizeLines(lines, info):
+  # Cells of the grid crossed by the lines. Segments are sampled at half a
+  # cell so no crossed cell is skipped; parts outside the grid are dropped
+  # (this replaces clipping the asset to the study area).
+  mask = np.zeros((info["rows"], info["cols"]), dtype=bool)
+  step = min(info["cell_width"], info["cell_height"]) / 2.0
+  for line in lines:
+    for (x0, y0), (x1, y1) in zip(line[:-1], line[1:]):
+      samples = int(np.ceil(np.hypot(x1 - x0, y1 - y0) / step)) + 1
+      x = np.linspace(x0, x1, samples)
+      y = np.linspace(y0, y1, samples)
+      cols = np.floor((x - info["x_min"]) / info["cell_width"]).astype("int64")
+      rows = np.floor((info["y_max"] - y) / info["cell_height"]).astype("int64")
+      inside = (rows >= 0) & (rows < info["rows"]) & (cols >= 0) & (cols < info["cols"])
+      mask[rows[inside], cols[inside]] = True
+  return mask
+
+def corridorMask(line_mask, distance, info):
+  # Cells whose centre is within distance of a line cell centre
+  if not line_mask.any():
+    return line_mask.copy()
+  cell_width, cell_height = info["cell_width"], info["cell_height"]
+  if distance_transform_edt is not None:
+    return distance_transform_edt(~line_mask, sampling=(cell_height, cell_width)) <= distance
+
+  # Without scipy: sweep the disc of offsets over the line cells only, so the
+  # cost scales with corridor length, not site size
+  reach_rows = int(distance // cell_height)
+  reach_cols = int(distance // cell_width)
+  rows, cols = np.nonzero(line_mask)
+  mask = line_mask.copy()
+  for dr in range(-reach_rows, reach_rows + 1):
+    for dc in range(-reach_cols, reach_cols + 1):
+      if (dr * cell_height) ** 2 + (dc * cell_width) ** 2 > distance ** 2:
+        continue
+      r, c = rows + dr, cols + dc
+      inside = (r >= 0) & (r < mask.shape[0]) & (c >= 0) & (c < mask.shape[1])
+      mask[r[inside], c[inside]] = True
+  return mask
+
+def assetCorridor(asset, info, buff_distance, unit):
+  # Buffer mask of the asset on the grid described by info
+  line_mask = rasterizeLines(assetLines(asset), info)
+  return corridorMask(line_mask, parseDistance(buff_distance, unit), info)
+
+def applyCorridor(bands, mask):
+  # Zeroes every band outside the corridor in one multiply (bands: [band, row, col]
+  # or [row, col]). NaN cells inside the corridor also become 0, as Con(IsNull()) did.
+  bands = np.nan_to_num(np.asarray(bands))
+  return bands * mask
@@ -21,13 +21,136 @@
 import arcpy
 import os
 import sys
+import numpy as np
 from arcpy import env
 from arcpy.sa import *
+from collections import OrderedDict
+from rasterArrays import windowInfo, windowSlices, blockWindows, alignToGrid, writeIntermediate
+
+# Index expressions over the NAIP bands (b1-b4) and heights. Each is
+# (function, inputs); osavi is normalized over the masked cells of each
+# output window like normalize().
+index_expressions = {
+  "ndvi": ("normalizedDifference", ["b4", "b1"]),
+  "ndwi": ("normalizedDifference", ["b2", "b4"]),
+  "gndvi": ("normalizedDifference", ["b4", "b2"]),
+  "osavi": ("soilAdjusted", ["b4", "b1"]),
+  "height": ("identity", ["height"])
+}
+# {(naip, heights): lazy source}, shared by every caller in the run
+enhancement_sources = {}
+max_blocks = 256  # evaluated index blocks kept per source
 
 
 def normalize(index):
     return (2 * (Float(index) - Float(index.minimum)) / (Float(index.maximum) - Float(index.minimum))) - 1
 
+def normalizedDifference(a, b):
+  with np.errstate(divide="ignore", invalid="ignore"):
+    return (a - b) / (a + b)
+
+def soilAdjusted(nir, red):
+  return 1.5 * (nir - red) / (nir + red + 0.16)
+
+def identity(a):
+  return a
+
+def enhancementSource(shared, naip, heights):
+  # Lazy index source on the NAIP grid for a NAIP/heights pair staged by
+  # zoneLib.shareRasters. Memoized, so every caller (zones, SVM) shares the
+  # evaluated blocks; only the last max_blocks index blocks are kept.
+  key = (naip, heights)
+  if key not in enhancement_sources:
+    info = dict(shared[naip])
+    del info["array"]
+    heights_info = dict(shared[heights])
+    del heights_info["array"]
+    enhancement_sources[key] = {
+      "bands": shared[naip]["array"],
+      "heights": shared[heights]["array"],
+      "info": info,
+      "heights_info": heights_info,
+      "blocks": OrderedDict()
+    }
+  return enhancement_sources[key]
+
+def blockInput(source, argument, rows, cols):
+  # One input (b1-b4 or height) of the [rows, cols] NAIP block. Heights are
+  # on their own grid and are looked up at the block's cell centres.
+  if argument == "height":
+    block_info = windowInfo(source["info"], rows, cols)
+    return alignToGrid(source["heights"], source["heights_info"], block_info)
+  return np.asarray(source["bands"][int(argument[1]) - 1, rows, cols], dtype="float32")
+
+def blockValues(source, names, rows, cols):
+  # {name: index array} of one [rows, cols] block. Blocks already evaluated
+  # are reused; the inputs of a block are read once for all the indices it
+  # still needs.
+  cache = source["blocks"]
+  values = {}
+  inputs = {}
+  for name in names:
+    key = (name, rows.start, cols.start)
+    if key in cache:
+      cache[key] = cache.pop(key)
+      values[name] = cache[key]
+      continue
+    function, arguments = index_expressions[name]
+    for argument in arguments:
+      if argument not in inputs:
+        inputs[argument] = blockInput(source, argument, rows, cols)
+    values[name] = cache[key] = globals()[function](*[inputs[a] for a in arguments])
+    if len(cache) > max_blocks:
+      cache.popitem(last=False)
+  return values
+
+def enhancementWindow(source, names, rows=None, cols=None, mask=None):
+  # {name: index array} of the [rows, cols] window (whole grid when None),
+  # assembled from its blocks. Cells outside mask are NaN, and osavi is
+  # normalized over the cells inside it.
+  rows = rows if rows is not None else slice(0, source["info"]["rows"])
+  cols = cols if cols is not None else slice(0, source["info"]["cols"])
+  windows = dict((name, np.full((rows.stop - rows.start, cols.stop - cols.start), np.nan, dtype="float32"))
+                 for name in names)
+  for block_rows, block_cols in blockWindows(source["info"]):
+    r0, r1 = max(rows.start, block_rows.start), min(rows.stop, block_rows.stop)
+    c0, c1 = max(cols.start, block_cols.start), min(cols.stop, block_cols.stop)
+    if r0 >= r1 or c0 >= c1:
+      continue
+    values = blockValues(source, names, block_rows, block_cols)
+    for name in names:
+      windows[name][r0 - rows.start:r1 - rows.start, c0 - cols.start:c1 - cols.start] = \
+        values[name][r0 - block_rows.start:r1 - block_rows.start, c0 - block_cols.start:c1 - block_cols.start]
+  for name in names:
+    if mask is not None:
+      windows[name][~mask] = np.nan
+    if name == "osavi":
+      low, high = np.nanmin(windows[name]), np.nanmax(windows[name])
+      windows[name] = 2 * (windows[name] - low) / (high - low) - 1
+  return windows
+
+def writeEnhancements(source, image_enhancements, ID, scratchgdb, window=None, mask=None, projection=None):
+  # Writes the indices of a window of the source (NAIP) grid, with cells
+  # outside mask as NoData, as <index>_<ID> rasters like
+  # createImageEnhancements. Returns the paths.
+  if window is None:
+    window = source["info"]
+  rows, cols = windowSlices(source["info"], window)
+  windows = enhancementWindow(source, image_enhancements, rows, cols, mask)
+  created_enhancements = []
+  for field in image_enhancements:
+    name = "heights" if field == "height" else field
+    created_enhancements.append(writeIntermediate(windows[field], window, os.path.join(scratchgdb, name+"_"+str(ID)),
+                                                  projection=projection, overviews=False))
+  return created_enhancements
+
+def enhancementComposite(source, image_enhancements, output, projection=None):
+  # One multiband raster of the indices over the whole grid, written directly
+  # instead of through per-index rasters and CompositeBands
+  windows = enhancementWindow(source, image_enhancements)
+  stack = np.stack([windows.pop(field) for field in image_enhancements])
+  return writeIntermediate(stack, source["info"], output, projection=projection)
+
 def createImageEnhancements(image_enhancements, naip, heights, ID, scratchgdb):
 
   naip_b1 = os.path.join(naip, "Band_1")
@@ -0,0 +1,91 @@
+#-------------------------------------------------------------------------------
+# Name:        runPipeline Tool
+# Purpose:     Runs the stages of the fuel/burn pipeline (10_8.py) from a JSON
+#              config file, one stage at a time. Each stage's inputs are
+#              checked before it runs, and its run time (and optionally a
+#              cProfile of it) is recorded so stages can be benchmarked and
+#              profiled in isolation.
+#
+#              python runPipeline.py config.json
+#
+#              {
+#                "pipeline": "10_8.py",
+#                "settings": {"location_name": "Tahoe", "coarsening_size": "5"},
+#                "stages": ["align", "zones", "SVM"],
+#                "profile": false
+#              }
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import cProfile
+import csv
+import json
+import os
+import sys
+import time
+
+
+def loadPipeline(script):
+  # Imports the pipeline script (named "pipeline"); importing it runs no
+  # stage and sets up no project
+  try:
+    from importlib.machinery import SourceFileLoader
+    return SourceFileLoader("pipeline", script).load_module()
+  except ImportError:
+    import imp
+    return imp.load_source("pipeline", script)
+
+def stageNames(stages, settings):
+  # Names of the stages switched on in settings
+  return [name for name, function, switches, inputs, outputs in stages
+          if "Yes" in [settings[switch] for switch in switches]]
+
+def runStages(stages, names, times_file=None, profile_folder=None):
+  # Runs the named stages (see pipelineStages) in pipeline order. Returns
+  # [(stage, seconds)].
+  known = [stage[0] for stage in stages]
+  unknown = [name for name in names if name not in known]
+  if unknown:
+    raise ValueError("Unknown stages: " + ", ".join(unknown))
+  times = []
+  for name, function, switches, inputs, outputs in stages:
+    if name not in names:
+      continue
+    missing = [path for path in inputs if not os.path.exists(path)]
+    if missing:
+      raise IOError("Stage {0} is missing inputs: {1}".format(name, ", ".join(missing)))
+    start = time.time()
+    if profile_folder is not None:
+      cProfile.runctx("function()", globals(), {"function": function},
+                      os.path.join(profile_folder, name + ".prof"))
+    else:
+      function()
+    times.append((name, time.time() - start))
+    if times_file is not None:
+      with open(times_file, "w") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(["stage", "seconds"])
+        writer.writerows(times)
+  return times
+
+if __name__ == "__main__":
+  config_file = sys.argv[1]
+  with open(config_file) as f:
+    config = json.load(f)
+  folder = os.path.dirname(os.path.abspath(__file__))
+  pipeline = loadPipeline(os.path.join(folder, config.get("pipeline", "10_8.py")))
+  settings = pipeline.pipelineSettings(config.get("settings"))
+  project = pipeline.startProject(settings)
+  stages = pipeline.pipelineStages(project, settings)
+  names = config.get("stages") or stageNames(stages, settings)
+  profile_folder = project["scratchws"] if config.get("profile") else None
+  times = runStages(stages, names, os.path.join(project["scratchws"], "stage_times.csv"), profile_folder)
+  for name, seconds in times:
+    print("{0}: {1:.1f} s".format(name, seconds))
@@ -0,0 +1,108 @@
+#-------------------------------------------------------------------------------
+# Name:        scenarioLib Tool
+# Purpose:     Evaluates a batch of mitigation scenarios (asset x buffer width
+#              x treatment) against one unmitigated run. Mitigated windows are
+#              built from the shared cached landscape, burned concurrently and
+#              ranked by the reduction in per-object fire behavior.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import itertools
+import os
+from corridorLib import assetCorridor
+from flamMapLib import burnFolders, burn_metrics
+from mitigationLib import (loadLandscape, loadBurns, objectLabels, footprintWindow,
+                           patchLandscape, treatmentValues, writeWindow, readWindowBurns,
+                           spliceBurns, windowDeltas, writeTable)
+
+
+def scenarioGrid(assets, buff_distances, treatments):
+  # One scenario per asset x buffer width x treatment ([surface, height])
+  scenarios = []
+  for asset, buff_distance, treatment in itertools.product(assets, buff_distances, treatments):
+    scenarios.append({
+      "scenario": len(scenarios) + 1,
+      "asset": asset,
+      "buff_distance": buff_distance,
+      "surface": treatment[0],
+      "height": treatment[1]
+    })
+  return scenarios
+
+def riskReduction(scenario, deltas):
+  # Summed drop in per-object maximum for each metric (positive = safer).
+  # deltas come from windowDeltas, so objects crossing the window edge are
+  # compared over their full extent.
+  result = dict(scenario)
+  result["objects"] = len(deltas)
+  for metric in burn_metrics:
+    reduction = 0.0
+    for label in deltas:
+      before, after, delta = deltas[label][metric]
+      if delta == delta:  # skip NaN
+        reduction -= delta
+    result[metric + "_reduction"] = reduction
+  return result
+
+def rankScenarios(results, rank_by="fli"):
+  # Highest reduction first; scenarios that did not burn go last
+  results = sorted(results, key=lambda r: r.get(rank_by + "_reduction", float("-inf")), reverse=True)
+  for rank, result in enumerate(results):
+    result["rank"] = rank + 1
+  return results
+
+def writeScenarios(results, csv_file):
+  header = ["rank", "scenario", "asset", "buff_distance", "surface", "height", "status", "objects"]
+  header += [metric + "_reduction" for metric in burn_metrics]
+  rows = [[result.get(field, "") for field in header] for result in results]
+  return writeTable(header, rows, csv_file)
+
+def runScenarios(scenarios, outputs, object_raster, unit, dll_path, fuel_moisture, folder,
+                 processes=4, rank_by="fli", model="13", margin=1, windspeed=30.0, wind_dir=0.0):
+  # Builds every scenario window from the cached unmitigated landscape, burns
+  # them concurrently and returns the scenarios ranked by risk reduction.
+  landscape, info = loadLandscape(outputs)
+  before = loadBurns(outputs)
+  labels = objectLabels(object_raster, info)
+
+  # Footprints are built on the landscape grid and shared by every
+  # treatment of the same asset and width
+  masks = {}
+  prepared = []
+  results = []
+  for scenario in scenarios:
+    key = (scenario["asset"], scenario["buff_distance"])
+    if key not in masks:
+      masks[key] = assetCorridor(scenario["asset"], info, scenario["buff_distance"], unit)
+    mask = masks[key]
+
+    window = footprintWindow(mask, margin)
+    if window is None:
+      results.append(dict(scenario, status="no footprint", objects=0))
+      continue
+    values = treatmentValues(scenario["surface"], scenario["height"], model)
+    scenario_folder = os.path.join(folder, "scenario_" + str(scenario["scenario"]))
+    if not os.path.isdir(scenario_folder):
+      os.makedirs(scenario_folder)
+    writeWindow(landscape, patchLandscape(landscape, mask, values), info, window, scenario_folder)
+    prepared.append((scenario, window, scenario_folder))
+
+  # Burn all windows at once
+  codes = burnFolders(dll_path, [p[2] for p in prepared], fuel_moisture, windspeed, wind_dir, processes)
+
+  for (scenario, window, scenario_folder), code in zip(prepared, codes):
+    if code != 0:
+      results.append(dict(scenario, status="burn failed", objects=0))
+      continue
+    # Every object touching the window, over its full extent
+    after = spliceBurns(before, window, readWindowBurns(scenario_folder))
+    deltas = windowDeltas(labels, before, after, window)
+    results.append(riskReduction(dict(scenario, status="ok"), deltas))
+  return rankScenarios(results, rank_by)
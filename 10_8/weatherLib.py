@@ -0,0 +1,206 @@
+#-------------------------------------------------------------------------------
+# Name:        weatherLib Tool
+# Purpose:     Reads, checks, converts and writes the FARSITE/FlamMap weather
+#              (.wtr), wind (.wnd) and fuel moisture (.fms) text inputs as
+#              typed NumPy record arrays, so burn sweep scenarios can be
+#              generated and validated without opening them by hand.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import os
+import numpy as np
+
+# Columns of each file type, in file order
+input_fields = {
+  "wtr": [("month", "int16"), ("day", "int16"), ("precip", "float32"),
+          ("min_hour", "int16"), ("max_hour", "int16"),
+          ("min_temp", "float32"), ("max_temp", "float32"),
+          ("max_humidity", "float32"), ("min_humidity", "float32"),
+          ("elevation", "float32")],
+  "wnd": [("month", "int16"), ("day", "int16"), ("hour", "int16"),
+          ("speed", "float32"), ("direction", "float32"), ("cloud", "float32")],
+  "fms": [("model", "int16"), ("h1", "float32"), ("h10", "float32"),
+          ("h100", "float32"), ("live_herb", "float32"), ("live_woody", "float32")]
+}
+# Valid ranges (ENGLISH units): precip in 1/100 in, temperature in F,
+# elevation in ft, speed in mph, direction in degrees (-1 uphill, -2 downhill)
+input_ranges = {
+  "wtr": {"precip": (0, 1000), "min_temp": (-60, 140), "max_temp": (-60, 140),
+          "max_humidity": (1, 100), "min_humidity": (1, 100), "elevation": (-1000, 15000)},
+  "wnd": {"speed": (0, 150), "direction": (-2, 360), "cloud": (0, 100)},
+  "fms": {"model": (1, 256), "h1": (1, 300), "h10": (1, 300), "h100": (1, 300),
+          "live_herb": (30, 300), "live_woody": (30, 300)}
+}
+month_days = np.array([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+month_starts = np.concatenate([[0], np.cumsum([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])])
+
+
+def inputKind(path):
+  # wtr, wnd or fms from the file extension
+  kind = os.path.splitext(path)[1].lower().lstrip(".")
+  if kind not in input_fields:
+    raise ValueError("Unknown FARSITE input {0}".format(path))
+  return kind
+
+def readInput(path):
+  # (records, units) of a .wtr/.wnd/.fms file. units is ENGLISH or METRIC
+  # (ENGLISH when the file has no header, as for .fms). Extra columns such as
+  # the optional rain hours or trailing tabs are ignored.
+  fields = input_fields[inputKind(path)]
+  with open(path) as f:
+    lines = [line.split() for line in f if line.strip()]
+  units = "ENGLISH"
+  if lines and lines[0][0].upper() in ("ENGLISH", "METRIC"):
+    units = lines.pop(0)[0].upper()
+  if any(len(line) < len(fields) for line in lines):
+    raise ValueError("{0}: expected {1} columns".format(path, len(fields)))
+  values = np.array([line[:len(fields)] for line in lines], dtype="float64").reshape(-1, len(fields))
+  records = np.zeros(len(values), dtype=fields)
+  for i, (name, dtype) in enumerate(fields):
+    records[name] = values[:, i]
+  return records, units
+
+def writeInput(path, records, units="ENGLISH"):
+  # Writes records as a tab separated .wtr/.wnd/.fms. Values are rounded to
+  # whole numbers as FARSITE reads them.
+  kind = inputKind(path)
+  with open(path, "w") as f:
+    if kind != "fms":
+      f.write(units + "\n")
+    columns = np.column_stack([np.round(records[name]).astype("int64") for name, dtype in input_fields[kind]])
+    np.savetxt(f, columns, fmt="%d", delimiter="\t")
+  return path
+
+def dayOfRun(records):
+  # Days since 1 January of the first record; runs that cross into a new year
+  # keep counting
+  days = month_starts[records["month"] - 1] + records["day"] - 1
+  wrapped = np.concatenate([[0], np.cumsum(np.diff(days) < 0)])
+  return days + 365 * wrapped
+
+def minutes(hours):
+  # HHMM clock values to minutes after midnight
+  return (hours // 100) * 60 + hours % 100
+
+def validateInput(records, kind, units="ENGLISH"):
+  # List of problems ("row field value: reason") found in the records; empty
+  # when the file is valid
+  if units != "ENGLISH":
+    records = convertUnits(records, kind, units, "ENGLISH")
+  checks = []
+  for name, (low, high) in sorted(input_ranges[kind].items()):
+    checks.append((name, (records[name] < low) | (records[name] > high), "outside {0}-{1}".format(low, high)))
+  if kind == "fms":
+    # Out of range models are reported above; only valid ones are counted
+    models = records["model"]
+    valid = (models >= 1) & (models <= 256)
+    counts = np.bincount(models[valid], minlength=257)
+    checks.append(("model", valid & (counts[models.clip(0, 256)] > 1), "duplicate model"))
+  else:
+    months = records["month"]
+    checks.append(("month", (months < 1) | (months > 12), "outside 1-12"))
+    checks.append(("day", (records["day"] < 1) | (records["day"] > month_days[months.clip(1, 12) - 1]), "not a day of the month"))
+    hour_fields = ["min_hour", "max_hour"] if kind == "wtr" else ["hour"]
+    for name in hour_fields:
+      hours = records[name]
+      checks.append((name, (hours < 0) | (hours > 2359) | (hours % 100 > 59), "not an HHMM time"))
+    time = dayOfRun(records) * 1440
+    if kind == "wnd":
+      time = time + minutes(records["hour"])
+    step = np.concatenate([[1], np.diff(time)])
+    checks.append(("month" if kind == "wtr" else "hour", step <= 0, "out of order or repeated"))
+    if kind == "wtr":
+      checks.append(("min_temp", records["min_temp"] > records["max_temp"], "above max_temp"))
+      checks.append(("min_humidity", records["min_humidity"] > records["max_humidity"], "above max_humidity"))
+  problems = []
+  for name, bad, reason in checks:
+    for row in np.nonzero(bad)[0]:
+      problems.append("{0} {1} {2}: {3}".format(row + 1, name, records[name][row], reason))
+  return problems
+
+def convertUnits(records, kind, units, to_units):
+  # Copy of records in to_units (ENGLISH or METRIC): precip 1/100 in <-> mm,
+  # temperature F <-> C, elevation ft <-> m, wind speed mph <-> km/h
+  records = records.copy()
+  if units == to_units or kind == "fms":
+    return records
+  metric = to_units == "METRIC"
+  if kind == "wtr":
+    records["precip"] = records["precip"] * 0.254 if metric else records["precip"] / 0.254
+    for name in ("min_temp", "max_temp"):
+      records[name] = (records[name] - 32) / 1.8 if metric else records[name] * 1.8 + 32
+    records["elevation"] = records["elevation"] * 0.3048 if metric else records["elevation"] / 0.3048
+  elif kind == "wnd":
+    records["speed"] = records["speed"] * 1.609344 if metric else records["speed"] / 1.609344
+  return records
+
+def windHourly(records):
+  # Wind records resampled to every hour between the first and last record.
+  # Speed and cloud are interpolated linearly and direction along the shortest
+  # turn; uphill/downhill directions (-1/-2) are held until the next record.
+  time = dayOfRun(records) * 1440 + minutes(records["hour"])
+  hourly = np.arange(-(-time[0] // 60) * 60, time[-1] + 1, 60)
+  resampled = np.zeros(len(hourly), dtype=input_fields["wnd"])
+  day = hourly // 1440
+  year_day = day % 365
+  resampled["month"] = np.searchsorted(month_starts, year_day, side="right")
+  resampled["day"] = year_day - month_starts[resampled["month"] - 1] + 1
+  resampled["hour"] = (hourly % 1440) // 60 * 100
+  resampled["speed"] = np.interp(hourly, time, records["speed"])
+  resampled["cloud"] = np.interp(hourly, time, records["cloud"])
+  direction = records["direction"].astype("float64")
+  if (direction < 0).any():
+    resampled["direction"] = direction[np.searchsorted(time, hourly, side="right") - 1]
+  else:
+    radians = np.radians(direction)
+    east = np.interp(hourly, time, np.sin(radians))
+    north = np.interp(hourly, time, np.cos(radians))
+    resampled["direction"] = np.round(np.degrees(np.arctan2(east, north))) % 360
+  return resampled
+
+def windRecords(month, day, speed, direction, cloud=0, hours=24):
+  # Constant hourly wind records for hours hours from month/day 00:00
+  start = month_starts[month - 1] + day - 1
+  hourly = np.arange(hours) * 60 + start * 1440
+  records = np.zeros(hours, dtype=input_fields["wnd"])
+  year_day = (hourly // 1440) % 365
+  records["month"] = np.searchsorted(month_starts, year_day, side="right")
+  records["day"] = year_day - month_starts[records["month"] - 1] + 1
+  records["hour"] = (hourly % 1440) // 60 * 100
+  records["speed"] = speed
+  records["direction"] = direction
+  records["cloud"] = cloud
+  return records
+
+def windSweep(folder, speeds, directions, month, day, hours=24, cloud=0, prefix="wind_"):
+  # Writes one validated .wnd per speed x direction to folder as
+  # <prefix><speed>_<direction>.wnd. Returns {(speed, direction): path}.
+  if not os.path.isdir(folder):
+    os.makedirs(folder)
+  files = {}
+  for speed in speeds:
+    for direction in directions:
+      records = windRecords(month, day, speed, direction, cloud, hours)
+      problems = validateInput(records, "wnd")
+      if problems:
+        raise ValueError("Wind {0} {1}: {2}".format(speed, direction, "; ".join(problems)))
+      path = os.path.join(folder, "{0}{1}_{2}.wnd".format(prefix, speed, direction))
+      files[(speed, direction)] = writeInput(path, records)
+  return files
+
+if __name__ == "__main__":
+  # python weatherLib.py <input> [<input> ...]: reports the problems in each file
+  import sys
+  for path in sys.argv[1:]:
+    records, units = readInput(path)
+    problems = validateInput(records, inputKind(path), units)
+    print("{0}: {1} records, {2}".format(path, len(records), units))
+    for problem in problems:
+      print("  " + problem)
@@ -0,0 +1,125 @@
+#-------------------------------------------------------------------------------
+# Name:        zoneLib Tool
+# Purpose:     Reads the part of the site rasters (NAIP, heights) under a zone
+#              polygon without ExtractByMask. The rasters are staged once as
+#              read-only memory-mapped arrays, copied block by block; a zone
+#              takes a zero-copy view of the pixel window of its bounds and a
+#              mask of the cells inside the polygon, so extraction scales with
+#              the zone and not the site, and zone workers running in parallel
+#              all map the same pages.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import json
+import os
+import numpy as np
+from rasterArrays import rasterInfo, windowInfo, readIntermediate, blockWindows
+
+
+def boundsWindow(info, bounds):
+  # (rows, cols) slices of the cells touching bounds (x_min, y_min, x_max,
+  # y_max), clipped to the raster; empty slices when they do not overlap
+  col_start = int(np.floor((bounds[0] - info["x_min"]) / info["cell_width"]))
+  col_stop = int(np.ceil((bounds[2] - info["x_min"]) / info["cell_width"]))
+  row_start = int(np.floor((info["y_max"] - bounds[3]) / info["cell_height"]))
+  row_stop = int(np.ceil((info["y_max"] - bounds[1]) / info["cell_height"]))
+  col_start, col_stop = max(col_start, 0), min(col_stop, info["cols"])
+  row_start, row_stop = max(row_start, 0), min(row_stop, info["rows"])
+  return slice(row_start, max(row_stop, row_start)), slice(col_start, max(col_stop, col_start))
+
+def polygonMask(rings, info):
+  # Cells of the grid whose centre is inside the rings (even-odd rule)
+  x = info["x_min"] + (np.arange(info["cols"]) + 0.5) * info["cell_width"]
+  y = info["y_max"] - (np.arange(info["rows"]) + 0.5) * info["cell_height"]
+  inside = np.zeros((info["rows"], info["cols"]), dtype=bool)
+  for ring in rings:
+    for (x0, y0), (x1, y1) in zip(ring, np.roll(ring, -1, axis=0)):
+      if y0 == y1:
+        continue
+      rows = (y >= min(y0, y1)) & (y < max(y0, y1))
+      crossing = x0 + (y[rows] - y0) * (x1 - x0) / (y1 - y0)
+      inside[rows] ^= x[None, :] < crossing[:, None]
+  return inside
+
+def zoneRings(geometry):
+  # Vertex arrays of every ring of a polygon geometry
+  rings = []
+  for part in geometry:
+    ring = []
+    for point in part:
+      if point is None:
+        if len(ring) > 2:
+          rings.append(np.array(ring))
+        ring = []
+      else:
+        ring.append((point.X, point.Y))
+    if len(ring) > 2:
+      rings.append(np.array(ring))
+  return rings
+
+def shareRasters(rasters, folder, dtypes=None):
+  # Stages each raster once as <name>.npy in folder, copied block by block
+  # (tile-aligned windows of the intermediate) so the whole raster is never
+  # in memory, and writes shared.json describing them. Rasters unchanged
+  # since the last staging are not read again. Returns the manifest path.
+  manifest = os.path.join(folder, "shared.json")
+  staged = {}
+  if os.path.isfile(manifest):
+    with open(manifest) as f:
+      staged = json.load(f)
+  for i, raster in enumerate(rasters):
+    dtype = dtypes[i] if dtypes else "float32"
+    modified = os.path.getmtime(raster) if os.path.exists(raster) else None
+    entry = staged.get(raster)
+    if entry and entry["modified"] == modified and entry["dtype"] == dtype and os.path.isfile(entry["npy"]):
+      continue
+    info = rasterInfo(raster)
+    npy = os.path.join(folder, os.path.splitext(os.path.basename(raster))[0] + ".npy")
+    shared = None
+    for rows, cols in blockWindows(info):
+      block, window = readIntermediate(raster, rows, cols, dtype, info)
+      if shared is None:
+        shared = np.lib.format.open_memmap(npy, mode="w+", dtype=dtype,
+                                           shape=block.shape[:-2] + (info["rows"], info["cols"]))
+      shared[..., rows, cols] = block
+    shared.flush()
+    del shared
+    spatial_reference = info.pop("spatial_reference")
+    info["spatial_reference"] = spatial_reference.exportToString() if spatial_reference is not None else None
+    staged[raster] = {"npy": npy, "modified": modified, "dtype": dtype, "info": info}
+  with open(manifest, "w") as f:
+    json.dump(staged, f)
+  return manifest
+
+def openShared(manifest):
+  # {raster: info} with "array" a read-only memory map of the staged raster;
+  # safe to call from every worker (no data is copied)
+  with open(manifest) as f:
+    staged = json.load(f)
+  shared = {}
+  for raster, entry in staged.items():
+    info = dict(entry["info"])
+    info["array"] = np.load(entry["npy"], mmap_mode="r")
+    shared[raster] = info
+  return shared
+
+def zoneView(shared, raster, rings):
+  # (view, window info, mask) of a staged raster under a zone polygon given
+  # as rings (see zoneRings). view is a zero-copy, read-only slice of the
+  # memory map; mask marks the cells inside the polygon.
+  info = shared[raster]
+  vertices = np.vstack(rings)
+  bounds = (vertices[:, 0].min(), vertices[:, 1].min(), vertices[:, 0].max(), vertices[:, 1].max())
+  rows, cols = boundsWindow(info, bounds)
+  if rows.stop == rows.start or cols.stop == cols.start:
+    raise ValueError("Zone does not overlap {0}".format(raster))
+  window = windowInfo(info, rows, cols)
+  del window["array"]
+  return info["array"][..., rows, cols], window, polygonMask(rings, window)
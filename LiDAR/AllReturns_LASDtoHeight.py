@@ -9,12 +9,18 @@
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
 
+# Dependent scripts (kept next to this script in the LiDAR folder):
+# rasterArrays.py, lasLib.py, surfaceLib.py
+
 # Import modules
 import arcpy
 import os
 import sys
 from arcpy import env
 from arcpy.sa import *
+from rasterArrays import rasterInfo, rasterToArray, arrayToRaster, alignToGrid
+from lasLib import lasFiles, lasBounds, gridInfo, rasterizeTiles
+from surfaceLib import surfaceHeights, spikeMask, fillVoids
 arcpy.env.overwriteOutput = True
 
 # Set scratch workspace and environment settings
@@ -33,20 +39,28 @@ inputs_path = os.path.join(toolpath, "Inputs")
 LAS_path = os.path.join(inputs_path, "LAS")
 lasdpath = os.path.join(inputs_path, "Pendleton.lasd")     # Replace LAS, create lasd manually
 # naippath = os.path.join(inputs_path,"Altamont_Test_NAIP_unprocessed.tif")
+naippath = ""                  # NAIP to snap the LAS tile grid to
+processes = 4                  # LAS blocks rasterized at once
 ##arcpy.env.snapRaster = naip
 ##extentpath = os.path.join(inputs_path, "altamont_sp.shp")
 ##
 ##arcpy.env.extent = arcpy.Describe(extentpath).extent
 
+# Classes of the first pulse (surface) and last pulse (ground) layers
+FP_classes = [0,1,3,4,5,6,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31]
+LP_classes = [1,2,8,10,21,22]
+las_files = lasFiles(LAS_path)
+
 # Create FP.lasd
 FP_lasdpath = os.path.join(inputs_path, "FP.lasd")
-arcpy.MakeLasDatasetLayer_management(lasdpath,FP_lasdpath,[0,1,3,4,5,6,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29,30,31],"","","","","")
-arcpy.AddMessage("FP.lasd created in inputs.")
-
-# Create LP.lasd
 LP_lasdpath = os.path.join(inputs_path, "LP.lasd")
-arcpy.MakeLasDatasetLayer_management(lasdpath,LP_lasdpath,[1,2,8,10,21,22],"","","","","")
-arcpy.AddMessage("LP.lasd created in inputs.")
+if not las_files:
+    arcpy.MakeLasDatasetLayer_management(lasdpath,FP_lasdpath,FP_classes,"","","","","")
+    arcpy.AddMessage("FP.lasd created in inputs.")
+
+    # Create LP.lasd
+    arcpy.MakeLasDatasetLayer_management(lasdpath,LP_lasdpath,LP_classes,"","","","","")
+    arcpy.AddMessage("LP.lasd created in inputs.")
 
 # ---------------Set extent properties---------------------------
 # naipdesc = arcpy.Describe(naippath)
@@ -70,47 +84,51 @@ cell_size = 3.0316211
 #
 # Create DEM
 DEMpath = os.path.join(outputs_path,"DEM.tif")
-arcpy.LasDatasetToRaster_conversion(LP_lasdpath, DEMpath, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
-arcpy.AddMessage("DEM.tif created in Outputs folder.")
-#
-# Create DSM
 TempDSMpath = os.path.join(scratchfolder,"TempDSM.tif")
 DSMpath = os.path.join(outputs_path,"DSM.tif")
-arcpy.LasDatasetToRaster_conversion(FP_lasdpath, TempDSMpath, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "1")
-DSM = Con(IsNull(Float(TempDSMpath)),Float(DEMpath),Float(TempDSMpath))
-DSM.save(DSMpath)
-arcpy.AddMessage("DSM.tif created in Outputs folder.")
+if las_files:
+    # Rasterize the LAS tiles in parallel blocks, snapped to the NAIP cells when it is there
+    arcpy.AddMessage("Rasterizing "+str(len(las_files))+" LAS files.")
+    snap = None
+    spatial_reference = None
+    if arcpy.Exists(lasdpath):
+        spatial_reference = arcpy.Describe(lasdpath).spatialReference
+    if naippath and arcpy.Exists(naippath):
+        naip_info = rasterInfo(naippath)
+        snap = (naip_info["x_min"], naip_info["y_max"])
+        spatial_reference = naip_info["spatial_reference"]
+    if spatial_reference is None or spatial_reference.name == "Unknown":
+        # The heights and the spike fill distance need the map units
+        raise ValueError("No spatial reference for the LAS files: add " + os.path.basename(lasdpath) +
+                         " or set naippath.")
+    info = gridInfo(lasBounds(las_files), cell_size, snap, spatial_reference)
+    dem, dsm = rasterizeTiles(las_files, info, os.path.join(scratchfolder, "las_blocks"), processes,
+                               LP_classes, FP_classes)
+    arrayToRaster(dem, info, DEMpath)
+    arcpy.AddMessage("DEM.tif created in Outputs folder.")
+    arrayToRaster(dsm, info, DSMpath)
+    arcpy.AddMessage("DSM.tif created in Outputs folder.")
+else:
+    arcpy.LasDatasetToRaster_conversion(LP_lasdpath, DEMpath, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
+    arcpy.AddMessage("DEM.tif created in Outputs folder.")
+    #
+    # Create DSM
+    arcpy.LasDatasetToRaster_conversion(FP_lasdpath, TempDSMpath, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "1")
+    DSM = Con(IsNull(Float(TempDSMpath)),Float(DEMpath),Float(TempDSMpath))
+    DSM.save(DSMpath)
+    arcpy.AddMessage("DSM.tif created in Outputs folder.")
 #
 # Create Heights
-no_clip_heights = os.path.join(scratchfolder,"no_clip_heights.tif")
-hts_interm1 = os.path.join(scratchfolder,"hts_interm1.tif")
-hts_interm2 = os.path.join(scratchfolder,"hts_interm2.tif")
-heights = Float(DSMpath)-Float(DEMpath)
-heights = Con(IsNull(Float(heights)), 0, Float(heights))
-heights = Con(Float(heights) < 0, 0, Float(heights))
-heights = SetNull(Float(heights),Float(heights),"VALUE > 350")                                          # Minimum "Cloud" heights defined here.  NOTE UNITS
-if int(arcpy.GetRasterProperties_management(heights,"ANYNODATA").getOutput(0)):
-    arcpy.AddMessage("Interpolating under clouds/birds.")
-    heights.save(hts_interm1)
-    heights.save(hts_interm2)
-    del heights
-    cloudrast = os.path.join(scratchgdb,"cloudrast")
-    arcpy.gp.Reclassify_sa(hts_interm1, "VALUE", "-10000 10000 NODATA;NODATA 1", cloudrast, "DATA")
-    cloudpts = os.path.join(scratchgdb,"cloudpts")
-    arcpy.RasterToPoint_conversion(cloudrast,cloudpts,"VALUE")
-    cloudpts_buf30 = os.path.join(scratchgdb,"cloudptsbuf30")
-    arcpy.Buffer_analysis(cloudpts, cloudpts_buf30, "30 Feet", "FULL", "ROUND", "ALL", "", "PLANAR")
-    nocloudmask = ExtractByMask(hts_interm2,cloudpts_buf30)
-    interppts = os.path.join(scratchgdb,"interppts")
-    arcpy.RasterToPoint_conversion(nocloudmask, interppts,"")
-    NNinterp = os.path.join(scratchgdb,"NNinterp")
-    arcpy.gp.NaturalNeighbor_sa(interppts, "grid_code", NNinterp, hts_interm2)
-    arcpy.MosaicToNewRaster_management(hts_interm2+";"+NNinterp,scratchfolder,"no_clip_heights.tif", "", "32_BIT_FLOAT", "", "1", "FIRST", "FIRST")
-else:
-    heights.save(no_clip_heights)
-
 out_height = os.path.join(outputs_path,"heights.tif")
-heights.save(out_height)
+dem_array, dem_info = rasterToArray(DEMpath)
+dsm_array, dsm_info = rasterToArray(DSMpath)
+heights = surfaceHeights(dem_array, alignToGrid(dsm_array, dsm_info, dem_info))
+spikes = spikeMask(heights, 350)                                          # Minimum "Cloud" heights defined here.  NOTE UNITS
+if spikes.any():
+    arcpy.AddMessage("Interpolating under clouds/birds.")
+    meters_per_unit = dem_info["spatial_reference"].metersPerUnit
+    heights = fillVoids(heights, spikes, 30 * 0.3048 / meters_per_unit, dem_info["cell_width"])     # 30 Feet
+arrayToRaster(heights, dem_info, out_height)
 
 ## Clipping Geometry (remove 0-value NoData values)
 #int_dem = Int(Float(DEMpath))
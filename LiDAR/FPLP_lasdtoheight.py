@@ -9,12 +9,18 @@
 # Licence:     <your licence>
 #-------------------------------------------------------------------------------
 
+# Dependent scripts (kept next to this script in the LiDAR folder):
+# rasterArrays.py, lasLib.py, surfaceLib.py
+
 # Import modules
 import arcpy
 import os
 import sys
 from arcpy import env
 from arcpy.sa import *
+from rasterArrays import rasterInfo, rasterToArray, arrayToRaster, alignToGrid
+from lasLib import lasFiles, lasBounds, gridInfo, rasterizeTiles
+from surfaceLib import surfaceHeights, spikeMask, fillVoids
 arcpy.env.overwriteOutput = True
 
 arcpy.AddMessage("print 1")
@@ -58,19 +64,35 @@ naippath = os.path.join(inputs_path,"Crockett.tif")
 #
 #cell_size = str(arcpy.GetRasterProperties_management(naippath,"CELLSIZEX",""))
 cell_size = str(3.28084*5)
+processes = 4                  # LAS blocks rasterized at once
 arcpy.AddMessage("print 3")
 #
 # Create DEM
 DEMpath = os.path.join(outputs_path,"DEM.tif")
-arcpy.AddMessage("print 4")
-arcpy.LasDatasetToRaster_conversion(LPlasdpath, DEMpath, "ELEVATION", "BINNING MINIMUM LINEAR", "FLOAT", "CELLSIZE", cell_size, "")
-arcpy.AddMessage("DEM.tif created in Outputs folder.")
-arcpy.env.snapRaster = DEMpath
-#
-# Create DSM
 DSMpath = os.path.join(outputs_path,"DSM.tif")
-arcpy.LasDatasetToRaster_conversion(FPlasdpath, DSMpath, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "")
-arcpy.AddMessage("DSM.tif created in Outputs folder.")
+arcpy.AddMessage("print 4")
+las_files = lasFiles(LAS_path)
+if las_files:
+    # Rasterize the LAS tiles in parallel blocks on the NAIP cell alignment:
+    # DEM = lowest last return, DSM = highest first return
+    arcpy.AddMessage("Rasterizing "+str(len(las_files))+" LAS files.")
+    naip_info = rasterInfo(naippath)
+    info = gridInfo(lasBounds(las_files), float(cell_size), (naip_info["x_min"], naip_info["y_max"]), naip_info["spatial_reference"])
+    dem, dsm = rasterizeTiles(las_files, info, os.path.join(scratchfolder, "las_blocks"), processes,
+                               ground_returns=["LAST"], surface_returns=["FIRST"], ground_stat="min")
+    arrayToRaster(dem, info, DEMpath)
+    arcpy.AddMessage("DEM.tif created in Outputs folder.")
+    arrayToRaster(dsm, info, DSMpath)
+    arcpy.AddMessage("DSM.tif created in Outputs folder.")
+    arcpy.env.snapRaster = DEMpath
+else:
+    arcpy.LasDatasetToRaster_conversion(LPlasdpath, DEMpath, "ELEVATION", "BINNING MINIMUM LINEAR", "FLOAT", "CELLSIZE", cell_size, "")
+    arcpy.AddMessage("DEM.tif created in Outputs folder.")
+    arcpy.env.snapRaster = DEMpath
+    #
+    # Create DSM
+    arcpy.LasDatasetToRaster_conversion(FPlasdpath, DSMpath, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "")
+    arcpy.AddMessage("DSM.tif created in Outputs folder.")
 ###
 ### Create Intensity
 ##intensitypath = os.path.join(outputs_path, "lidar_intensity.tif")
@@ -79,33 +101,16 @@ arcpy.AddMessage("DSM.tif created in Outputs folder.")
 #
 # Create Heights
 out_heights = os.path.join(outputs_path,"heights.tif")
-hts_interm1 = os.path.join(scratchfolder,"hts_interm1.tif")
-hts_interm2 = os.path.join(scratchfolder,"hts_interm2.tif")
-heights = Float(DSMpath)-Float(DEMpath)
-heights = Con(IsNull(Float(heights)), 0, Float(heights))
-heights = Con(Float(heights) < 0, 0, Float(heights))
-heights = SetNull(Float(heights),Float(heights),"VALUE > 350")                      # Minimum "Cloud" heights defined here.  NOTE UNITS
-if arcpy.GetRasterProperties_management(heights,"ANYNODATA").getOutput(0):
+dem_array, dem_info = rasterToArray(DEMpath)
+dsm_array, dsm_info = rasterToArray(DSMpath)
+heights = surfaceHeights(dem_array, alignToGrid(dsm_array, dsm_info, dem_info))
+spikes = spikeMask(heights, 350)                      # Minimum "Cloud" heights defined here.  NOTE UNITS
+if spikes.any():
     arcpy.AddMessage("Interpolating under clouds/birds.")
-    heights.save(hts_interm1)
-    heights.save(hts_interm2)
-    del heights
-    cloudrast = os.path.join(scratchws,"cloudrast")
-    arcpy.gp.Reclassify_sa(hts_interm1, "VALUE", "0 500 NODATA;NODATA 1", cloudrast, "DATA")
-    cloudpts = os.path.join(scratchws,"cloudpts")
-    arcpy.RasterToPoint_conversion(cloudrast,cloudpts,"VALUE")
-    cloudpts_buf30 = os.path.join(scratchws,"cloudptsbuf30")
-    arcpy.Buffer_analysis(cloudpts, cloudpts_buf30, "30 Meters", "FULL", "ROUND", "ALL", "", "PLANAR")
-    nocloudmask = ExtractByMask(hts_interm2,cloudpts_buf30)
-    interppts = os.path.join(scratchws,"interppts")
-    arcpy.RasterToPoint_conversion(nocloudmask, interppts,"")
-    NNinterp = os.path.join(scratchws,"NNinterp")
-    arcpy.gp.NaturalNeighbor_sa(interppts, "grid_code", NNinterp, hts_interm2)
-    arcpy.MosaicToNewRaster_management(hts_interm2+";"+NNinterp,outputs_path,"heights.tif", "", "32_BIT_FLOAT", "", "1", "FIRST", "FIRST")
-    arcpy.AddMessage("heights.tif created in Outputs folder.")
-else:
-    heights.save(out_heights)
-    arcpy.AddMessage("heights.tif created in Outputs folder.")
+    meters_per_unit = dem_info["spatial_reference"].metersPerUnit
+    heights = fillVoids(heights, spikes, 30 / meters_per_unit, dem_info["cell_width"])     # 30 Meters
+arrayToRaster(heights, dem_info, out_heights)
+arcpy.AddMessage("heights.tif created in Outputs folder.")
 
 #
 # Create Boundary
@@ -0,0 +1,337 @@
+#-------------------------------------------------------------------------------
+# Name:        canopyLib Tool
+# Purpose:     Classifies heights into ground/grass/shrub/tree and finds the
+#              connected tree patches on the array. Finds tree canopies by
+#              sweeping height slices down the tree heights array. Each
+#              slice's cells are joined (union-find) to their neighbours
+#              already swept; a canopy without an existing tree gets a new
+#              seed at its highest cell (the tree top). Crowns are then
+#              partitioned by assigning every tree cell to its nearest seed on
+#              the grid, which gives the Thiessen polygons of the seeds clipped
+#              by the trees without building any vector geometry.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import arcpy
+import os
+import numpy as np
+from rasterArrays import arrayToRaster
+
+try:
+  from scipy.ndimage import distance_transform_edt, label
+except ImportError:
+  distance_transform_edt = None
+  label = None
+
+
+# Height classes (cover codes 0-3) and the heights (in unit) they start at;
+# the tree class starts at the top of the shrub class
+height_classes = ["ground", "grass", "shrub", "tree"]
+class_thresholds = {
+  "Meters": [0, 0.6096, 1.8288],
+  "Feet": [0, 2, 6]
+}
+
+
+def heightClasses(heights, unit):
+  # Cover code of every cell from its whole-unit height (as Int(heights) was
+  # classified); nodata cells are 255
+  heights = np.asarray(heights, dtype="float64")
+  classes = np.digitize(np.trunc(np.nan_to_num(heights)), class_thresholds[unit]).astype("uint8")
+  classes[np.isnan(heights)] = 255
+  return classes
+
+def patchLabels(mask):
+  # Connected patches (8 neighbours) of a mask. Returns (labels, count) with
+  # labels 1..count and 0 outside the mask. Rows are scanned as runs of cells
+  # and runs touching a run of the previous row are joined.
+  mask = np.asarray(mask, dtype=bool)
+  if label is not None:
+    labels, count = label(mask, structure=np.ones((3, 3), dtype=bool))
+    return labels.astype("int32"), int(count)
+
+  labels = np.zeros(mask.shape, dtype="int32")
+  parent = [0]
+
+  def find(run):
+    while parent[run] != run:
+      parent[run] = parent[parent[run]]
+      run = parent[run]
+    return run
+
+  previous = []
+  runs = []
+  for r in range(mask.shape[0]):
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask[r].view("int8"), [0]))))
+    current = []
+    j = 0
+    for start, stop in zip(edges[::2].tolist(), edges[1::2].tolist()):
+      run = len(parent)
+      parent.append(run)
+      # Runs of the previous row that overlap [start - 1, stop] touch this run
+      while j < len(previous) and previous[j][1] < start:
+        j += 1
+      k = j
+      while k < len(previous) and previous[k][0] <= stop:
+        a, b = find(run), find(previous[k][2])
+        if a != b:
+          parent[max(a, b)] = min(a, b)
+        k += 1
+      current.append((start, stop, run))
+      runs.append((r, start, stop, run))
+    previous = current
+
+  # Number the patches 1..count in scan order
+  roots = {}
+  for r, start, stop, run in runs:
+    root = find(run)
+    if root not in roots:
+      roots[root] = len(roots) + 1
+    labels[r, start:stop] = roots[root]
+  return labels, len(roots)
+
+def writeTrees(patches, info, output, spatial_reference, scratch):
+  # Tree polygons (one multipart feature, veg = "tree") from the tree patches,
+  # for when a vector boundary is needed
+  tree_mask = os.path.join(scratch, "tree_mask")
+  tree_polys = os.path.join(scratch, "tree_polys")
+  arrayToRaster((patches > 0).astype("uint8"), info, tree_mask, 0, spatial_reference)
+  arcpy.RasterToPolygon_conversion(tree_mask, tree_polys, "NO_SIMPLIFY", "VALUE")
+  arcpy.AddField_management(tree_polys, "veg", "STRING")
+  arcpy.CalculateField_management(tree_polys, "veg", "'tree'", "PYTHON_9.3")
+  arcpy.Dissolve_management(tree_polys, output, "veg", "", "MULTI_PART")
+  return output
+
+def canopySeeds(tree_heights, incr=1, min_cells=12):
+  # tree_heights: 2D array, tree cells > 0 (0/NaN elsewhere)
+  # incr:         slice thickness in height units
+  # min_cells:    smallest new canopy that gets a seed (12 cells is about the
+  #               old Shape_Length > 14 rule at 1 unit cells)
+  # Returns a list of (row, col, height) tree tops, tallest first.
+  heights = np.nan_to_num(np.asarray(tree_heights, dtype="float64"))
+  rows, cols = heights.shape
+  flat = heights.ravel()
+  cells = np.flatnonzero(flat > 0)
+  cells = cells[np.argsort(-flat[cells], kind="mergesort")]
+  levels = np.floor(flat[cells] / incr).astype("int64")
+
+  # Union-find over canopies. A cell's canopy id is its rank (1..n) in the
+  # tallest-first order; owner maps every swept cell to a canopy id
+  owner = np.zeros(flat.size, dtype="int64")
+  parent = np.arange(len(cells) + 1)
+  size = np.ones(len(cells) + 1, dtype="int64")
+  top = np.arange(-1, len(cells))
+  seeded = np.zeros(len(cells) + 1, dtype=bool)
+
+  def find(ids):
+    roots = parent[ids]
+    while True:
+      above = parent[roots]
+      if (above == roots).all():
+        break
+      roots = above
+    parent[ids] = roots
+    return roots
+
+  seeds = []
+  stops = np.append(np.flatnonzero(np.diff(levels)) + 1, len(cells))
+  start = 0
+  for stop in stops.tolist():
+    # Add this slice; only its cells are joined to their swept neighbours
+    new_cells = cells[start:stop]
+    new_ids = np.arange(start + 1, stop + 1)
+    owner[new_cells] = new_ids
+    start = stop
+    r, c = np.divmod(new_cells, cols)
+    a, b = [], []
+    for dr, dc in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+      inside = (r + dr >= 0) & (r + dr < rows) & (c + dc >= 0) & (c + dc < cols)
+      neighbours = owner[new_cells[inside] + dr * cols + dc]
+      swept = neighbours > 0
+      a.append(new_ids[inside][swept])
+      b.append(neighbours[swept])
+    a, b = np.concatenate(a), np.concatenate(b)
+
+    # Canopies touched by the slice, before joining
+    touched = np.unique(np.concatenate((new_ids, find(b))))
+    while a.size:
+      a, b = find(a), find(b)
+      joined = a != b
+      a, b = a[joined], b[joined]
+      np.minimum.at(parent, np.maximum(a, b), np.minimum(a, b))
+
+    # Size, seed and highest cell of every canopy the slice changed
+    roots, index = np.unique(find(touched), return_inverse=True)
+    size[roots] = np.bincount(index, weights=size[touched]).astype("int64")
+    seeded[roots] = np.bincount(index, weights=seeded[touched]) > 0
+    tops = np.full(len(roots), len(cells), dtype="int64")
+    np.minimum.at(tops, index, top[touched])
+    top[roots] = tops
+
+    # New canopies get a seed at their highest cell
+    new = ~seeded[roots] & (size[roots] >= min_cells)
+    seeded[roots[new]] = True
+    for cell in cells[np.sort(top[roots[new]])].tolist():
+      r, c = divmod(cell, cols)
+      seeds.append((r, c, float(flat[cell])))
+  return seeds
+
+def crownLabels(tree_mask, seeds, info):
+  # Crown id (1..n, in seed order) of the nearest seed for every tree cell,
+  # 0 elsewhere. Distances use the cell size, so non-square cells are handled.
+  labels = np.zeros(tree_mask.shape, dtype="int32")
+  if not seeds or not tree_mask.any():
+    return labels
+  seed_rows = np.array([seed[0] for seed in seeds], dtype="int64")
+  seed_cols = np.array([seed[1] for seed in seeds], dtype="int64")
+  cell_width, cell_height = info["cell_width"], info["cell_height"]
+
+  if distance_transform_edt is not None:
+    # Index of the nearest seed cell for every cell in one distance transform
+    seed_map = np.zeros(tree_mask.shape, dtype="int32")
+    seed_map[seed_rows, seed_cols] = np.arange(1, len(seeds) + 1)
+    nearest_rows, nearest_cols = distance_transform_edt(seed_map == 0, sampling=(cell_height, cell_width),
+                                                        return_distances=False, return_indices=True)
+    labels[tree_mask] = seed_map[nearest_rows[tree_mask], nearest_cols[tree_mask]]
+    return labels
+
+  # Without scipy: nearest seed for blocks of tree cells at a time
+  rows, cols = np.nonzero(tree_mask)
+  seed_y = seed_rows * cell_height
+  seed_x = seed_cols * cell_width
+  block = max(1, 4000000 // len(seeds))
+  for start in range(0, rows.size, block):
+    r = rows[start:start + block]
+    c = cols[start:start + block]
+    distance = (r[:, None] * cell_height - seed_y) ** 2 + (c[:, None] * cell_width - seed_x) ** 2
+    labels[r, c] = np.argmin(distance, axis=1) + 1
+  return labels
+
+def crownStats(labels, tree_heights, count, info):
+  # Per-crown statistics as arrays indexed by crown id (index 0 is unused):
+  # max_height, min_height (lowest tree height in the crown, as the zonal
+  # minimum was) and area in square map units.
+  labels = np.asarray(labels).ravel()
+  heights = np.asarray(tree_heights, dtype="float64").ravel()
+  stats = {
+    "max_height": np.full(count + 1, np.nan),
+    "min_height": np.full(count + 1, np.nan),
+    "area": np.bincount(labels, minlength=count + 1)[:count + 1] * info["cell_width"] * info["cell_height"]
+  }
+  stats["area"][0] = 0
+  keep = labels > 0
+  labels = labels[keep]
+  heights = heights[keep]
+  if labels.size == 0:
+    return stats
+
+  order = np.argsort(labels, kind="mergesort")
+  labels = labels[order]
+  heights = heights[order]
+  starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+  stats["max_height"][labels[starts]] = np.fmax.reduceat(heights, starts)
+  stats["min_height"][labels[starts]] = np.fmin.reduceat(heights, starts)
+  return stats
+
+def crownProfiles(labels, heights, count, bin_size=1):
+  # Vertical profile of every crown in one grouped histogram: profiles[crown, bin]
+  # is the number of cells (or points) of the crown with a height in
+  # [bin * bin_size, (bin + 1) * bin_size). labels and heights can be rasters or
+  # per-point arrays; heights <= 0 or NaN are ignored.
+  labels = np.asarray(labels).ravel()
+  heights = np.asarray(heights, dtype="float64").ravel()
+  keep = (labels > 0) & (labels <= count) & (heights > 0)
+  labels = labels[keep]
+  bins = np.floor(heights[keep] / bin_size).astype("int64")
+  bin_count = int(bins.max()) + 1 if bins.size else 1
+  profiles = np.bincount(labels * bin_count + bins, minlength=(count + 1) * bin_count)
+  return profiles.reshape(count + 1, bin_count)
+
+def profileStats(profiles, bin_size=1, ladder_min=0, min_density=0.1):
+  # Per-crown canopy base height, ladder fuel presence and a canopy bulk density
+  # proxy from the crown profiles, as arrays indexed by crown id.
+  #   canopy bins:  bins holding at least min_density of the crown's densest bin
+  #   cbh:          bottom of the canopy bins running unbroken down from the crown top
+  #   ladder:       1 if there is vegetation between ladder_min and the cbh, or the
+  #                 canopy reaches down to ladder_min
+  #   cbd:          share of the crown's returns in the canopy, per unit canopy depth
+  bin_count = profiles.shape[1]
+  index = np.arange(bin_count)
+  total = profiles.sum(axis=1)
+  canopy = (profiles > 0) & (profiles >= min_density * profiles.max(axis=1)[:, None])
+  canopy_top = np.where(canopy, index, -1).max(axis=1)
+
+  gaps = ~canopy & (index < canopy_top[:, None])
+  cbh_bin = np.where(gaps, index, -1).max(axis=1) + 1
+  top_bin = np.where(profiles > 0, index, -1).max(axis=1) + 1
+  cbh = cbh_bin * float(bin_size)
+  depth = (top_bin - cbh_bin) * float(bin_size)
+
+  below = (index * bin_size >= ladder_min) & (index < cbh_bin[:, None])
+  ladder = ((profiles * below).sum(axis=1) > 0) | (cbh <= ladder_min)
+
+  in_canopy = canopy & (index >= cbh_bin[:, None])
+  with np.errstate(divide="ignore", invalid="ignore"):
+    cbd = (profiles * in_canopy).sum(axis=1) / total.astype("float64") / depth
+
+  empty = total == 0
+  cbh[empty] = np.nan
+  cbd[empty | (depth == 0)] = np.nan
+  ladder = ladder.astype("int32")
+  ladder[empty] = 0
+  return {"cbh": cbh, "ladder": ladder, "cbd": cbd}
+
+def crownRaster(labels, values):
+  # Raster of a per-crown statistic (NaN outside the crowns)
+  values = np.asarray(values, dtype="float32").copy()
+  values[0] = np.nan
+  return values[labels]
+
+def writeCrowns(labels, info, output, spatial_reference):
+  # Crown id raster (0 = not a tree)
+  return arrayToRaster(labels.astype("int32"), info, output, 0, spatial_reference)
+
+def updateSeeds(output, stats, fields):
+  # Writes per-crown statistics to the canopy centroids by treeID
+  existing = [f.name for f in arcpy.ListFields(output)]
+  for field in fields:
+    if field not in existing:
+      arcpy.AddField_management(output, field, "FLOAT")
+  with arcpy.da.UpdateCursor(output, ["treeID"] + fields) as cursor:
+    for row in cursor:
+      tree_id = row[0]
+      if tree_id is None or tree_id >= len(stats[fields[0]]):
+        continue
+      cursor.updateRow([tree_id] + [float(stats[field][tree_id]) for field in fields])
+  return output
+
+def writeSeeds(seeds, info, output, spatial_reference, stats=None):
+  # Tree tops as points at cell centres with treeID (crown id), Exist = 1 and
+  # their height. With crown stats, the crown area and min_height are added
+  # too (cbh is left to the profile stats, see updateSeeds).
+  folder, name = os.path.split(output)
+  arcpy.CreateFeatureclass_management(folder, name, "POINT", "", "", "", spatial_reference)
+  fields = ["treeID", "Exist", "height"]
+  arcpy.AddField_management(output, "treeID", "INTEGER")
+  arcpy.AddField_management(output, "Exist", "INTEGER")
+  arcpy.AddField_management(output, "height", "FLOAT")
+  if stats is not None:
+    fields += ["area", "min_height"]
+    arcpy.AddField_management(output, "area", "FLOAT")
+    arcpy.AddField_management(output, "min_height", "FLOAT")
+  with arcpy.da.InsertCursor(output, ["SHAPE@XY"] + fields) as cursor:
+    for tree_id, (r, c, height) in enumerate(seeds, 1):
+      x = info["x_min"] + (c + 0.5) * info["cell_width"]
+      y = info["y_max"] - (r + 0.5) * info["cell_height"]
+      row = [(x, y), tree_id, 1, float(height)]
+      if stats is not None:
+        row += [float(stats["area"][tree_id]), float(stats["min_height"][tree_id])]
+      cursor.insertRow(row)
+  return output
@@ -22,16 +22,21 @@ date = "genCanopyChar"
 # Geographic
 projection = "UTMZ10"  #["UTMZ10", "UTMZ11", "SPIII", "SPIV"]
 max_height = 350
+spike_height = 50            # Cells this much higher than all of their neighbours are removed as birds (None = off)
 
 # Inputs
 input_lidar = "tahoe_plot_1.lasd"
 first_pulse_classes = [1]
 last_pulse_classes = [2]
+input_las = ""               # Folder of .las/.laz tiles in Inputs, read directly instead of input_lidar ("" = use input_lidar)
+first_pulse_returns = []     # Return numbers and/or "FIRST"/"LAST" ([] = all returns), LAS tiles only
+last_pulse_returns = []
 
 #
 cell_size = 1
 find_surfaces = "No"
 classify_segmented ="No"
+tree_polygons = "No"         # Also write the tree patches as trees.shp
 find_canopies = "No"
 find_cbh = "Yes"
 #-----------------------------------------------
@@ -47,9 +52,15 @@ import arcpy
 import os
 import sys
 import shutil
+import numpy as np
 from arcpy import env
 from arcpy.sa import *
 from tableJoin import one_to_one_join
+from rasterArrays import rasterToArray, arrayToRaster, alignToGrid
+from lasLib import lasFiles, lasBounds, gridInfo, lasSurfaces
+from surfaceLib import surfaceHeights, spikeMask, fillVoids
+from canopyLib import (height_classes, heightClasses, patchLabels, writeTrees, canopySeeds, crownLabels,
+                       crownStats, crownProfiles, profileStats, crownRaster, writeCrowns, writeSeeds, updateSeeds)
 
 # Overwrite Setting
 arcpy.env.overwriteOutput = True
@@ -70,6 +81,10 @@ folder_structure = [
 
 # Dependent scripts
 dependent_scripts = [
+  "rasterArrays.py",
+  "canopyLib.py",
+  "lasLib.py",
+  "surfaceLib.py"
 ]
 
 # Create new project folder and set environment
@@ -151,11 +166,13 @@ heights = os.path.join(outputs,"heights.tif")
 tree_heights = os.path.join(outputs, "tree_hts.tif")
 area_heights = os.path.join(outputs, "area_heights.tif")
 trees = os.path.join(outputs, "trees.shp")
+cover = os.path.join(outputs, "cover.tif")
+tree_patches = os.path.join(outputs, "tree_patches.tif")
 existing_canopy_centroids = os.path.join(outputs, "canopy_cntrs.shp")
-tree_thiessen = os.path.join(outputs, "treeThiessen.shp")
-canopy_stack = os.path.join(outputs, "canopy_stack.shp")
+tree_crowns = os.path.join(outputs, "tree_crowns.tif")
 cbh_rast = os.path.join(outputs, "cbh_rast.tif")
-cbh_stack = os.path.join(outputs, "cbh_stack.shp")
+ladder_rast = os.path.join(outputs, "ladder_rast.tif")
+cbd_rast = os.path.join(outputs, "cbd_rast.tif")
 #-----------------------------------------------
 #-----------------------------------------------
 
@@ -199,73 +216,71 @@ elif projection == "SPIV":
 #-----------------------------------------------
 #-----------------------------------------------
 def findSurfaces(dem, dsm, heights):
-  # Create First Pulse lasd
-  arcpy.MakeLasDatasetLayer_management(lidar, first_pulse, first_pulse_classes)
-
-  text = "First Pulses separated."
-  generateMessage(text)
-
-  # Create Last Pulse lasd
-  arcpy.MakeLasDatasetLayer_management(lidar, last_pulse, last_pulse_classes)
-  text = "Last Pulses separated."
-  generateMessage(text)
-  #-----------------------------------------------
-  #-----------------------------------------------
-
-  #-----------------------------------------------
-  #-----------------------------------------------
-  # Create DEM
-  arcpy.LasDatasetToRaster_conversion(last_pulse, dem, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
-  text = "Digital Elevation Model created."
-  generateMessage(text)
-
-  # Create DSM
-  temp = os.path.join(scratchgdb,"temp")
-
-  arcpy.LasDatasetToRaster_conversion(first_pulse, temp, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "1")
-  this = Con(IsNull(Float(temp)),Float(dem),Float(temp))
-  this.save(dsm)
-  text = "Digital Surface Model created."
-  generateMessage(text)
+  las_files = []
+  if input_las:
+    las_files = lasFiles(os.path.join(inputs, input_las))
+
+  if las_files:
+    # Stream the points once and bin the DEM and DSM together
+    text = "Reading "+str(len(las_files))+" LAS files."
+    generateMessage(text)
+
+    info = gridInfo(lasBounds(las_files), cell_size)
+    dem_array, dsm_array = lasSurfaces(las_files, info, last_pulse_classes, first_pulse_classes,
+                                       last_pulse_returns, first_pulse_returns)
+    arrayToRaster(dem_array, info, dem, projection=projection)
+    text = "Digital Elevation Model created."
+    generateMessage(text)
+
+    arrayToRaster(dsm_array, info, dsm, projection=projection)
+    text = "Digital Surface Model created."
+    generateMessage(text)
+
+  else:
+    # Create First Pulse lasd
+    arcpy.MakeLasDatasetLayer_management(lidar, first_pulse, first_pulse_classes)
+
+    text = "First Pulses separated."
+    generateMessage(text)
+
+    # Create Last Pulse lasd
+    arcpy.MakeLasDatasetLayer_management(lidar, last_pulse, last_pulse_classes)
+    text = "Last Pulses separated."
+    generateMessage(text)
+
+    # Create DEM
+    arcpy.LasDatasetToRaster_conversion(last_pulse, dem, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
+    text = "Digital Elevation Model created."
+    generateMessage(text)
+
+    # Create DSM
+    temp = os.path.join(scratchgdb,"temp")
+
+    arcpy.LasDatasetToRaster_conversion(first_pulse, temp, "ELEVATION", "BINNING MAXIMUM SIMPLE", "FLOAT", "CELLSIZE", cell_size, "1")
+    this = Con(IsNull(Float(temp)),Float(dem),Float(temp))
+    this.save(dsm)
+    text = "Digital Surface Model created."
+    generateMessage(text)
 
   # Create Heights
-  no_clip_heights = os.path.join(scratchgdb,"no_clip_heights")
-  hts_interm1 = os.path.join(scratchgdb,"hts_interm1")
-  hts_interm2 = os.path.join(scratchgdb,"hts_interm2")
-
-
-  this = Float(dsm)-Float(dem)  #Equation for heights
-  this = Con(IsNull(Float(this)), 0, Float(this))    # Make any null value the ground
-  this = Con(Float(this) < 0, 0, Float(this))    # Make any negative value the ground
-  this = SetNull(Float(this),Float(this),"VALUE > "+str(max_height))  # Set maximum height to remove flying birds
-  if int(arcpy.GetRasterProperties_management(this,"ANYNODATA").getOutput(0)):
-      
-      text = "Removing points reflected by birds."
-      generateMessage(text)
-      
-      cloudrast = os.path.join(scratchgdb,"cloudrast")
-      cloudpts = os.path.join(scratchgdb,"cloudpts")
-      cloudpts_buf30 = os.path.join(scratchgdb,"cloudptsbuf30")
-      interppts = os.path.join(scratchgdb,"interppts")
-      NNinterp = os.path.join(scratchgdb,"NNinterp")
-      
-      heights.save(hts_interm1)
-      heights.save(hts_interm2)
-      del heights
-      
-      arcpy.gp.Reclassify_sa(hts_interm1, "VALUE", "-10000 10000 NODATA;NODATA 1", cloudrast, "DATA")
-      
-      arcpy.RasterToPoint_conversion(cloudrast,cloudpts,"VALUE")
-      
-      arcpy.Buffer_analysis(cloudpts, cloudpts_buf30, "30 Feet", "FULL", "ROUND", "ALL", "", "PLANAR")
-      nocloudmask = ExtractByMask(hts_interm2,cloudpts_buf30)
-      
-      arcpy.RasterToPoint_conversion(nocloudmask, interppts,"")
-      
-      arcpy.gp.NaturalNeighbor_sa(interppts, "grid_code", NNinterp, hts_interm2)
-      arcpy.MosaicToNewRaster_management(hts_interm2+";"+NNinterp,scratchfolder, no_clip_heights, "", "32_BIT_FLOAT", "", "1", "FIRST", "FIRST")
-
-  this.save(heights)  
+  dem_array, info = rasterToArray(dem)
+  dsm_array, dsm_info = rasterToArray(dsm)
+  dsm_array = alignToGrid(dsm_array, dsm_info, info)
+  heights_array = surfaceHeights(dem_array, dsm_array)
+
+  # Remove cells above the maximum height (flying birds) or spiking above all their neighbours
+  spikes = spikeMask(heights_array, max_height, spike_height)
+  if spikes.any():
+    text = "Removing points reflected by birds."
+    generateMessage(text)
+    # Spikes are filled from cells up to 30 feet away
+    if unit == "Meters":
+      fill_distance = 9.144
+    elif unit == "Feet":
+      fill_distance = 30
+    heights_array = fillVoids(heights_array, spikes, fill_distance, info["cell_width"])
+
+  arrayToRaster(heights_array, info, heights, projection=projection)
   text = "Heights created."
   generateMessage(text) 
 
@@ -283,38 +298,23 @@ def classifySegments():
   text = "Classifying heights into vegetation types."
   generateMessage(text)
 
-  cover = os.path.join(scratchgdb, "cover")
-  temp_tree = os.path.join(scratchgdb, "temp_tree")
-
-  def classify(unit):
-    if unit == "Meters":
-      ground_threshold = 0
-      grass_threshold = 0.6096
-      shrub_threshold = 1.8288
-      tree_threshold = 1.8288
-    elif unit == "Feet":
-      ground_threshold = 0
-      grass_threshold = 2
-      shrub_threshold = 6
-      tree_threshold = 6 
-    return("def classify(x):\\n"+
-           "  if x < "+str(ground_threshold)+":\\n"+
-           "    return \"ground\"\\n"+
-           "  elif x < "+str(grass_threshold)+":\\n"+
-           "    return \"grass\"\\n"+
-           "  elif x < "+str(shrub_threshold)+":\\n"+
-           "    return \"shrub\"\\n"+
-           "  elif x >= "+str(shrub_threshold)+":\\n"+
-           "    return \"tree\""
-          )
-
   this = Int(heights)
   this.save(area_heights)
-  arcpy.RasterToPolygon_conversion(area_heights, cover, "NO_SIMPLIFY", "VALUE")
-  arcpy.AddField_management(cover, "veg", "STRING")
-  arcpy.CalculateField_management(cover, "veg", "classify(!gridcode!)", "PYTHON_9.3", classify(unit))
-  arcpy.Select_analysis (cover, temp_tree, "veg = 'tree'")
-  arcpy.Dissolve_management(temp_tree, trees,"veg", "", "MULTI_PART")
+
+  heights_array, info = rasterToArray(heights)
+  classes = heightClasses(heights_array, unit)
+  arrayToRaster(classes, info, cover, 255, projection)
+
+  text = "Finding connected tree patches."
+  generateMessage(text)
+  patches, count = patchLabels(classes == height_classes.index("tree"))
+  arrayToRaster(patches, info, tree_patches, 0, projection)
+  text = str(count)+" tree patches found."
+  generateMessage(text)
+
+  if tree_polygons == "Yes":
+    writeTrees(patches, info, trees, projection, scratchgdb)
+
 if classify_segmented == "Yes":
   classifySegments()
 #-----------------------------------------------
@@ -322,270 +322,90 @@ if classify_segmented == "Yes":
 
 #-----------------------------------------------
 #-----------------------------------------------
-def findCanopy(canopy_stack, tree_thiessen):
+def findCanopy(tree_crowns):
 
   text = "Finding canopies."
   generateMessage(text)
 
   # Create raster of vegetation heights
-  thiessen = os.path.join(scratchgdb, "thiessen")
-  temp = os.path.join(scratchgdb, "temp")
-
-  this = ExtractByMask(area_heights, trees)
+  this = ExtractByMask(area_heights, tree_patches)
   this.save(tree_heights)
 
-  # Parameters
-  this = Raster(tree_heights)
-  max_canopy_height = Int(this.maximum)
-  max_base_height = max_canopy_height
-  incr = -1
-  i = 0
-  
-  canopy_lst = []
-  
-
-  text = "Making horizontal slices (in "+unit+"):"
+  # Sweep all height slices (top down) and seed each new canopy at its tree top
+  text = "Making horizontal slices (in "+unit+")."
   generateMessage(text)
-  while max_canopy_height > 0:
-      upper = max_canopy_height
-      max_canopy_height += incr
-      lower = max_canopy_height
-      if lower < 0:
-        lower = 0
-
-      ht_slice = os.path.join(scratchgdb, "slice_"+str(upper))
-      canopy_select = os.path.join(scratchgdb, "canopy_select")
-      slice_sms = os.path.join(outputs, "slice_sms.tif")
-      slice_poly = os.path.join(scratchgdb, "slice_poly_"+str(upper))
-      canopies = os.path.join(scratchgdb, "canopies_"+str(upper))
-      new_canopies = os.path.join(scratchgdb, "new_canopies")
-      new_canopy_centroids = os.path.join(scratchgdb, "new_canopy_cntr")
-      existing_canopy_centroids = os.path.join(scratchgdb, "existing_canopy_cntr")
-      
-      existing_canopies = os.path.join(scratchgdb, "existing_canopies")
-      temp = os.path.join(scratchgdb, "temp_"+str(count))
-      
-      #create slice
-      if count < 10:
-        if len(str(upper)) == 1 and len(str(lower)) == 1:
-          text = "[0"+str(upper)+", 0"+str(lower)+"]     /\\"  
-        elif upper <= 6:
-          text = "[0"+str(upper)+", 0"+str(lower)+"]     ||"
-        elif len(str(lower)) == 1:
-          text = "["+str(upper)+", 0"+str(lower)+"]     /\\"
-        elif len(str(upper)) == 1:
-          text = "[0"+str(upper)+", "+str(lower)+"]     /\\"  
-        else:
-          text = "["+str(upper)+", "+str(lower)+"]     /\\"
-
-      else:  
-        if len(str(upper)) == 1 and len(str(lower)) == 1:
-          text = "[0"+str(upper)+", 0"+str(lower)+"]    /\\"  
-        elif upper <= 6:
-          text = "[0"+str(upper)+", 0"+str(lower)+"]    ||"
-        elif len(str(lower)) == 1:
-          text = "["+str(upper)+", 0"+str(lower)+"]  ///\\\\"
-        elif len(str(upper)) == 1:
-          text = "[0"+str(upper)+", "+str(lower)+"]    /\\"  
-        else:
-          text = "["+str(upper)+", "+str(lower)+"]    /\\"
-      generateMessage(text)
-
-      vert_max = Con(Int(tree_heights)>= upper, upper, Int(tree_heights))
-      vert_min = Con(Int(vert_max) <= lower, 0, Int(vert_max))
-      vert_min.save(ht_slice)
-      
-      #convert slice to polygons and extract canopies
-     
-      arcpy.RasterToPolygon_conversion(ht_slice, slice_poly, "NO_SIMPLIFY", "VALUE")
-      arcpy.Select_analysis (slice_poly, canopy_select, "gridcode <> 0")
-      arcpy.Dissolve_management(canopy_select, canopies, "", "", "SINGLE_PART")
-      arcpy.AddField_management(canopies, "h", "INTEGER")
-      arcpy.CalculateField_management(canopies, "h", 1)
-      canopy_lst.append(canopies)
-      
-
-      #join previous centroids to canopy polygons
-      if i > 0:
-        arcpy.SpatialJoin_analysis(canopies, existing_canopy_centroids, existing_canopies,  "JOIN_ONE_TO_ONE")
-        where_clause = "Exist IS NULL AND Shape_Length > 14"
-        arcpy.Select_analysis(existing_canopies, new_canopies, where_clause)
-
-        #create new canopy centroids
-        arcpy.FeatureToPoint_management(new_canopies, new_canopy_centroids, "INSIDE")
-        arcpy.AddField_management(new_canopy_centroids, "Exist", "INTEGER")
-        arcpy.CalculateField_management(new_canopy_centroids, "Exist", 1)
-        
-        new_cntr_fields = [f.name for f in arcpy.ListFields(new_canopy_centroids)]
-        delete_fields = []
-        for field in new_cntr_fields:
-          if field not in ex_cntr_fields:
-            arcpy.DeleteField_management(new_canopy_centroids, field)
-        
-        arcpy.Append_management(new_canopy_centroids, existing_canopy_centroids, "TEST")
-          
-      else:
-        new_canopies = canopies
-    
-        #create new canopy centroids
-        arcpy.FeatureToPoint_management(new_canopies, existing_canopy_centroids, "INSIDE")
-        arcpy.AddField_management(existing_canopy_centroids, "Exist", "INTEGER")
-        arcpy.CalculateField_management(existing_canopy_centroids, "Exist", 1)
-        ex_cntr_fields = [f.name for f in arcpy.ListFields(existing_canopy_centroids)]
-
-      i += 1
-
-  text = "Creating Thiessen polygons from canopy centroids."
-  generateMessage(text)
-  arcpy.CreateThiessenPolygons_analysis(existing_canopy_centroids, thiessen)
 
-  text = "Clipping Thiessen polygons by tree boundary."
+  heights_array, heights_info = rasterToArray(tree_heights)
+  seeds = canopySeeds(heights_array, 1)
+
+  text = str(len(seeds))+" canopies found."
   generateMessage(text)
 
-  arcpy.Clip_analysis (thiessen, trees, tree_thiessen)
-  arcpy.AddField_management(tree_thiessen, "treeID", "INTEGER")
-  arcpy.CalculateField_management(canopy_stack, "treeID", "[FID]+1")
-
-
-  arcpy.Union_analysis (canopy_lst, canopy_stack)
-  stack_fields = [f.name for f in arcpy.ListFields(canopy_stack)]
-  sum_fields = []
-  for field in stack_fields:
-    if field[0] == "h":
-      sum_fields.append(field)
-  calc = ""
-  for field in sum_fields:
-    calc+="["+field+"]+"
-  fxn = calc[:-1]
-  arcpy.AddField_management(canopy_stack, "tot", "INTEGER")
-  arcpy.CalculateField_management(canopy_stack, "tot", fxn)
-  for field in stack_fields:
-    if field[0] == "h" or field[0] == "F":
-      arcpy.DeleteField_management(canopy_stack, field)
-  #arcpy.Union_analysis ([canopy_stack, tree_thiessen], tree_inventory)
+  text = "Partitioning tree cells into crowns by nearest canopy centroid."
+  generateMessage(text)
+  labels = crownLabels(~np.isnan(heights_array), seeds, heights_info)
+  stats = crownStats(labels, heights_array, len(seeds), heights_info)
+  writeCrowns(labels, heights_info, tree_crowns, projection)
+  writeSeeds(seeds, heights_info, existing_canopy_centroids, projection, stats)
 
 if find_canopies == "Yes":
-  findCanopy(canopy_stack, tree_thiessen)
+  findCanopy(tree_crowns)
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-def findCanopyBaseHeight(lidar, tree_heights, tree_thiessen, canopy_stack, cbh_rast):
-  zonal_cbh = os.path.join(scratchgdb, "zonal_cbh")
-
-  #tree_thiessen = os.path.join(outputs, "test_treeThiessen.shp")
-
-  text = "Finding canopy base height for each tree."
-  generateMessage(text)
+def findCanopyBaseHeight(lidar, tree_heights, tree_crowns, cbh_rast):
+  ladder_fuels = os.path.join(inputs, "ladder_fuels.lasd")
+  ladders = os.path.join(outputs, "ladders.tif")
+  ladder_heights = os.path.join(outputs, "ladder_heights.tif")
+  fuels = os.path.join(inputs, "test_Fuels.lasd")
 
-  z_stat = ZonalStatisticsAsTable(tree_thiessen, "treeID", tree_heights, zonal_cbh, "NODATA", "MINIMUM")
-  arcpy.AddField_management(zonal_cbh, "cbh", "FLOAT")
-  arcpy.CalculateField_management(zonal_cbh, "cbh", "[MIN]")
-  one_to_one_join(tree_thiessen, zonal_cbh, "cbh", "FLOAT")
+  # Ladder fuels start above grass height
+  if unit == "Meters":
+    ladder_min = 0.6096
+  elif unit == "Feet":
+    ladder_min = 2
 
+  labels, crown_info = rasterToArray(tree_crowns, "float64")
+  labels = np.where(np.isnan(labels), 0, labels).astype("int64")
+  heights_array, heights_info = rasterToArray(tree_heights)
+  samples = [alignToGrid(heights_array, heights_info, crown_info)]
 
-  text = "Creating canopy base height raster."
+  #arcpy.MakeLasDatasetLayer_management(fuels, ladder_fuels, [3])
+  #arcpy.LasDatasetToRaster_conversion(ladder_fuels, ladders, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
+  if arcpy.Exists(ladders):
+    text = "Creating fuels ladder raster."
+    generateMessage(text)
+
+    this = Float(ladders)-Float(dem)  #Equation for heights
+    this = Con(IsNull(Float(this)), 0, Float(this))    # Make any null value the ground
+    this = Con(Float(this) < 0, 0, Float(this))    # Make any negative value the groun
+    this.save(ladder_heights)
+    ladder_array, ladder_info = rasterToArray(ladder_heights)
+    samples.append(alignToGrid(ladder_array, ladder_info, crown_info))
+
+  text = "Finding canopy base height, ladder fuels and canopy density for each tree."
   generateMessage(text)
 
-  arcpy.PolygonToRaster_conversion(tree_thiessen, "cbh", cbh_rast, "CELL_CENTER", "", cell_size)
-
-  
-  boundary = os.path.join(outputs, "canopy_bnd.shp")
+  # One vertical profile per crown (1 unit bins) from all height samples
+  count = int(labels.max())
+  sample_labels = np.concatenate([labels.ravel()] * len(samples))
+  sample_heights = np.concatenate([sample.ravel() for sample in samples])
+  profiles = crownProfiles(sample_labels, sample_heights, count, 1)
+  stats = profileStats(profiles, 1, ladder_min)
 
-  this = Raster(tree_heights)
-  max_canopy_height = Int(this.maximum)
-  for i in range(max_canopy_height):
-    field = "treeID"
-    where_clause = "cbh = "+str(i)
-
-    ladder_fuels = os.path.join(inputs, "ladder_fuels.lasd")
-    ladders = os.path.join(outputs, "ladders.tif")
-    ladder_heights = os.path.join(outputs, "ladder_heights.tif")
-
-    #arcpy.Select_analysis(tree_thiessen, boundary, where_clause)
-    #if arcpy.management.GetCount(boundary)[0] != "0":
-    #  text = "Classifying ladder fuels for trees with a by cbh of "+str(i)+"."
-    #  generateMessage(text)
-
-      # Process: Classify LAS By Height
-    #  arcpy.ClassifyLasByHeight_3d(lidar, "GROUND", "3 "+str(i), "NONE", "COMPUTE_STATS", boundary, "PROCESS_EXTENT", boundary)
-
-  fuels = os.path.join(inputs, "test_Fuels.lasd")
-  #arcpy.MakeLasDatasetLayer_management(fuels, ladder_fuels, [3])
-
-  text = "Creating fuels ladder raster."
+  text = "Creating canopy base height, ladder fuel and canopy density rasters."
   generateMessage(text)
-  #arcpy.LasDatasetToRaster_conversion(ladder_fuels, ladders, "ELEVATION", "BINNING AVERAGE NATURAL_NEIGHBOR", "FLOAT", "CELLSIZE", cell_size, "1")
-  this = Float(ladders)-Float(dem)  #Equation for heights
-  this = Con(IsNull(Float(this)), 0, Float(this))    # Make any null value the ground
-  this = Con(Float(this) < 0, 0, Float(this))    # Make any negative value the groun
-  this.save(ladder_heights)
 
-  # Create raster of vegetation heights
-  thiessen = os.path.join(scratchgdb, "thiessen")
-  temp = os.path.join(scratchgdb, "temp")
-
-  # Parameters
-  this = Raster(ladder_heights)
-  max_base_height = Int(this.maximum)
-  incr = -1
-  i = 0
-  
-  cbh_lst = []
-  
-  text = "Making horizontal slices (in "+unit+"):"
-  generateMessage(text)
-  while max_base_height > -1:
-      upper = max_base_height
-      max_base_height += incr
-      lower = max_base_height
-      if lower < 0:
-        lower = 0
-
-      ht_slice = os.path.join(scratchgdb, "cbh_slice_"+str(upper))
-      cbh_select = os.path.join(scratchgdb, "cbh_select")
-      slice_poly = os.path.join(scratchgdb, "cbh_slice_poly_"+str(upper))
-      understory = os.path.join(scratchgdb, "understory_"+str(upper))
-      
-      #create slice
-      text = "[0"+str(upper)+", 0"+str(lower)+"]"  
-      generateMessage(text)
-
-      vert_max = Con(Int(ladder_heights)>= upper, upper, Int(ladder_heights))
-      vert_min = Con(Int(vert_max) <= lower, 0, Int(vert_max))
-      vert_min.save(ht_slice)
-      
-      #convert slice to polygons and extract canopies
-     
-      arcpy.RasterToPolygon_conversion(ht_slice, slice_poly, "NO_SIMPLIFY", "VALUE")
-      arcpy.Select_analysis (slice_poly, cbh_select, "gridcode <> 0")
-      arcpy.Dissolve_management(cbh_select, understory, "", "", "SINGLE_PART")
-      arcpy.AddField_management(understory, "h", "INTEGER")
-      arcpy.CalculateField_management(understory, "h", 1)
-      cbh_lst.append(understory)
-
-      i += 1
-
-  arcpy.Union_analysis (cbh_lst, cbh_stack)
-  stack_fields = [f.name for f in arcpy.ListFields(cbh_stack)]
-  sum_fields = []
-  for field in stack_fields:
-    if field[0] == "h":
-      sum_fields.append(field)
-  calc = ""
-  for field in sum_fields:
-    calc+="["+field+"]+"
-  fxn = calc[:-1]
-  arcpy.AddField_management(cbh_stack, "tot", "INTEGER")
-  arcpy.CalculateField_management(cbh_stack, "tot", fxn)
-  for field in stack_fields:
-    if field[0] == "h" or field[0] == "F" and field != "FID" or field[0] == "S" and field != "Shape":
-      arcpy.DeleteField_management(cbh_stack, field)
-  #arcpy.Union_analysis ([canopy_stack, tree_thiessen], tree_inventory)
+  arrayToRaster(crownRaster(labels, stats["cbh"]), crown_info, cbh_rast, projection=projection)
+  arrayToRaster(crownRaster(labels, stats["ladder"]), crown_info, ladder_rast, projection=projection)
+  arrayToRaster(crownRaster(labels, stats["cbd"]), crown_info, cbd_rast, projection=projection)
+  if arcpy.Exists(existing_canopy_centroids):
+    updateSeeds(existing_canopy_centroids, stats, ["cbh", "ladder", "cbd"])
 
 if find_cbh == "Yes":
-  findCanopyBaseHeight(lidar, tree_heights, tree_thiessen, canopy_stack, cbh_rast)
+  findCanopyBaseHeight(lidar, tree_heights, tree_crowns, cbh_rast)
   # text = "Canopy base heights found."
   # generateMessage(text)
 
@@ -0,0 +1,374 @@
+#-------------------------------------------------------------------------------
+# Name:        lasLib Tool
+# Purpose:     Reads LAS point records straight from the files, in chunks of a
+#              memory-mapped record array, and bins them into DEM/DSM grids
+#              without LAS dataset layers or LasDatasetToRaster. Points are
+#              filtered by return number and classification as they stream
+#              past, so a tile is never held in memory as a whole. Needs only
+#              NumPy (laspy is used for .laz files when it is installed).
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import os
+import struct
+import sys
+import numpy as np
+
+try:
+  import laspy
+except ImportError:
+  laspy = None
+
+try:
+  from scipy.ndimage import distance_transform_edt
+except ImportError:
+  distance_transform_edt = None
+
+# Points read per chunk
+chunk_size = 2000000
+
+
+def lasFiles(folder):
+  # .las/.laz files in a folder, sorted
+  if not os.path.isdir(folder):
+    return []
+  return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                if os.path.splitext(f)[1].lower() in [".las", ".laz"])
+
+def lasHeader(las_file):
+  # Public header block fields needed to read and place the points
+  with open(las_file, "rb") as f:
+    header = f.read(375)
+  if header[:4] != b"LASF":
+    raise ValueError(las_file + " is not a LAS file.")
+  version = (ord(header[24:25]), ord(header[25:26]))
+  point_format = ord(header[104:105])
+  info = {
+    "version": version,
+    "point_offset": struct.unpack("<I", header[96:100])[0],
+    "point_format": point_format & 0x3F,
+    "compressed": bool(point_format & 0xC0),
+    "record_length": struct.unpack("<H", header[105:107])[0],
+    "count": struct.unpack("<I", header[107:111])[0],
+    "scale": struct.unpack("<3d", header[131:155]),
+    "offset": struct.unpack("<3d", header[155:179])
+  }
+  x_max, x_min, y_max, y_min, z_max, z_min = struct.unpack("<6d", header[179:227])
+  info["bounds"] = (x_min, y_min, x_max, y_max)
+  info["z_range"] = (z_min, z_max)
+  if version >= (1, 4) and info["count"] == 0:
+    info["count"] = struct.unpack("<Q", header[247:255])[0]
+  return info
+
+def recordType(point_format, record_length):
+  # Structured dtype over the fields used here; the rest of the record is skipped
+  # (formats 6-10 have a flags byte before the classification)
+  names = ["X", "Y", "Z", "intensity", "returns", "classification"]
+  formats = ["<i4", "<i4", "<i4", "<u2", "u1", "u1"]
+  offsets = [0, 4, 8, 12, 14, 15 if point_format < 6 else 16]
+  return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": record_length})
+
+def lasChunks(las_file, size=None):
+  # Yields point chunks as {x, y, z, intensity, return_number, number_of_returns,
+  # classification} arrays
+  if size is None:
+    size = chunk_size
+  header = lasHeader(las_file)
+  if header["compressed"] or las_file.lower().endswith(".laz"):
+    for chunk in lazChunks(las_file, size):
+      yield chunk
+    return
+
+  records = np.memmap(las_file, dtype=recordType(header["point_format"], header["record_length"]),
+                      mode="r", offset=header["point_offset"], shape=(header["count"],))
+  (x_scale, y_scale, z_scale), (x_offset, y_offset, z_offset) = header["scale"], header["offset"]
+  legacy = header["point_format"] < 6
+  for start in range(0, header["count"], size):
+    chunk = records[start:start + size]
+    returns = chunk["returns"]
+    if legacy:
+      return_number = returns & 0x07
+      number_of_returns = (returns >> 3) & 0x07
+      classification = chunk["classification"] & 0x1F
+    else:
+      return_number = returns & 0x0F
+      number_of_returns = (returns >> 4) & 0x0F
+      classification = chunk["classification"]
+    yield {
+      "x": chunk["X"] * x_scale + x_offset,
+      "y": chunk["Y"] * y_scale + y_offset,
+      "z": chunk["Z"] * z_scale + z_offset,
+      "intensity": np.asarray(chunk["intensity"]),
+      "return_number": np.asarray(return_number),
+      "number_of_returns": np.asarray(number_of_returns),
+      "classification": np.asarray(classification)
+    }
+  del records
+
+def lazChunks(las_file, size):
+  # Compressed tiles cannot be memory-mapped; laspy decompresses them in chunks
+  if laspy is None:
+    raise RuntimeError("laspy is needed to read " + las_file)
+  with laspy.open(las_file) as reader:
+    for points in reader.chunk_iterator(size):
+      yield {
+        "x": np.asarray(points.x),
+        "y": np.asarray(points.y),
+        "z": np.asarray(points.z),
+        "intensity": np.asarray(points.intensity),
+        "return_number": np.asarray(points.return_number),
+        "number_of_returns": np.asarray(points.number_of_returns),
+        "classification": np.asarray(points.classification)
+      }
+
+def pointFilter(points, returns=None, classes=None):
+  # Mask of points with one of the classes and returns. returns holds return
+  # numbers and/or "FIRST"/"LAST"; None or [] keeps every point.
+  keep = np.ones(points["z"].shape, dtype=bool)
+  if classes:
+    keep &= np.isin(points["classification"], classes)
+  if returns:
+    wanted = np.zeros(keep.shape, dtype=bool)
+    for value in returns:
+      if value == "FIRST":
+        wanted |= points["return_number"] == 1
+      elif value == "LAST":
+        wanted |= points["return_number"] == points["number_of_returns"]
+      else:
+        wanted |= points["return_number"] == int(value)
+    keep &= wanted
+  return keep
+
+def lasBounds(las_files):
+  # Union of the header bounds of the files
+  bounds = [lasHeader(las_file)["bounds"] for las_file in las_files]
+  return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+          max(b[2] for b in bounds), max(b[3] for b in bounds))
+
+def gridInfo(bounds, cell_size, snap=None, spatial_reference=None):
+  # Grid covering bounds (x_min, y_min, x_max, y_max) with the info keys of
+  # rasterArrays. snap = (x, y) of any cell corner to align to (e.g. NAIP).
+  x_min, y_min, x_max, y_max = bounds
+  if snap is None:
+    snap = (x_min, y_max)
+  left = snap[0] + np.floor((x_min - snap[0]) / cell_size) * cell_size
+  top = snap[1] + np.ceil((y_max - snap[1]) / cell_size) * cell_size
+  cols = int(np.floor((x_max - left) / cell_size)) + 1
+  rows = int(np.floor((top - y_min) / cell_size)) + 1
+  return {
+    "x_min": float(left),
+    "y_min": float(top - rows * cell_size),
+    "y_max": float(top),
+    "cell_width": float(cell_size),
+    "cell_height": float(cell_size),
+    "rows": rows,
+    "cols": cols,
+    "nodata": None,
+    "spatial_reference": spatial_reference
+  }
+
+def pointCells(points, keep, info, window=None):
+  # Flat cell index of the kept points that fall on the grid, or on the
+  # window (rows, cols slices) of it. Cells are always found on the whole
+  # grid, so a point on a block edge lands in exactly one block.
+  cols = np.floor((points["x"][keep] - info["x_min"]) / info["cell_width"]).astype("int64")
+  rows = np.floor((info["y_max"] - points["y"][keep]) / info["cell_height"]).astype("int64")
+  if window is None:
+    window = (slice(0, info["rows"]), slice(0, info["cols"]))
+  row_slice, col_slice = window
+  inside = ((rows >= row_slice.start) & (rows < row_slice.stop) &
+            (cols >= col_slice.start) & (cols < col_slice.stop))
+  width = col_slice.stop - col_slice.start
+  return (rows[inside] - row_slice.start) * width + cols[inside] - col_slice.start, inside
+
+def binStart(size, stat):
+  # Empty running min/max/mean for size cells
+  if stat == "min":
+    return {"stat": stat, "values": np.full(size, np.inf)}
+  elif stat == "max":
+    return {"stat": stat, "values": np.full(size, -np.inf)}
+  elif stat == "mean":
+    return {"stat": stat, "values": np.zeros(size), "counts": np.zeros(size, dtype="int64")}
+  raise ValueError("Unknown binning statistic: " + str(stat))
+
+def binAdd(binned, cells, values):
+  # Folds one chunk of points into the running statistic
+  if binned["stat"] == "min":
+    np.minimum.at(binned["values"], cells, values)
+  elif binned["stat"] == "max":
+    np.maximum.at(binned["values"], cells, values)
+  else:
+    binned["values"] += np.bincount(cells, values, binned["values"].size)
+    binned["counts"] += np.bincount(cells, minlength=binned["values"].size)
+
+def binResult(binned, shape):
+  # float32 grid with NaN where no point landed
+  if binned["stat"] == "mean":
+    with np.errstate(divide="ignore", invalid="ignore"):
+      grid = binned["values"] / binned["counts"]
+  else:
+    grid = np.where(np.isinf(binned["values"]), np.nan, binned["values"])
+  return grid.reshape(shape).astype("float32")
+
+def binPoints(las_files, info, surfaces, window=None):
+  # Bins every file into several grids in one read pass, over the whole grid
+  # or only its window (rows, cols slices).
+  # surfaces: {name: (stat, returns, classes)}, e.g.
+  #   {"dem": ("mean", ["LAST"], [2]), "dsm": ("max", ["FIRST"], None)}
+  # Returns {name: array}.
+  if window is None:
+    shape = (info["rows"], info["cols"])
+  else:
+    shape = (window[0].stop - window[0].start, window[1].stop - window[1].start)
+  binned = dict((name, binStart(shape[0] * shape[1], surface[0])) for name, surface in surfaces.items())
+  for las_file in las_files:
+    for points in lasChunks(las_file):
+      for name, (stat, returns, classes) in surfaces.items():
+        keep = pointFilter(points, returns, classes)
+        cells, inside = pointCells(points, keep, info, window)
+        binAdd(binned[name], cells, points["z"][keep][inside])
+  return dict((name, binResult(binned[name], shape)) for name in binned)
+
+def fillNearest(grid):
+  # Voids (NaN) take the value of the nearest binned cell
+  voids = np.isnan(grid)
+  if not voids.any() or voids.all():
+    return grid
+  if distance_transform_edt is not None:
+    rows, cols = distance_transform_edt(voids, return_distances=False, return_indices=True)
+    return grid[rows, cols]
+  # Without scipy: grow the binned cells one ring at a time
+  grid = grid.copy()
+  while voids.any():
+    padded = np.pad(grid, 1, mode="constant", constant_values=np.nan)
+    rows, cols = np.nonzero(voids)
+    neighbours = np.stack([padded[rows + 1 + dr, cols + 1 + dc]
+                           for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc])
+    filled = ~np.isnan(neighbours).all(axis=0)
+    with np.errstate(all="ignore"):
+      grid[rows[filled], cols[filled]] = np.nanmean(neighbours[:, filled], axis=0)
+    voids = np.isnan(grid)
+  return grid
+
+def surfaceBins(ground_classes=None, surface_classes=None, ground_returns=None, surface_returns=None,
+                ground_stat="mean"):
+  # binPoints surfaces of the DEM (ground points) and DSM (maximum of the
+  # surface points)
+  return {
+    "dem": (ground_stat, ground_returns, ground_classes),
+    "dsm": ("max", surface_returns, surface_classes)
+  }
+
+def fillSurfaces(dem, dsm):
+  # DEM voids take the nearest ground value and DSM voids take the DEM, as
+  # Con(IsNull(dsm), dem, dsm) did. Returns (dem, dsm).
+  dem = fillNearest(dem)
+  dsm = np.where(np.isnan(dsm), dem, dsm)
+  return dem, dsm
+
+def lasSurfaces(las_files, info, ground_classes=None, surface_classes=None, ground_returns=None,
+                surface_returns=None, ground_stat="mean"):
+  # DEM from the ground points and DSM (maximum) from the surface points in one
+  # pass, with the voids filled. Returns (dem, dsm).
+  grids = binPoints(las_files, info, surfaceBins(ground_classes, surface_classes, ground_returns,
+                                                 surface_returns, ground_stat))
+  return fillSurfaces(grids["dem"], grids["dsm"])
+
+def tileJobs(las_files, info, block_cells=None):
+  # Splits the grid into blocks of about one tile each. Every block is binned
+  # from the tiles that touch it; binning is per cell, so blocks need no
+  # buffer.
+  headers = dict((las_file, lasHeader(las_file)["bounds"]) for las_file in las_files)
+  if block_cells is None:
+    widths = [max(b[2] - b[0], b[3] - b[1]) for b in headers.values()]
+    block_cells = max(int(np.median(widths) / info["cell_width"]), 64)
+
+  jobs = []
+  for row in range(0, info["rows"], block_cells):
+    for col in range(0, info["cols"], block_cells):
+      rows = slice(row, min(row + block_cells, info["rows"]))
+      cols = slice(col, min(col + block_cells, info["cols"]))
+      window = windowBounds(info, rows, cols)
+      files = [f for f, b in headers.items()
+               if b[0] <= window[2] and b[2] >= window[0] and b[1] <= window[3] and b[3] >= window[1]]
+      if not files:
+        continue
+      jobs.append({"files": sorted(files), "rows": [rows.start, rows.stop], "cols": [cols.start, cols.stop]})
+  return jobs
+
+def windowBounds(info, rows, cols):
+  # (x_min, y_min, x_max, y_max) of the grid window rows x cols
+  y_max = info["y_max"] - rows.start * info["cell_height"]
+  x_min = info["x_min"] + cols.start * info["cell_width"]
+  return (x_min, y_max - (rows.stop - rows.start) * info["cell_height"],
+          x_min + (cols.stop - cols.start) * info["cell_width"], y_max)
+
+def pythonExe():
+  # sys.executable is ArcMap.exe when run as an in-process script tool
+  if os.path.basename(sys.executable).lower().startswith("python"):
+    return sys.executable
+  return os.path.join(sys.exec_prefix, "python.exe")
+
+def rasterizeJob(job_file):
+  # Worker: bins one block into unfilled DEM and DSM grids (NaN voids) and
+  # saves them next to the job file
+  import json
+  with open(job_file) as f:
+    job = json.load(f)
+  window = (slice(*job["rows"]), slice(*job["cols"]))
+  grids = binPoints(job["files"], job["info"], surfaceBins(job["ground_classes"], job["surface_classes"],
+                    job["ground_returns"], job["surface_returns"], job["ground_stat"]), window)
+  np.savez(os.path.splitext(job_file)[0] + ".npz", dem=grids["dem"], dsm=grids["dsm"])
+
+def rasterizeTiles(las_files, info, folder, processes=4, ground_classes=None, surface_classes=None,
+                   ground_returns=None, surface_returns=None, ground_stat="mean", block_cells=None):
+  # Bins the tiles block by block in parallel python processes, stitches the
+  # blocks into DEM and DSM grids on info (e.g. snapped to NAIP) and fills
+  # their voids once over the whole grid, so the result is the same as
+  # lasSurfaces in one pass. Returns (dem, dsm).
+  import json
+  import subprocess
+  from multiprocessing.pool import ThreadPool
+
+  if not os.path.isdir(folder):
+    os.makedirs(folder)
+  job_info = dict(info, spatial_reference=None)
+  job_files = []
+  for number, job in enumerate(tileJobs(las_files, info, block_cells)):
+    job.update({"info": job_info, "ground_classes": ground_classes, "surface_classes": surface_classes,
+                "ground_returns": ground_returns, "surface_returns": surface_returns, "ground_stat": ground_stat})
+    job_file = os.path.join(folder, "las_block_" + str(number) + ".json")
+    with open(job_file, "w") as f:
+      json.dump(job, f)
+    job_files.append((job_file, job))
+
+  def rasterizeProcess(job_file):
+    return subprocess.call([pythonExe(), os.path.abspath(__file__).replace(".pyc", ".py"), job_file])
+  pool = ThreadPool(processes)
+  try:
+    codes = pool.map(rasterizeProcess, [job_file for job_file, job in job_files])
+  finally:
+    pool.close()
+    pool.join()
+  failed = [job_file for (job_file, job), code in zip(job_files, codes) if code != 0]
+  if failed:
+    raise RuntimeError("LAS rasterization failed for " + ", ".join(failed))
+
+  grids = dict((name, np.full((info["rows"], info["cols"]), np.nan, dtype="float32"))
+               for name in ["dem", "dsm"])
+  for job_file, job in job_files:
+    block = np.load(os.path.splitext(job_file)[0] + ".npz")
+    for name in grids:
+      grids[name][slice(*job["rows"]), slice(*job["cols"])] = block[name]
+  return fillSurfaces(grids["dem"], grids["dsm"])
+
+if __name__ == "__main__":
+  # python lasLib.py <job.json>
+  rasterizeJob(sys.argv[1])
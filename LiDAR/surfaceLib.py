@@ -0,0 +1,75 @@
+#-------------------------------------------------------------------------------
+# Name:        surfaceLib Tool
+# Purpose:     Removes spikes (birds, wires, noise) from the heights surface and
+#              fills them from the surrounding cells, on the array. Replaces
+#              the raster -> points -> buffer -> points -> NaturalNeighbor ->
+#              mosaic path: only the spike cells are visited, and each is
+#              filled by inverse distance weighting of the good cells within
+#              the fill radius.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import numpy as np
+
+
+def surfaceHeights(dem, dsm):
+  # DSM - DEM with null and negative heights set to the ground (0)
+  with np.errstate(invalid="ignore"):
+    return np.fmax(np.nan_to_num(np.asarray(dsm, dtype="float32") - dem), 0)
+
+def neighbourMax(grid):
+  # Highest of the 8 neighbours of every cell (NaN and the grid edge ignored)
+  padded = np.pad(np.where(np.isnan(grid), -np.inf, grid), 1, mode="constant", constant_values=-np.inf)
+  rows, cols = grid.shape
+  highest = np.full(grid.shape, -np.inf)
+  for dr in (-1, 0, 1):
+    for dc in (-1, 0, 1):
+      if dr or dc:
+        highest = np.maximum(highest, padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols])
+  return highest
+
+def spikeMask(heights, max_height, spike_height=None):
+  # Cells to remove: above max_height, or (with spike_height) higher than all
+  # of their neighbours by more than spike_height
+  heights = np.asarray(heights)
+  with np.errstate(invalid="ignore"):
+    spikes = heights > max_height
+    if spike_height is not None:
+      spikes |= heights - neighbourMax(np.where(spikes, np.nan, heights)) > spike_height
+  return spikes
+
+def fillVoids(grid, voids, radius, cell_size, power=2):
+  # Fills the void cells by inverse distance weighting of the non-void cells
+  # within radius (map units). Voids with nothing in reach are retried with
+  # twice the radius.
+  grid = np.array(grid, dtype="float32")
+  good = ~voids & ~np.isnan(grid)
+  grid[voids] = np.nan
+  rows, cols = np.nonzero(np.isnan(grid))
+  while rows.size and good.any():
+    reach = max(int(radius // cell_size), 1)
+    padded = np.pad(np.where(good, grid, 0), reach, mode="constant")
+    padded_good = np.pad(good, reach, mode="constant")
+    total = np.zeros(rows.size)
+    weights = np.zeros(rows.size)
+    for dr in range(-reach, reach + 1):
+      for dc in range(-reach, reach + 1):
+        distance = np.hypot(dr, dc) * cell_size
+        if distance == 0 or distance > radius:
+          continue
+        r, c = rows + reach + dr, cols + reach + dc
+        weight = padded_good[r, c] / distance ** power
+        total += weight * padded[r, c]
+        weights += weight
+    filled = weights > 0
+    grid[rows[filled], cols[filled]] = total[filled] / weights[filled]
+    rows, cols = rows[~filled], cols[~filled]
+    radius *= 2
+  return grid
@@ -3,7 +3,9 @@
 # Purpose:     Takes raw naip tiles and mosaics them.
 #
 #             Primary Steps:
-#               - Iterate through folder and mosaic naip tiles.
+#               - Index the naip tiles (footprints and acquisition dates).
+#               - Mosaic the tiles that touch the analysis boundary, clipped
+#                 to it, or write a virtual mosaic of them.
 
 # Author:      Peter Norton
 #
@@ -15,6 +17,10 @@
 # USER INPUT PARAMETERS
 location_name = "Tahoe"
 projection = "UTMZ10"  #["UTMZ10", "UTMZ11", "SPIII", "SPIV"]
+boundary = ""  # Analysis boundary feature class; blank mosaics every tile
+buffer_distance = 100  # Grows the boundary window (tile units)
+mosaic_output = "WINDOW"  #["WINDOW", "VIRTUAL"]
+mosaic_method = "LAST"  #["LAST", "FIRST"] Where tiles overlap: LAST = newest, FIRST = oldest
 #-----------------------------------------------
 #-----------------------------------------------
 
@@ -32,6 +38,7 @@ import os
 import sys
 from arcpy import env
 from arcpy.sa import *
+from naipLib import tileIndex, windowExtent, windowTiles, virtualMosaic, windowMosaic
 arcpy.env.overwriteOutput = True
 
 #-----------------------------------------------
@@ -46,6 +53,17 @@ naip_folder = os.path.dirname(scriptpath)
 inputs = os.path.join(naip_folder, "Inputs")
 outputs = os.path.join(naip_folder, "Outputs")
 new_raster = "naip.tif"
+new_vrt = "naip.vrt"
+#-----------------------------------------------
+#-----------------------------------------------
+
+#-----------------------------------------------
+#-----------------------------------------------
+count = 1
+def generateMessage(text):
+  global count
+  arcpy.AddMessage("Step " + str(count) + ": " +text),
+  count += 1
 #-----------------------------------------------
 #-----------------------------------------------
 
@@ -77,12 +95,22 @@ elif projection == "SPIV":
 
 #-----------------------------------------------
 #-----------------------------------------------
+text = "Indexing NAIP tiles."
+generateMessage(text)
+
+index = tileIndex(inputs)
+window = None
+if boundary and index:
+  window = windowExtent(boundary, index[0]["spatial_reference"], buffer_distance)
+tiles = windowTiles(index, window)
+arcpy.AddMessage("{0} of {1} tiles in the window".format(len(tiles), len(index)))
+
 text = "Mosaicking NAIP Imagery."
 generateMessage(text)
 
-for root, dirs, images in os.walk(inputs):
-    for image in images:
-      collection.append(image)
-arcpy.MosaicToNewRaster_management (collection, outputs, new_raster, projection, "8_BIT_UNSIGNED", 1, 4, "LAST","FIRST")
+if mosaic_output == "VIRTUAL":
+  virtualMosaic(tiles, os.path.join(outputs, new_vrt), window, mosaic_method)
+else:
+  windowMosaic(tiles, os.path.join(outputs, new_raster), projection, window, mosaic_method)
 text = "All processes are complete."
 generateMessage(text)
@@ -0,0 +1,180 @@
+#-------------------------------------------------------------------------------
+# Name:        naipLib Tool
+# Purpose:     Indexes NAIP tiles (footprint, grid and acquisition date) once
+#              per input folder and mosaics only the tiles that touch the
+#              analysis window, either as a clipped raster or as a virtual
+#              (.vrt) mosaic that references the tiles in place.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import arcpy
+import csv
+import os
+import re
+from xml.sax.saxutils import escape
+
+tile_extensions = (".tif", ".tiff", ".jp2", ".sid", ".img")
+index_fields = ["path", "modified", "x_min", "y_min", "x_max", "y_max", "cols", "rows",
+                "cell_width", "cell_height", "bands", "date", "spatial_reference"]
+
+
+def tileDate(path):
+  # Acquisition date (YYYYMMDD) from a NAIP tile name such as
+  # m_3811901_ne_10_060_20160713.tif; "" when the name has none
+  dates = re.findall(r"(?<!\d)((?:19|20)\d{6})(?!\d)", os.path.basename(path))
+  return dates[-1] if dates else ""
+
+def describeTile(path):
+  # Index row of one tile
+  desc = arcpy.Describe(path)
+  extent = desc.extent
+  return {
+    "path": path,
+    "modified": repr(os.path.getmtime(path)),
+    "x_min": extent.XMin,
+    "y_min": extent.YMin,
+    "x_max": extent.XMax,
+    "y_max": extent.YMax,
+    "cols": desc.width,
+    "rows": desc.height,
+    "cell_width": desc.meanCellWidth,
+    "cell_height": desc.meanCellHeight,
+    "bands": desc.bandCount,
+    "date": tileDate(path),
+    "spatial_reference": desc.spatialReference.exportToString()
+  }
+
+def tileIndex(folder, index_file=None):
+  # Footprints, grids and dates of every tile under folder. The index is kept
+  # in index_file (tile_index.csv in folder by default) and only new or
+  # modified tiles are described again.
+  if index_file is None:
+    index_file = os.path.join(folder, "tile_index.csv")
+  cached = {}
+  if os.path.isfile(index_file):
+    with open(index_file) as f:
+      for row in csv.DictReader(f):
+        cached[row["path"]] = row
+
+  index = []
+  for root, dirs, images in os.walk(folder):
+    for image in sorted(images):
+      if not image.lower().endswith(tile_extensions):
+        continue
+      path = os.path.join(root, image)
+      row = cached.get(path)
+      if row is None or row["modified"] != repr(os.path.getmtime(path)):
+        row = describeTile(path)
+      index.append(row)
+
+  with open(index_file, "w") as f:
+    writer = csv.DictWriter(f, fieldnames=index_fields, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(index)
+  for row in index:
+    for field in ["x_min", "y_min", "x_max", "y_max", "cell_width", "cell_height"]:
+      row[field] = float(row[field])
+    for field in ["cols", "rows", "bands"]:
+      row[field] = int(row[field])
+  return index
+
+def windowExtent(boundary, spatial_reference, buffer_distance=0):
+  # (x_min, y_min, x_max, y_max) of a boundary feature class in the tiles'
+  # spatial reference, grown by buffer_distance
+  tile_sr = arcpy.SpatialReference()
+  tile_sr.loadFromString(spatial_reference)
+  extent = arcpy.Describe(boundary).extent
+  extent = extent.polygon.projectAs(tile_sr).extent
+  return (extent.XMin - buffer_distance, extent.YMin - buffer_distance,
+          extent.XMax + buffer_distance, extent.YMax + buffer_distance)
+
+def windowTiles(index, window=None):
+  # Tiles overlapping window (all tiles when None), oldest acquisition first,
+  # so where tiles overlap LAST picks the newest and FIRST the oldest
+  tiles = [tile for tile in index if window is None or
+           (tile["x_min"] < window[2] and tile["x_max"] > window[0] and
+            tile["y_min"] < window[3] and tile["y_max"] > window[1])]
+  return sorted(tiles, key=lambda tile: tile["date"])
+
+def virtualMosaic(tiles, vrt_file, window=None, mosaic_method="LAST"):
+  # Writes a GDAL virtual mosaic (.vrt) of the tiles clipped to window. Nothing
+  # is copied; overlaps follow mosaic_method (later sources are drawn on top,
+  # so FIRST lists the tiles in reverse). The VRT takes the cell size of the
+  # first tile.
+  if not tiles:
+    raise ValueError("No NAIP tiles in the window")
+  if len(set(tile["spatial_reference"] for tile in tiles)) > 1:
+    raise ValueError("NAIP tiles are in more than one projection; use a windowed mosaic")
+  cell_width, cell_height = tiles[0]["cell_width"], tiles[0]["cell_height"]
+  x_min = min(tile["x_min"] for tile in tiles)
+  y_max = max(tile["y_max"] for tile in tiles)
+  x_max = max(tile["x_max"] for tile in tiles)
+  y_min = min(tile["y_min"] for tile in tiles)
+  if window is not None:
+    # Snap the window out to the tile grid
+    x_min = x_min + max(int((window[0] - x_min) // cell_width), 0) * cell_width
+    y_max = y_max - max(int((y_max - window[3]) // cell_height), 0) * cell_height
+    x_max = min(x_max, window[2])
+    y_min = max(y_min, window[1])
+  cols = int(round((x_max - x_min) / cell_width + 0.4999))
+  rows = int(round((y_max - y_min) / cell_height + 0.4999))
+  bands = max(tile["bands"] for tile in tiles)
+  if mosaic_method == "FIRST":
+    tiles = tiles[::-1]
+
+  lines = ['<VRTDataset rasterXSize="{0}" rasterYSize="{1}">'.format(cols, rows),
+           "  <SRS>{0}</SRS>".format(escape(tiles[0]["spatial_reference"])),
+           "  <GeoTransform>{0!r}, {1!r}, 0.0, {2!r}, 0.0, {3!r}</GeoTransform>".format(
+             x_min, cell_width, y_max, -cell_height)]
+  for band in range(1, bands + 1):
+    lines.append('  <VRTRasterBand dataType="Byte" band="{0}">'.format(band))
+    for tile in tiles:
+      if tile["bands"] < band:
+        continue
+      # Destination in VRT cells from the tile extent, so tiles of another
+      # resolution are resampled onto the VRT grid
+      dst_col = int(round((tile["x_min"] - x_min) / cell_width))
+      dst_row = int(round((y_max - tile["y_max"]) / cell_height))
+      dst_cols = int(round((tile["x_max"] - tile["x_min"]) / cell_width))
+      dst_rows = int(round((tile["y_max"] - tile["y_min"]) / cell_height))
+      lines += ["    <SimpleSource>",
+                '      <SourceFilename relativeToVRT="0">{0}</SourceFilename>'.format(escape(tile["path"])),
+                "      <SourceBand>{0}</SourceBand>".format(band),
+                '      <SrcRect xOff="0" yOff="0" xSize="{0}" ySize="{1}"/>'.format(tile["cols"], tile["rows"]),
+                '      <DstRect xOff="{0}" yOff="{1}" xSize="{2}" ySize="{3}"/>'.format(dst_col, dst_row, dst_cols, dst_rows),
+                "    </SimpleSource>"]
+    lines.append("  </VRTRasterBand>")
+  lines.append("</VRTDataset>")
+  with open(vrt_file, "w") as f:
+    f.write("\n".join(lines) + "\n")
+  return vrt_file
+
+def windowMosaic(tiles, output, projection, window=None, mosaic_method="LAST", scratch=None):
+  # Mosaics only the given tiles and clips the result to window
+  if not tiles:
+    raise ValueError("No NAIP tiles in the window")
+  bands = max(tile["bands"] for tile in tiles)
+  paths = [tile["path"] for tile in tiles]
+  if window is None:
+    arcpy.MosaicToNewRaster_management(paths, os.path.dirname(output), os.path.basename(output),
+                                       projection, "8_BIT_UNSIGNED", "", bands, mosaic_method, "FIRST")
+    return output
+  if scratch is None:
+    scratch = arcpy.env.scratchFolder
+  mosaic = os.path.join(scratch, "naip_window.tif")
+  arcpy.MosaicToNewRaster_management(paths, scratch, os.path.basename(mosaic),
+                                     "", "8_BIT_UNSIGNED", "", bands, mosaic_method, "FIRST")
+  rectangle = "{0!r} {1!r} {2!r} {3!r}".format(*window)
+  if projection:
+    arcpy.Clip_management(mosaic, rectangle, os.path.join(scratch, "naip_clip.tif"), "#", "#", "NONE", "NO_MAINTAIN_EXTENT")
+    arcpy.ProjectRaster_management(os.path.join(scratch, "naip_clip.tif"), output, projection, "NEAREST")
+  else:
+    arcpy.Clip_management(mosaic, rectangle, output, "#", "#", "NONE", "NO_MAINTAIN_EXTENT")
+  return output
@@ -0,0 +1,254 @@
+#-------------------------------------------------------------------------------
+# Name:        fireLib Tool
+# Purpose:     Processes FARSITE perimeters (burn.shp) on a fixed grid. Every
+#              perimeter is rasterized once and folded into a burn count
+#              (tot) and a time of arrival raster in place, so the number of
+#              time steps no longer multiplies a vector union. Progression
+#              frames are drawn from the time of arrival raster and streamed to
+#              PNG/GIF files without a map document or display.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import os
+import numpy as np
+
+
+def perimeterGrid(extent, cell_size, spatial_reference=None):
+  # Grid info (rasterArrays keys) covering an arcpy extent
+  cols = max(int(np.ceil(extent.width / cell_size)), 1)
+  rows = max(int(np.ceil(extent.height / cell_size)), 1)
+  return {
+    "x_min": extent.XMin,
+    "y_min": extent.YMax - rows * cell_size,
+    "y_max": extent.YMax,
+    "cell_width": float(cell_size),
+    "cell_height": float(cell_size),
+    "rows": rows,
+    "cols": cols,
+    "nodata": None,
+    "spatial_reference": spatial_reference
+  }
+
+def readPerimeters(datapath, field="Elapsed Mi"):
+  # {time: [ring vertex arrays]} for every perimeter, in one cursor pass.
+  # Outer and inner rings are kept together and filled even-odd.
+  import arcpy
+  perimeters = {}
+  with arcpy.da.SearchCursor(datapath, [field, "SHAPE@"]) as cursor:
+    for time, shape in cursor:
+      if shape is None:
+        continue
+      rings = perimeters.setdefault(time, [])
+      for part in shape:
+        ring = []
+        for point in part:
+          if point is None:
+            if len(ring) > 2:
+              rings.append(np.array(ring))
+            ring = []
+          else:
+            ring.append((point.X, point.Y))
+        if len(ring) > 2:
+          rings.append(np.array(ring))
+  return perimeters
+
+def rasterizeRings(rings, info):
+  # Cells whose centre is inside the rings (even-odd rule), by counting edge
+  # crossings along each row of cell centres
+  if not rings:
+    return np.zeros((info["rows"], info["cols"]), dtype=bool)
+  starts = np.vstack([ring for ring in rings])
+  ends = np.vstack([np.roll(ring, -1, axis=0) for ring in rings])
+  y_centres = info["y_max"] - (np.arange(info["rows"]) + 0.5) * info["cell_height"]
+
+  crossings = np.zeros((info["rows"], info["cols"] + 1), dtype="int32")
+  block = max(1, 4000000 // len(starts))
+  for first in range(0, info["rows"], block):
+    y = y_centres[first:first + block, None]
+    y0, y1 = starts[:, 1], ends[:, 1]
+    crosses = (y0 <= y) != (y1 <= y)
+    rows, edges = np.nonzero(crosses)
+    x0, x1 = starts[edges, 0], ends[edges, 0]
+    ey0, ey1 = y0[edges], y1[edges]
+    x = x0 + (y[rows, 0] - ey0) * (x1 - x0) / (ey1 - ey0)
+    cols = np.ceil((x - info["x_min"]) / info["cell_width"] - 0.5).astype("int64")
+    np.add.at(crossings, (rows + first, np.clip(cols, 0, info["cols"])), 1)
+  return np.cumsum(crossings[:, :-1], axis=1) % 2 == 1
+
+def burnStack(perimeters, info):
+  # Burn count (tot: number of perimeters covering each cell) and time of
+  # arrival (first perimeter covering each cell, NaN if unburned)
+  tot = np.zeros((info["rows"], info["cols"]), dtype="int16")
+  toa = np.full((info["rows"], info["cols"]), np.nan, dtype="float32")
+  for time in sorted(perimeters):
+    mask = rasterizeRings(perimeters[time], info)
+    tot += mask
+    toa[mask & np.isnan(toa)] = time
+  return tot, toa
+
+#-----------------------------------------------
+#-----------------------------------------------
+# Frames
+# Colors of the arrival time ramp (early to late); frames use a fixed
+# 256 color palette so no quantizing is needed
+fire_ramp = [(255, 255, 178), (254, 204, 92), (253, 141, 60), (240, 59, 32), (189, 0, 38), (90, 0, 20)]
+background_color = (230, 230, 230)
+front_color = (255, 255, 255)
+
+
+def framePalette():
+  # Index 0 = unburned, 1-254 = arrival time ramp, 255 = active front
+  ramp = np.array(fire_ramp, dtype="float64")
+  position = np.linspace(0, len(ramp) - 1, 254)
+  lower = np.floor(position).astype("int64")
+  upper = np.minimum(lower + 1, len(ramp) - 1)
+  weight = (position - lower)[:, None]
+  palette = np.zeros((256, 3), dtype="uint8")
+  palette[0] = background_color
+  palette[1:255] = np.round(ramp[lower] * (1 - weight) + ramp[upper] * weight)
+  palette[255] = front_color
+  return palette
+
+def frameIndices(toa, time, previous_time, first_time, last_time, scale=1):
+  # Palette indices of the frame at time: cells burned by then are colored by
+  # arrival time and cells reached since previous_time are the front
+  span = max(float(last_time - first_time), 1e-9)
+  frame = np.zeros(toa.shape, dtype="uint8")
+  with np.errstate(invalid="ignore"):
+    burned = toa <= time
+    frame[burned] = 1 + np.round((toa[burned] - first_time) / span * 253).astype("uint8")
+    frame[burned & (toa > previous_time)] = 255
+  if scale > 1:
+    frame = np.repeat(np.repeat(frame, scale, axis=0), scale, axis=1)
+  return frame
+
+def writePNG(frame, palette, png_file):
+  # Palette PNG of a frame of indices, written with zlib only
+  import struct
+  import zlib
+
+  def chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+  rows, cols = frame.shape
+  raw = np.hstack([np.zeros((rows, 1), dtype="uint8"), frame]).tobytes()
+  with open(png_file, "wb") as f:
+    f.write(b"\x89PNG\r\n\x1a\n")
+    f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", cols, rows, 8, 3, 0, 0, 0)))
+    f.write(chunk(b"PLTE", palette.tobytes()))
+    f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+    f.write(chunk(b"IEND", b""))
+  return png_file
+
+def lzwEncode(pixels, min_code_size=8):
+  # GIF LZW data (in 255 byte sub-blocks) of a flat sequence of indices
+  clear = 1 << min_code_size
+  end = clear + 1
+  output = bytearray()
+  state = {"buffer": 0, "bits": 0}
+
+  def emit(code, size):
+    state["buffer"] |= code << state["bits"]
+    state["bits"] += size
+    while state["bits"] >= 8:
+      output.append(state["buffer"] & 0xFF)
+      state["buffer"] >>= 8
+      state["bits"] -= 8
+
+  table = {}
+  code_size = min_code_size + 1
+  next_code = end + 1
+  emit(clear, code_size)
+  pixels = pixels.tolist()
+  prefix = pixels[0]
+  for pixel in pixels[1:]:
+    key = (prefix << 8) | pixel
+    code = table.get(key)
+    if code is not None:
+      prefix = code
+      continue
+    emit(prefix, code_size)
+    if next_code < 4096:
+      table[key] = next_code
+      next_code += 1
+      if next_code > (1 << code_size) and code_size < 12:
+        code_size += 1
+    else:
+      emit(clear, code_size)
+      table = {}
+      code_size = min_code_size + 1
+      next_code = end + 1
+    prefix = pixel
+  emit(prefix, code_size)
+  emit(end, code_size)
+  if state["bits"]:
+    output.append(state["buffer"] & 0xFF)
+
+  blocks = bytearray()
+  for start in range(0, len(output), 255):
+    block = output[start:start + 255]
+    blocks.append(len(block))
+    blocks.extend(block)
+  blocks.append(0)
+  return bytes(blocks)
+
+def renderFrames(toa, times, png_folder=None, gif_file=None, scale=1, delay=20, name="burn_"):
+  # Draws one frame per time step from the time of arrival raster and streams
+  # it to <name><time>.png and/or an animated GIF; only one frame is held in
+  # memory at a time. delay is in hundredths of a second. Returns the frame count.
+  import struct
+  times = sorted(times)
+  if not times:
+    return 0
+  palette = framePalette()
+  rows, cols = toa.shape[0] * scale, toa.shape[1] * scale
+  gif = None
+  if gif_file is not None:
+    gif = open(gif_file, "wb")
+    gif.write(b"GIF89a" + struct.pack("<HHBBB", cols, rows, 0xF7, 0, 0) + palette.tobytes())
+    gif.write(b"\x21\xFF\x0BNETSCAPE2.0\x03\x01\x00\x00\x00")  # loop forever
+  try:
+    previous_time = -np.inf
+    for time in times:
+      frame = frameIndices(toa, time, previous_time, times[0], times[-1], scale)
+      if png_folder is not None:
+        writePNG(frame, palette, os.path.join(png_folder, name + str(time) + ".png"))
+      if gif is not None:
+        gif.write(b"\x21\xF9\x04\x04" + struct.pack("<H", delay) + b"\x00\x00")
+        gif.write(b"\x2C" + struct.pack("<HHHHB", 0, 0, cols, rows, 0))
+        gif.write(b"\x08" + lzwEncode(frame.ravel()))
+      previous_time = time
+    if gif is not None:
+      gif.write(b"\x3B")
+  finally:
+    if gif is not None:
+      gif.close()
+  return len(times)
+
+def asciiTOA(ascii_file):
+  # Time of arrival array from an ESRI ASCII grid (e.g. RasterToASCII of burn_toa)
+  header = {}
+  with open(ascii_file) as f:
+    for line in range(6):
+      key, value = f.readline().split()
+      header[key.lower()] = float(value)
+    toa = np.loadtxt(f, dtype="float32", ndmin=2)
+  if "nodata_value" in header:
+    toa[toa == header["nodata_value"]] = np.nan
+  return toa
+
+if __name__ == "__main__":
+  # Headless: python fireLib.py <toa.asc> <fire.gif> [png folder] [scale]
+  import sys
+  toa = asciiTOA(sys.argv[1])
+  png_folder = sys.argv[3] if len(sys.argv) > 3 else None
+  scale = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+  times = np.unique(toa[~np.isnan(toa)]).tolist()
+  renderFrames(toa, times, png_folder, sys.argv[2], scale)
@@ -0,0 +1,67 @@
+#-------------------------------------------------------------------------------
+# Name:        burnJoin Tool
+# Purpose:     Joins the maximum FlamMap fire behavior (fli, fml, ros) to each
+#              object in one pass. Burn grids are read once, aligned to an
+#              object label raster by index arithmetic, reduced per object
+#              together and written back with a single update cursor.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import arcpy
+import numpy as np
+from rasterArrays import rasterToArray, asciiToArray, alignToGrid
+
+
+def objectMax(labels, metric_arrays):
+  # Per-object maximum of every metric in one grouped reduction.
+  # Returns {label: [max of metric 1, max of metric 2, ...]}; NaN cells are ignored.
+  labels = np.asarray(labels).ravel()
+  values = np.vstack([np.asarray(m, dtype="float32").ravel() for m in metric_arrays])
+  keep = labels > 0
+  labels = labels[keep]
+  values = values[:, keep]
+  if labels.size == 0:
+    return {}
+
+  order = np.argsort(labels, kind="mergesort")
+  labels = labels[order]
+  values = values[:, order]
+  starts = np.concatenate(([0], np.flatnonzero(np.diff(labels)) + 1))
+  maxima = np.fmax.reduceat(values, starts, axis=1)
+  return dict(zip(labels[starts].tolist(), maxima.T.tolist()))
+
+def joinBurnMetrics(objects, label_raster, ascii_files, fields, unit_scalars=None, join_field="JOIN"):
+  # objects:       feature class to update (must already have join_field)
+  # label_raster:  raster of join_field values on the analysis (NAIP) grid
+  # ascii_files:   FlamMap ascii grid for each field, in the same order
+  if unit_scalars is None:
+    unit_scalars = [1] * len(fields)
+
+  labels, label_info = rasterToArray(label_raster, "float64")
+  labels = np.where(np.isnan(labels), 0, labels).astype("int64")
+
+  metric_arrays = []
+  for ascii_file, scalar in zip(ascii_files, unit_scalars):
+    burn, burn_info = asciiToArray(ascii_file)
+    metric_arrays.append(alignToGrid(burn, burn_info, label_info) * scalar)
+  maxima = objectMax(labels, metric_arrays)
+
+  existing = [f.name for f in arcpy.ListFields(objects)]
+  for field in fields:
+    if field not in existing:
+      arcpy.AddField_management(objects, field, "FLOAT")
+
+  with arcpy.da.UpdateCursor(objects, [join_field] + list(fields)) as cursor:
+    for row in cursor:
+      values = maxima.get(row[0])
+      if values is None:
+        continue
+      cursor.updateRow([row[0]] + [None if np.isnan(v) else v for v in values])
+  return maxima
@@ -0,0 +1,105 @@
+#-------------------------------------------------------------------------------
+# Name:        flamMapLib Tool
+# Purpose:     Wraps the GenLCPv2 and FlamMapF dlls so that the landscape file
+#              and the burn can be run for any set of ascii layers (full site
+#              or a mitigation window).
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import ctypes
+import os
+import subprocess
+import sys
+from multiprocessing.pool import ThreadPool
+
+burn_metrics = ["fli", "fml", "ros"]
+
+
+def genLCP(dll_path, landscape_file, elevation, slope, aspect, fuel, canopy):
+  # Creates the .LCP from ascii layers. Returns the dll error code (0 = success).
+  genlcp = os.path.join(dll_path, "GenLCPv2.dll")
+  dll = ctypes.cdll.LoadLibrary(genlcp)
+  fm = getattr(dll, "?Gen@@YAHPBD000000@Z")
+  fm.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p]
+  fm.restype = ctypes.c_int
+
+  return fm(landscape_file, elevation, slope, aspect, fuel, canopy, "")
+
+def runFlamMap(dll_path, landscape_file, fuel_moisture, output_file, windspeed=30.0, wind_dir=0.0):
+  # Burns the .LCP. Returns the dll error code (0 = success).
+  flamMap = os.path.join(dll_path, "FlamMapF.dll")
+  dll = ctypes.cdll.LoadLibrary(flamMap)
+  fm = getattr(dll, "?Run@@YAHPBD000NN000HHN@Z")
+  fm.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_double, ctypes.c_double, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int, ctypes.c_int, ctypes.c_double]
+  fm.restype = ctypes.c_int
+
+  FuelModel = "-1"
+  Weather = "-1"
+  WindFileName = "-1"
+  DateFileName = "-1"
+  FoliarMoist = 100 # 50%
+  CalcMeth = 0    # 0 = Finney 1998, 1 = Scott & Reinhardt 2001
+  Res = -1.0
+
+  return fm(landscape_file, fuel_moisture, output_file, FuelModel, windspeed, wind_dir, Weather, WindFileName, DateFileName, FoliarMoist, CalcMeth, Res)
+
+def collectBurns(output_file, prefix="m_"):
+  # Renames FlamMap outputs for output_file to <prefix><metric>.asc next to it.
+  # Returns {metric: ascii path}.
+  folder = os.path.dirname(output_file)
+  base = os.path.basename(output_file).lower()
+  burns = {}
+  for burn in os.listdir(folder):
+    name = burn.lower()
+    metric = name[-3:]
+    if name.startswith(base) and metric in burn_metrics:
+      burn_ascii = os.path.join(folder, prefix + metric + ".asc")
+      if os.path.isfile(burn_ascii):
+        os.remove(burn_ascii)
+      os.rename(os.path.join(folder, burn), burn_ascii)
+      burns[metric] = burn_ascii
+  return burns
+
+def burnFolder(dll_path, folder, fuel_moisture, windspeed=30.0, wind_dir=0.0, prefix="w_"):
+  # Builds <prefix>landscape.lcp from the <prefix>*.asc layers in folder and
+  # burns it. Returns {metric: ascii path}.
+  layer = lambda name: os.path.join(folder, prefix + name + ".asc")
+  landscape_file = os.path.join(folder, prefix + "landscape.lcp")
+  e = genLCP(dll_path, landscape_file, layer("elevation"), layer("slope"), layer("aspect"), layer("fuel"), layer("canopy"))
+  if e > 0:
+    raise RuntimeError("GenLCP error {0}".format(e))
+  output_file = os.path.join(folder, prefix + "burn")
+  e = runFlamMap(dll_path, landscape_file, fuel_moisture, output_file, windspeed, wind_dir)
+  if e > 0:
+    raise RuntimeError("FlamMap problem with parameter {0}".format(e))
+  return collectBurns(output_file, prefix)
+
+def pythonExe():
+  # sys.executable is ArcMap.exe when run as an in-process script tool
+  if os.path.basename(sys.executable).lower().startswith("python"):
+    return sys.executable
+  return os.path.join(sys.exec_prefix, "python.exe")
+
+def burnFolders(dll_path, folders, fuel_moisture, windspeed=30.0, wind_dir=0.0, processes=4):
+  # Burns several prepared folders at once, each in its own python process so
+  # the dlls never share state. Returns the exit code for each folder.
+  def burnProcess(folder):
+    return subprocess.call([pythonExe(), os.path.abspath(__file__).replace(".pyc", ".py"),
+                            dll_path, folder, fuel_moisture, str(windspeed), str(wind_dir)])
+  pool = ThreadPool(processes)
+  try:
+    return pool.map(burnProcess, folders)
+  finally:
+    pool.close()
+    pool.join()
+
+if __name__ == "__main__":
+  # python flamMapLib.py <dll_path> <folder> <fuel_moisture> <windspeed> <wind_dir>
+  burnFolder(sys.argv[1], sys.argv[2], sys.argv[3], float(sys.argv[4]), float(sys.argv[5]))
@@ -35,6 +35,14 @@ buff_distance = "1000 feet" # Buffer around infrastructure
 mitigation_surface = "path"
 mitigation_height = 0
 buff_distance = "30 FEET"
+incremental_mitigation = "No"  # Patch and re-burn only the buffer neighborhood
+
+# Scenario batch (every asset x buffer width x treatment, replaces the single strategy above)
+run_scenarios = "No"
+scenario_assets = ["pipeline.shp"]  # in Inputs
+scenario_buff_distances = ["30 FEET", "60 FEET", "100 FEET"]
+scenario_treatments = [["path", 0], ["grass", 0], ["shrub", 0]]  # [surface, height]
+scenario_processes = 4  # Concurrent FlamMap burns
 
 # inputs
 input_bnd = "bnd.shp" 
@@ -55,12 +63,20 @@ input_weather = ""
 #-----------------------------------------------
 #-----------------------------------------------
 
+# Dependent scripts (kept next to this script): terrainLib.py, rasterArrays.py,
+# mitigationLib.py, burnJoin.py, flamMapLib.py, scenarioLib.py, corridorLib.py
+
 # Import modules
 import arcpy
 import os
 import sys
 from arcpy import env
 from arcpy.sa import *
+from terrainLib import saveTerrain
+from mitigationLib import mitigateIncremental, writeDeltas
+from scenarioLib import scenarioGrid, runScenarios, writeScenarios
+from rasterArrays import rasterInfo, arrayToRaster
+from corridorLib import assetCorridor
 arcpy.env.overwriteOutput = True
 
 # Create new project folder and set environment
@@ -96,7 +112,6 @@ weather = os.path.join(inputs, input_weather) # Weather
 bnd_zones = os.path.join(inputs, input_bnd) # Bounding box for each tile
 
 # Outputs
-asset = os.path.join(outputs, "pipeline.shp")
 pipe_buffer = os.path.join(outputs, "pipe_buffer.shp")
 
 mitigated = os.path.join(outputs, "mitigated.shp")
@@ -166,177 +181,234 @@ arcpy.AddMessage("-----------------------------")
 
 #-----------------------------------------------
 #-----------------------------------------------
-text = "Creating "+str(buff_distance)+" buffer around pipeline."
-generateMessage(text)
-
 #Variables
 classified_no_asset = os.path.join(scratchgdb, "classified_no_asset")
-pipe_seg = os.path.join(outputs, "pipe_seg.shp")
-pipe_rast = os.path.join(scratchgdb, "pipe_rast")
 pipe_proj = os.path.join(scratchgdb, "pipe_proj")
 
+def bufferAsset():
+  text = "Creating "+str(buff_distance)+" corridor around pipeline."
+  generateMessage(text)
+
+  # Buffer the rasterized pipeline on the landscape grid (no vector buffer)
+  dem_info = rasterInfo(scaled_dem)
+  corridor = assetCorridor(pipeline, dem_info, buff_distance, unit)
+  arrayToRaster(corridor.astype("int32"), dem_info, pipe_proj, nodata=0, projection=projection)
+#-----------------------------------------------
+#-----------------------------------------------
+
+def rebuildMitigation():
+  # Polygons of the corridor are only needed to merge into classified
+  arcpy.RasterToPolygon_conversion(pipe_proj, pipe_buffer, "NO_SIMPLIFY")
+  arcpy.Erase_analysis(classified, pipe_buffer, classified_no_asset)
+  # Removing unnecessary fields for training samples
+  classified_fields = [[f.name, f.type] for f in arcpy.ListFields(classified)]
+  asset_fields = [f.name for f in arcpy.ListFields(pipe_buffer)]
+  add_fields = []
+  for f_name,f_type in classified_fields:
+   if f_name not in asset_fields:
+     add_fields.append([f_name, f_type])
+  for f_name, f_type in add_fields:
+   arcpy.AddField_management(pipe_buffer, f_name, f_type)
+   if f_name == "height":
+     arcpy.CalculateField_management(pipe_buffer, f_name, mitigation_height)
+   elif f_name == "S2":
+     arcpy.CalculateField_management(pipe_buffer, f_name, mitigation_surface)
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Merging mitigated buffer back to classified image."
+  generateMessage(text)
+
+  # Merging all layers back together as classified layer
+  arcpy.Merge_management([pipe_buffer, classified_no_asset], mitigated)
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Assigning fuel models and creating canopy cover assessments."
+  generateMessage(text)
+
+  # Variables
+  land_cover = mitigated
+  land_cover_fields = [["fuel", "S2"], ["canopy", "S2"], ["stand", "height"]]
+
+  def classify(model, x):
+
+   # Anderson 13 fuel models
+   if model == "13":
+     building = "10"
+     tree = "10"
+     shrub = "6"
+     grass = "1"
+     water = "98"
+     path = "99"
+   elif model != "13":
+     #-----------------------------------------------
+     #-----------------------------------------------
+     text = "Cannot classify fuels. Only Anderson 13 are available."
+     generateMessage(text)
+     #-----------------------------------------------
+     classify("13", output_field)
+   if x == "fuel":
+     return ("def classify(x):\\n"+
+             "  if x == \"building\":\\n"+
+             "    return "+building+"\\n"+
+             "  elif x == \"path\": \\n"+
+             "    return "+path+"\\n"+
+             "  elif x == \"water\":\\n"+
+             "    return "+water+"\\n"+
+             "  elif x == \"grass\":\\n"+
+             "    return "+grass+"\\n"+
+             "  elif x == \"shrub\":\\n"+
+             "    return "+shrub+"\\n"+
+             "  elif x == \"tree\":\\n"+
+             "    return "+tree+"\\n"
+             )
+
+   elif x == "canopy":
+     return ("def classify(x):\\n"+
+             "  if x == \"tree\" or x == \"building\":\\n"+
+             "    return 75\\n"+ # 75% canopy cover b/c 
+             "  return 0"
+             )
+   # Returns height attribute - May delete if cannot include into .LCP
+   elif x == "stand":
+     return("def classify(x):\\n"+
+            "  return x"
+            )
+
+  for field in land_cover_fields:
+   input_field = field[1]
+   output_field = field[0]
+   arcpy.AddField_management(land_cover, output_field, "INTEGER")
+   fxn = "classify(!"+input_field+"!)"
+   label_class = classify(model, output_field)
+   arcpy.CalculateField_management(land_cover, output_field, fxn, "PYTHON_9.3", label_class)
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Fuel complex created."
+  generateMessage(text)
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Creating inputs for Landscape File."
+  generateMessage(text)
+
+  # Variables
+  fuel_lst = ["fuel", "canopy", "stand"]
+  elevation_lst = ["slope", "elevation", "aspect"]
+  ascii_layers = []
+  fuel = os.path.join(outputs, "m_fuel.asc")
+
+  def convertToAscii(x, landscape_elements):
+
+   for layer in landscape_elements:
+
+     # Variables
+     ascii_output = os.path.join(outputs, "m_"+layer + ".asc")
+     where_clause = layer +" <> 9999"
+     temp = os.path.join(scratchgdb, "mt_"+layer)
+     temp_raster = os.path.join(scratchgdb, "mt_"+layer+"_r")
+     final = os.path.join(scratchgdb, "m_"+layer)
+
+     # Selecting layer and converting to raster
+     if layer in fuel_lst:
+       arcpy.Select_analysis(land_cover, temp, where_clause)
+       arcpy.PolygonToRaster_conversion(temp, layer, temp_raster, "CELL_CENTER", "", scaled_dem)
+     elif layer in elevation_lst:
+
+       # Calculating elevation derived layers (cached per DEM in scratch)
+       if layer in ["slope", "aspect"]:
+         saveTerrain(scaled_dem, layer, temp_raster, scratchws, projection)
+       elif layer == "elevation":
+         temp_raster = scaled_dem
+
+     # Preparing raster for LCP specifications
+     arcpy.CopyRaster_management(temp_raster, final, "", "", "0", "NONE", "NONE", "32_BIT_SIGNED","NONE", "NONE", "GRID", "NONE")
+     arcpy.DefineProjection_management(temp_raster, projection)
+
+     # Extracting layer by analysis area
+     ready = ExtractByMask(final, naip)
+     ready.save(temp_raster)
+
+     # Converting to ascii format and adding to list for LCP tool
+     arcpy.RasterToASCII_conversion(ready, ascii_output)
+     ascii_layers.append(ascii_output)
+
+     text = "The mitigated "+layer+" ascii file was created."
+     generateMessage(text)
+
+  # Coding note: Check to see that lists are concatenated
+  convertToAscii(land_cover, fuel_lst + elevation_lst)
+
+  #-----------------------------------------------
+  #-----------------------------------------------
+  text = "Mitigation ASCIIs created for LCP."
+  generateMessage(text)
+  #-----------------------------------------------
+  #-----------------------------------------------
+
+#-----------------------------------------------
+#-----------------------------------------------
+def incrementalMitigation():
+  text = "Patching the mitigation into the unmitigated landscape."
+  generateMessage(text)
+
+  # Variables
+  object_raster = os.path.join(scratchgdb, "mitigation_objects")
+  deltas_table = os.path.join(outputs, "mitigation_deltas.csv")
+
+  # Objects on the landscape grid for the per-object report
+  arcpy.CalculateField_management(classified, "JOIN", "[FID]+1")
+  arcpy.PolygonToRaster_conversion(classified, "JOIN", object_raster, "CELL_CENTER", "", scaled_dem)
+
+  # Only the buffer neighborhood is rebuilt and re-burned
+  deltas = mitigateIncremental(outputs, pipe_proj, object_raster, mitigation_surface, mitigation_height, dll_path, fuel_moisture, scratchws)
+  writeDeltas(deltas, deltas_table)
 
-# Clip pipeline to study area, buffer pipeline
-arcpy.Clip_analysis(pipeline, bnd_zones, asset)
-arcpy.Buffer_analysis(asset, pipe_buffer, buff_distance, "", "", "ALL")
-arcpy.PolygonToRaster_conversion(pipe_buffer, "FID", pipe_rast, "CELL_CENTER", "", coarsening_size)#int(coarsening_size))
-arcpy.ProjectRaster_management(pipe_rast, pipe_proj, classified, "BILINEAR", str(coarsening_size) +" "+str(coarsening_size))
-arcpy.RasterToPolygon_conversion(pipe_proj, pipe_buffer, "NO_SIMPLIFY")
-
-
-arcpy.Erase_analysis(classified_unmitigated, pipe_buffer, classified_no_asset)
-# Removing unnecessary fields for training samples
-classified_fields = [[f.name, f.type] for f in arcpy.ListFields(classified)]
-asset_fields = [f.name for f in arcpy.ListFields(pipe_buffer)]
-add_fields = []
-for f_name,f_type in classified_fields:
- if f_name not in asset_fields:
-   add_fields.append([f_name, f_type])
-for f_name, f_type in add_fields:
-	arcpy.AddField_management(pipe_buffer, f_name, f_type)
-	if f_name == "height":
-		arcpy.CalculateField_management(pipe_buffer, f_name, mitigation_height)
-	elif f_name == "S2":
-		arcpy.CalculateField_management(pipe_buffer, f_name, mitigation_surface)
-#-----------------------------------------------
-#-----------------------------------------------
-text = "Merging mitigated buffer back to classified image."
-generateMessage(text)
-
-# Merging all layers back together as classified layer
-arcpy.Merge_management([pipe_buffer, classified], mitigated)
-#-----------------------------------------------
-#-----------------------------------------------
-
-#-----------------------------------------------
-#-----------------------------------------------
-text = "Assigning fuel models and creating canopy cover assessments."
-generateMessage(text)
-
-# Variables
-land_cover = m_classified
-land_cover_fields = [["fuel", "S2"], ["canopy", "S2"], ["stand", "height"]]
-
-def classify(model, x):
-   
- # Anderson 13 fuel models
- if model == "13":
-   building = "10"
-   tree = "10"
-   shrub = "6"
-   grass = "1"
-   water = "98"
-   path = "99"
- elif model != "13":
-   #-----------------------------------------------
-   #-----------------------------------------------
-   text = "Cannot classify fuels. Only Anderson 13 are available."
-   generateMessage(text)
-   #-----------------------------------------------
-   classify("13", output_field)
- if x == "fuel":
-   return ("def classify(x):\\n"+
-           "  if x == \"building\":\\n"+
-           "    return "+building+"\\n"+
-           "  elif x == \"path\": \\n"+
-           "    return "+path+"\\n"+
-           "  elif x == \"water\":\\n"+
-           "    return "+water+"\\n"+
-           "  elif x == \"grass\":\\n"+
-           "    return "+grass+"\\n"+
-           "  elif x == \"shrub\":\\n"+
-           "    return "+shrub+"\\n"+
-           "  elif x == \"tree\":\\n"+
-           "    return "+tree+"\\n"
-           )
-
- elif x == "canopy":
-   return ("def classify(x):\\n"+
-           "  if x == \"tree\" or x == \"building\":\\n"+
-           "    return 75\\n"+ # 75% canopy cover b/c 
-           "  return 0"
-           )
- # Returns height attribute - May delete if cannot include into .LCP
- elif x == "stand":
-   return("def classify(x):\\n"+
-          "  return x"
-          )
-
-for field in land_cover_fields:
- input_field = field[1]
- output_field = field[0]
- arcpy.AddField_management(land_cover, output_field, "INTEGER")
- fxn = "classify(!"+input_field+"!)"
- label_class = classify(model, output_field)
- arcpy.CalculateField_management(land_cover, output_field, fxn, "PYTHON_9.3", label_class)
-
+  text = str(len(deltas))+" objects re-burned. Deltas saved to "+os.path.basename(deltas_table)+"."
+  generateMessage(text)
 #-----------------------------------------------
 #-----------------------------------------------
 
 #-----------------------------------------------
 #-----------------------------------------------
-text = "Fuel complex created."
-generateMessage(text)
-#-----------------------------------------------
-#-----------------------------------------------
-
-#-----------------------------------------------
-#-----------------------------------------------
-text = "Creating inputs for Landscape File."
-generateMessage(text)
-
-# Variables
-fuel_lst = ["fuel", "canopy", "stand"]
-elevation_lst = ["slope", "elevation", "aspect"]
-ascii_layers = []
-fuel = os.path.join(outputs, "m_fuel.asc")
+def scenarioMitigation():
+  scenarios = scenarioGrid([os.path.join(inputs, a) for a in scenario_assets], scenario_buff_distances, scenario_treatments)
+  text = "Evaluating "+str(len(scenarios))+" mitigation scenarios."
+  generateMessage(text)
 
-def convertToAscii(x, landscape_elements):
- 
- for layer in landscape_elements:
+  # Variables
+  object_raster = os.path.join(scratchgdb, "mitigation_objects")
+  scenario_folder = os.path.join(scratchws, "Scenarios")
+  scenario_table = os.path.join(outputs, "mitigation_scenarios.csv")
+  if not os.path.isdir(scenario_folder):
+    os.makedirs(scenario_folder)
 
-   # Variables
-   ascii_output = os.path.join(outputs, "m_"layer + ".asc")
-   where_clause = layer +" <> 9999"
-   temp = os.path.join(scratchgdb, "mt_"+layer)
-   temp_raster = os.path.join(scratchgdb, "mt_"+layer+"_r")
-   final = os.path.join(scratchgdb, "m_"+layer)
+  # Objects on the landscape grid for the per-object comparison
+  arcpy.CalculateField_management(classified, "JOIN", "[FID]+1")
+  arcpy.PolygonToRaster_conversion(classified, "JOIN", object_raster, "CELL_CENTER", "", scaled_dem)
 
-   # Selecting layer and converting to raster
-   if layer in fuel_lst:
-     arcpy.Select_analysis(land_cover, temp, where_clause)
-     arcpy.PolygonToRaster_conversion(temp, layer, temp_raster, "CELL_CENTER", "", scaled_dem)
-   elif layer in elevation_lst:
-
-     # Calculating elevation derived layers
-     if layer == "slope":
-       arcpy.Slope_3d(scaled_dem, temp_raster, "DEGREE")
-     elif layer == "aspect":
-       arcpy.Aspect_3d(scaled_dem, temp_raster)
-     elif layer == "elevation":
-       temp_raster = scaled_dem
-
-   # Preparing raster for LCP specifications
-   arcpy.CopyRaster_management(temp_raster, final, "", "", "0", "NONE", "NONE", "32_BIT_SIGNED","NONE", "NONE", "GRID", "NONE")
-   arcpy.DefineProjection_management(temp_raster, projection)
-
-   # Extracting layer by analysis area
-   ready = ExtractByMask(final, naip)
-   ready.save(temp_raster)
-
-   # Converting to ascii format and adding to list for LCP tool
-   arcpy.RasterToASCII_conversion(ready, ascii_output)
-   ascii_layers.append(ascii_output)
-
-   text = "The mitigated "+layer+" ascii file was created."
-   generateMessage(text)
+  # Build all mitigated windows, burn concurrently and rank
+  results = runScenarios(scenarios, outputs, object_raster, unit, dll_path, fuel_moisture, scenario_folder, scenario_processes, "fli", model)
+  writeScenarios(results, scenario_table)
 
-# Coding note: Check to see that lists are concatenated
-convertToAscii(land_cover, fuel_lst + elevation_lst)
-
-#-----------------------------------------------
+  text = "Scenarios ranked by fire line intensity reduction in "+os.path.basename(scenario_table)+"."
+  generateMessage(text)
 #-----------------------------------------------
-text = "Mitigation ASCIIs created for LCP."
-generateMessage(text)
 #-----------------------------------------------
-#-----------------------------------------------
\ No newline at end of file
+
+if run_scenarios == "Yes":
+  scenarioMitigation()
+elif incremental_mitigation == "Yes":
+  bufferAsset()
+  incrementalMitigation()
+else:
+  bufferAsset()
+  rebuildMitigation()
@@ -0,0 +1,199 @@
+#-------------------------------------------------------------------------------
+# Name:        mitigationLib Tool
+# Purpose:     Incremental mitigation. Instead of rebuilding every landscape
+#              layer and re-burning the whole site, the mitigation footprint is
+#              patched into the cached unmitigated fuel/canopy/stand arrays and
+#              only the window around the footprint is re-burned. FlamMap fire
+#              behavior is calculated cell by cell, so the rest of the site is
+#              unchanged and is taken from the unmitigated burn.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import csv
+import os
+import sys
+import numpy as np
+from rasterArrays import rasterToArray, asciiToArray, arrayToAscii, alignToGrid, windowInfo
+from burnJoin import objectMax
+from flamMapLib import burnFolder, burn_metrics
+
+fuel_layers = ["fuel", "canopy", "stand"]
+landscape_layers = fuel_layers + ["elevation", "slope", "aspect"]
+
+# Unmitigated arrays already read this session, keyed by path
+landscape_cache = {}
+
+
+def treatmentValues(surface, height, model="13"):
+  # Fuel, canopy and stand values given to cells inside the footprint
+  # (Anderson 13, same assignments as genMitigation)
+  if model != "13":
+    raise ValueError("Only Anderson 13 fuel models are available.")
+  fuel_codes = {"building": 10, "tree": 10, "shrub": 6, "grass": 1, "water": 98, "path": 99}
+  if surface in ["tree", "building"]:
+    canopy = 75
+  else:
+    canopy = 0
+  return {"fuel": fuel_codes[surface], "canopy": canopy, "stand": height}
+
+def loadAsciis(folder, names, prefix=""):
+  # Cached {name: array} for <prefix><name>.asc in folder, plus the grid info
+  arrays = {}
+  info = None
+  for name in names:
+    ascii_file = os.path.abspath(os.path.join(folder, prefix + name + ".asc"))
+    if ascii_file not in landscape_cache:
+      landscape_cache[ascii_file] = asciiToArray(ascii_file)
+    arrays[name], info = landscape_cache[ascii_file]
+  return arrays, info
+
+def loadLandscape(outputs):
+  # Unmitigated LCP layers written by LCP()
+  return loadAsciis(outputs, landscape_layers)
+
+def loadBurns(outputs, prefix="m_"):
+  # Unmitigated burn written by burn()
+  burns, info = loadAsciis(outputs, burn_metrics, prefix)
+  return burns
+
+def footprintMask(footprint_raster, info):
+  # Cells of the landscape grid inside the mitigation footprint
+  footprint, footprint_info = rasterToArray(footprint_raster)
+  return ~np.isnan(alignToGrid(footprint, footprint_info, info))
+
+def objectLabels(object_raster, info):
+  # Object JOIN ids on the landscape grid (0 = no object)
+  labels, label_info = rasterToArray(object_raster, "float64")
+  labels = alignToGrid(labels, label_info, info)
+  return np.where(np.isnan(labels), 0, labels).astype("int64")
+
+def footprintWindow(mask, margin=1):
+  # Row and column slices bounding the footprint plus a margin of cells
+  rows, cols = np.nonzero(mask)
+  if rows.size == 0:
+    return None
+  row_slice = slice(int(max(rows.min() - margin, 0)), int(min(rows.max() + margin + 1, mask.shape[0])))
+  col_slice = slice(int(max(cols.min() - margin, 0)), int(min(cols.max() + margin + 1, mask.shape[1])))
+  return row_slice, col_slice
+
+def patchLandscape(landscape, mask, values):
+  # Copies of the fuel layers with the footprint cells replaced
+  patched = {}
+  for layer in fuel_layers:
+    array = landscape[layer].copy()
+    array[mask & ~np.isnan(array)] = values[layer]
+    patched[layer] = array
+  return patched
+
+def writeWindow(landscape, patched, info, window, folder):
+  # Writes the w_*.asc LCP layers for the window into folder
+  rows, cols = window
+  w_info = windowInfo(info, rows, cols)
+  for layer in landscape_layers:
+    source = patched.get(layer, landscape[layer])
+    arrayToAscii(source[rows, cols], w_info, os.path.join(folder, "w_" + layer + ".asc"), fmt="%d")
+  return folder
+
+def readWindowBurns(folder):
+  # {metric: window array} of a burned window folder
+  burns = {}
+  for metric in burn_metrics:
+    burns[metric] = asciiToArray(os.path.join(folder, "w_" + metric + ".asc"))[0]
+  return burns
+
+def reburnWindow(landscape, patched, info, window, folder, dll_path, fuel_moisture, windspeed=30.0, wind_dir=0.0):
+  # Builds an LCP for the window only, burns it and returns {metric: window array}
+  writeWindow(landscape, patched, info, window, folder)
+  burnFolder(dll_path, folder, fuel_moisture, windspeed, wind_dir)
+  return readWindowBurns(folder)
+
+def spliceBurns(before, window, window_burns):
+  # Whole-site burns with the window replaced by its re-burn
+  rows, cols = window
+  after = {}
+  for metric in burn_metrics:
+    after[metric] = before[metric].copy()
+    after[metric][rows, cols] = window_burns[metric]
+  return after
+
+def windowDeltas(labels, before, after, window):
+  # Per-object deltas for the objects in the window. An object crossing the
+  # window edge is compared over its whole extent (after equals before outside
+  # the window), so its maximum is the same as in a whole-site join.
+  rows, cols = window
+  objects = np.unique(labels[rows, cols])
+  objects = objects[objects > 0]
+  if objects.size == 0:
+    return {}
+  affected = np.isin(labels, objects)
+  rows, cols = footprintWindow(affected, 0)
+  object_labels = np.where(affected[rows, cols], labels[rows, cols], 0)
+  return burnDeltas(object_labels,
+                    dict((m, before[m][rows, cols]) for m in burn_metrics),
+                    dict((m, after[m][rows, cols]) for m in burn_metrics))
+
+def burnDeltas(labels, before, after):
+  # {JOIN: {metric: (before, after, after - before)}} of the per-object maximum
+  before_max = objectMax(labels, [before[m] for m in burn_metrics])
+  after_max = objectMax(labels, [after[m] for m in burn_metrics])
+  deltas = {}
+  for label, old in before_max.items():
+    new = after_max[label]
+    deltas[label] = dict((m, (o, n, n - o)) for m, o, n in zip(burn_metrics, old, new))
+  return deltas
+
+def writeDeltas(deltas, csv_file):
+  # One row per object: JOIN, then before/after/delta for each metric
+  header = ["JOIN"]
+  for metric in burn_metrics:
+    header.extend([metric + "_before", metric + "_after", metric + "_delta"])
+  rows = []
+  for label in sorted(deltas):
+    row = [label]
+    for metric in burn_metrics:
+      row.extend(deltas[label][metric])
+    rows.append(row)
+  return writeTable(header, rows, csv_file)
+
+def writeTable(header, rows, csv_file):
+  # Writes a csv table that opens directly in ArcMap/Excel
+  if sys.version_info[0] < 3:
+    f = open(csv_file, "wb")
+  else:
+    f = open(csv_file, "w", newline="")
+  with f:
+    writer = csv.writer(f)
+    writer.writerow(header)
+    writer.writerows(rows)
+  return csv_file
+
+def mitigateIncremental(outputs, footprint_raster, object_raster, surface, height, dll_path, fuel_moisture,
+                        folder=None, prefix="mitigated_", model="13", margin=1, windspeed=30.0, wind_dir=0.0):
+  # Patches the footprint into the unmitigated landscape, re-burns only its
+  # window and writes <prefix><metric>.asc for the whole site.
+  # Returns the per-object deltas of the objects in the window.
+  if folder is None:
+    folder = outputs
+  landscape, info = loadLandscape(outputs)
+  before = loadBurns(outputs)
+
+  mask = footprintMask(footprint_raster, info)
+  window = footprintWindow(mask, margin)
+  if window is None:
+    return {}
+  patched = patchLandscape(landscape, mask, treatmentValues(surface, height, model))
+  window_burns = reburnWindow(landscape, patched, info, window, folder, dll_path, fuel_moisture, windspeed, wind_dir)
+
+  after = spliceBurns(before, window, window_burns)
+  for metric in burn_metrics:
+    arrayToAscii(after[metric], info, os.path.join(folder, prefix + metric + ".asc"))
+
+  labels = objectLabels(object_raster, info)
+  return windowDeltas(labels, before, after, window)
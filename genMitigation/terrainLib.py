@@ -0,0 +1,101 @@
+#-------------------------------------------------------------------------------
+# Name:        terrainLib Tool
+# Purpose:     Calculates slope (degrees) and aspect from the DEM in a single
+#              pass using Horn's method. Terrain does not change between the
+#              unmitigated and mitigated landscapes, so derivatives are cached
+#              by a hash of the DEM and only calculated once per site.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import hashlib
+import os
+import numpy as np
+from rasterArrays import rasterToArray, writeIntermediate
+
+# Derivatives already calculated this session, keyed by DEM hash
+terrain_cache = {}
+
+
+def horn(dem, cell_width, cell_height=None):
+  # Returns slope (degrees) and aspect (degrees clockwise from north, -1 where
+  # flat) for a DEM array. Nodata (NaN) cells stay NaN. Missing neighbours at
+  # the edges or next to nodata take the centre cell's value, as in Slope_3d.
+  if cell_height is None:
+    cell_height = cell_width
+  dem = np.asarray(dem, dtype="float64")
+  nodata = np.isnan(dem)
+
+  # Pad edges with nodata, so neighbours off the edge and nodata neighbours
+  # both take the centre value
+  padded = np.pad(dem, 1, mode="constant", constant_values=np.nan)
+  padded[np.isnan(padded)] = np.inf
+  rows, cols = dem.shape
+  centre = padded[1:-1, 1:-1]
+
+  def window(r, c):
+    w = padded[r:r + rows, c:c + cols]
+    return np.where(np.isinf(w), centre, w)
+
+  a, b, c = window(0, 0), window(0, 1), window(0, 2)
+  d, f = window(1, 0), window(1, 2)
+  g, h, i = window(2, 0), window(2, 1), window(2, 2)
+
+  dz_dx = ((c + 2 * f + i) - (a + 2 * d + g)) / 8.0
+  dz_dy = ((g + 2 * h + i) - (a + 2 * b + c)) / 8.0
+
+  # Slope
+  rise_run = np.sqrt((dz_dx / cell_width) ** 2 + (dz_dy / cell_height) ** 2)
+  slope = np.degrees(np.arctan(rise_run))
+
+  # Aspect (converted from math angle to compass bearing)
+  aspect = np.degrees(np.arctan2(dz_dy, -dz_dx))
+  aspect = np.where(aspect < 0, 90.0 - aspect,
+           np.where(aspect > 90.0, 450.0 - aspect, 90.0 - aspect))
+  aspect = np.where((dz_dx == 0) & (dz_dy == 0), -1.0, aspect)
+
+  slope[nodata] = np.nan
+  aspect[nodata] = np.nan
+  return slope.astype("float32"), aspect.astype("float32")
+
+def demHash(dem, cell_width, cell_height):
+  # Key for the derivative cache; the tag keeps derivatives cached with the
+  # older edge rule (nearest edge cell) from being reused
+  key = hashlib.sha1(b"edges=centre")
+  key.update(np.ascontiguousarray(dem, dtype="float32").tobytes())
+  key.update(str((dem.shape, float(cell_width), float(cell_height))).encode("utf-8"))
+  return key.hexdigest()
+
+def getTerrain(scaled_dem, cache_dir=None):
+  # Returns {"slope", "aspect", "info"} for the DEM, calculating only on a cache miss.
+  # If cache_dir is given, derivatives are also kept on disk so that separate
+  # runs (e.g. genMitigation after genBurn) share them.
+  dem, info = rasterToArray(scaled_dem)
+  key = demHash(dem, info["cell_width"], info["cell_height"])
+  if key in terrain_cache:
+    return terrain_cache[key]
+
+  cache_file = None
+  if cache_dir is not None:
+    cache_file = os.path.join(cache_dir, "terrain_" + key + ".npz")
+  if cache_file is not None and os.path.isfile(cache_file):
+    stored = np.load(cache_file)
+    slope, aspect = stored["slope"], stored["aspect"]
+  else:
+    slope, aspect = horn(dem, info["cell_width"], info["cell_height"])
+    if cache_file is not None:
+      np.savez(cache_file, slope=slope, aspect=aspect)
+
+  terrain_cache[key] = {"slope": slope, "aspect": aspect, "info": info}
+  return terrain_cache[key]
+
+def saveTerrain(scaled_dem, layer, output, cache_dir=None, projection=None):
+  # Writes the "slope" or "aspect" layer for the DEM to output
+  terrain = getTerrain(scaled_dem, cache_dir)
+  return writeIntermediate(terrain[layer], terrain["info"], output, projection=projection)
@@ -8,41 +8,75 @@ import pandas as pd
 import numpy as np
 import numpy.ma as ma
 import glob
+import hashlib
+import heapq
 import multiprocessing
+import os
+import sys
+import tempfile
 
 
 
 # In[2]:
 
-def parse_a_scenario(path,POI):
-    # get the time-series LOCA value at the POI
-    data = netCDF4.Dataset(path, mode='r')
-    lats = data.variables['Lat'][:]
-    lngs = data.variables['Lon'][:]
-    time = data.variables['Time'][:]
-    name = path.split("\\")[-1].split(".")[0]
-    variable = data.variables[name][:]
-    lat_idx = np.abs(lats-POI['lat']).argmin()
-    lon_idx = np.abs(lngs-POI['lon']).argmin()
-    return time, ma.getdata(variable)[:,lat_idx,lon_idx]
+def scenario_files(LOCA_path,gcm,rcp,variable,last_year=2040):
+    # get the yearly LOCA files of a gcm, rcp and variable, sorted by year
+    files = []
+    for file in glob.glob(r'%s\%s\%s\%s*.nc'%(LOCA_path,gcm,rcp,variable)):
+        year = int(file.split('\\')[-1].split(".")[1])
+        if year<=last_year: # define upper limit (e.g. 2040) of the time series.
+            files.append((year,file))
+    return sorted(files)
+
+
+def cell_indices(nc,lats,lons):
+    # get the (lat, lon) indices of the LOCA cells nearest to the points
+    data = netCDF4.Dataset(nc, mode='r')
+    grid_lats = data.variables['Lat'][:]
+    grid_lngs = data.variables['Lon'][:]
+    data.close()
+    lat_idx = np.abs(np.asarray(lats)[:,None]-grid_lats[None,:]).argmin(1)
+    lon_idx = np.abs(np.asarray(lons)[:,None]-grid_lngs[None,:]).argmin(1)
+    return lat_idx, lon_idx
 
 
-# In[3]:
+def parse_cells(files,variable,lat_idx,lon_idx):
+    # get the time-series LOCA values of many cells, opening each yearly file
+    # once and reading only the rows and columns holding the cells.
+    # Returns time, year and values (time x cell, NaN where masked).
+    lat_idx = np.asarray(lat_idx)
+    lon_idx = np.asarray(lon_idx)
+    rows, cell_rows = np.unique(lat_idx, return_inverse=True)
+    cols, cell_cols = np.unique(lon_idx, return_inverse=True)
+    lengths = []
+    for year,file in files:
+        data = netCDF4.Dataset(file, mode='r')
+        lengths.append(len(data.variables['Time']))
+        data.close()
+    time = np.empty(sum(lengths))
+    years = np.empty(sum(lengths), dtype='int32')
+    values = np.empty((sum(lengths),len(lat_idx)), dtype='float32')
+    start = 0
+    for (year,file),length in zip(files,lengths):
+        print ('I am reading year %.0f'%year)
+        data = netCDF4.Dataset(file, mode='r')
+        window = data.variables[variable][:,rows,cols]
+        values[start:start+length] = ma.filled(ma.asarray(window,dtype='float32'),np.nan)[:,cell_rows,cell_cols]
+        time[start:start+length] = data.variables['Time'][:]
+        years[start:start+length] = year
+        data.close()
+        start += length
+    return time, years, values
+
 
 def parse_scenarios(LOCA_path,gcm,rcp,variable,POI):
     # get the time-series LOCA value of a gcm, rcp, variable, and at POI
-    all_data = pd.DataFrame()
-    files = glob.glob(r'%s\%s\%s\%s*.nc'%(LOCA_path,gcm,rcp,variable))
-    for file in files:
-        year = int(file.split('\\')[-1].split(".")[1])
-        if year<=2040: # define upper limit (e.g. 2040) of the time series.
-            print ('I am reading year %.0f'%year)
-            time,data = parse_a_scenario(file,POI)
-            sub = pd.DataFrame(time)
-            sub.columns  = ['time']
-            sub[variable] = data
-            sub['year'] = year
-            all_data = pd.concat([all_data,sub])
+    files = scenario_files(LOCA_path,gcm,rcp,variable)
+    if not files:
+        return pd.DataFrame(columns=['index','time',variable,'year'])
+    lat_idx, lon_idx = cell_indices(files[0][1],[POI['lat']],[POI['lon']])
+    time, years, values = parse_cells(files,variable,lat_idx,lon_idx)
+    all_data = pd.DataFrame({'time': time, variable: values[:,0], 'year': years})
     all_data = all_data.reset_index()
     return all_data
 
@@ -58,92 +92,207 @@ def attribute_location(sf,keyword):
 
 # In[5]:
 
-def cell_in_boundary(boundary,nc):
-    # get the LOCA cells in a boundary
-    import shapefile as shp #need the package pyshp
-    import matplotlib.pyplot as plt
+cell_cache = {}
+
+
+def file_hash(paths,arrays=()):
+    # hash the contents of files and arrays (the key of a cached result)
+    digest = hashlib.md5()
+    for path in paths:
+        with open(path,'rb') as f:
+            for block in iter(lambda: f.read(1<<20), b''):
+                digest.update(block)
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def grid_window(coords,low,high):
+    # get the index range of a regular coordinate axis covering [low, high],
+    # padded by one cell
+    step = (coords[-1]-coords[0])/float(len(coords)-1)
+    first, last = sorted([(low-coords[0])/step, (high-coords[0])/step])
+    start = max(int(np.floor(first)),0)
+    stop = min(int(np.ceil(last))+1,len(coords))
+    return start, max(stop,start)
+
+
+def boundary_path(shape):
+    # matplotlib path of all the parts (rings) of a polygon
     import matplotlib.path as mplp
-    nc = netCDF4.Dataset(nc,mode = 'r')
-    lats = nc.variables['Lat'][:]
-    lngs = nc.variables['Lon'][:]
-    X, Y = np.meshgrid(lngs, lats)
-    points = np.array((X.flatten(), Y.flatten())).T
-    
+    points = np.asarray(shape.points)
+    codes = np.full(len(points), mplp.Path.LINETO, dtype=mplp.Path.code_type)
+    codes[list(shape.parts)] = mplp.Path.MOVETO
+    return mplp.Path(points, codes)
+
+
+def cell_in_boundary(boundary,nc,cache_folder=None):
+    # get the LOCA cells in a boundary: X, Y, HUC and the lat_idx, lon_idx of
+    # each cell on the LOCA grid. Each polygon only tests the cells inside its
+    # bounding box; results are cached by grid and shapefile contents.
+    import shapefile as shp #need the package pyshp
+    data = netCDF4.Dataset(nc,mode = 'r')
+    lats = np.asarray(data.variables['Lat'][:])
+    lngs = np.asarray(data.variables['Lon'][:])
+    data.close()
+
+    base = os.path.splitext(boundary)[0]
+    key = file_hash([base+'.shp',base+'.dbf'],[lats,lngs])
+    if key in cell_cache:
+        return cell_cache[key].copy()
+    if cache_folder is None:
+        cache_folder = tempfile.gettempdir()
+    cache_file = os.path.join(cache_folder,'cells_%s.csv'%key)
+    if os.path.exists(cache_file):
+        cell_cache[key] = pd.read_csv(cache_file,dtype={'HUC':str})
+        return cell_cache[key].copy()
+
     sf = shp.Reader(boundary)
     HUC_loc = attribute_location(sf,'HUC12')
-    in_cells = pd.DataFrame()
-    
-    plt.figure()
-    
+    X, Y, HUCs, lat_ids, lon_ids = [], [], [], [], []
     for shape in sf.shapeRecords():
-        temp = pd.DataFrame()
-        x = [i[0] for i in shape.shape.points[:]]
-        y = [i[1] for i in shape.shape.points[:]]
         HUC = shape.record[HUC_loc-1]
-        plt.plot(x,y)
-        line = np.asarray(shape.shape.points[:])
-        mpath = mplp.Path(line)
-        mask = mpath.contains_points(points).reshape(X.shape)
-        plt.plot(X[mask],Y[mask],'ro')
-        temp['X'] = X[mask]
-        temp['Y'] = Y[mask]
-        temp['HUC'] = HUC
-        in_cells = in_cells.append(temp, ignore_index=True)
-    return in_cells
+        x_min, y_min, x_max, y_max = shape.shape.bbox
+        lat_start, lat_stop = grid_window(lats,y_min,y_max)
+        lon_start, lon_stop = grid_window(lngs,x_min,x_max)
+        lat_idx, lon_idx = np.mgrid[lat_start:lat_stop,lon_start:lon_stop]
+        lat_idx, lon_idx = lat_idx.ravel(), lon_idx.ravel()
+        points = np.column_stack((lngs[lon_idx],lats[lat_idx]))
+        mask = boundary_path(shape.shape).contains_points(points)
+        X.append(points[mask,0])
+        Y.append(points[mask,1])
+        HUCs.append(np.repeat(str(HUC),mask.sum()))
+        lat_ids.append(lat_idx[mask])
+        lon_ids.append(lon_idx[mask])
+    in_cells = pd.DataFrame({'X': np.concatenate(X), 'Y': np.concatenate(Y),
+                             'HUC': np.concatenate(HUCs),
+                             'lat_idx': np.concatenate(lat_ids),
+                             'lon_idx': np.concatenate(lon_ids)},
+                            columns=['X','Y','HUC','lat_idx','lon_idx'])
+    in_cells.to_csv(cache_file,index=False)
+    cell_cache[key] = in_cells
+    return in_cells.copy()
 
 
 # In[6]:
 
-def find_event(GCM,RCP,nc,boundary,DIR,variable):
-    # find the date with the highest value
+def huc_averages(values,HUCs):
+    # get the daily average of the cells of every HUC (time x HUC), skipping
+    # NaN cells
+    codes, inverse = np.unique(HUCs, return_inverse=True)
+    members = np.zeros((len(HUCs),len(codes)), dtype='float32')
+    members[np.arange(len(HUCs)),inverse] = 1
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(valid,values,0).dot(members)/valid.astype('float32').dot(members)
+    return codes, average
+
+
+def top_events(time,years,average,top_k=1):
+    # get the top_k (average, time, year) of a HUC-average series, highest first
+    order = np.argsort(np.where(np.isnan(average),-np.inf,average))[::-1][:top_k]
+    return [(average[i],time[i],years[i]) for i in order if not np.isnan(average[i])]
+
+
+def merge_events(running,events,top_k=1):
+    # keep the top_k of the running and new events
+    return heapq.nlargest(top_k,running+events)
+
+
+def find_event(GCM,RCP,nc,boundary,DIR,variable,output_folder=None,top_k=1):
+    # find the dates with the highest value, reducing each yearly file to the
+    # running top_k HUC-average events so the full series is never held.
+    # Returns {HUC: [(average, time, year)]}; with an output_folder the events
+    # of all HUCs are also written to events_<GCM>_<RCP>.csv in it.
     in_cells= cell_in_boundary(boundary,nc)
-    for HUC in in_cells['HUC'].unique():
-        print('I am working on %s %s for %s'%(GCM,RCP,HUC))
-        sub_cells = in_cells[in_cells['HUC']==HUC]
-        master = pd.DataFrame()
-        for i in sub_cells.index:
-            POI = {'name': 'Concord', 'lat': sub_cells.loc[i,'Y'], 'lon':sub_cells.loc[i,'X']}
-            profile = parse_scenarios(DIR,GCM,RCP,variable,POI)
-            master[i] = profile['rainfall']
-        master.head()
-        master['average']= master.mean(1)
-        master['time']= profile['time']
-        master['year']= profile['year']
-        idx = master['average'].idxmax()
-        event = master.loc[idx,:]
-        event[['time','year','average']].to_csv(r'E:\01_Data\08_rainfall_projections\%s_%s_%s.csv'%(HUC,RCP,GCM))
-        print ('I am done with %s %s for %s'%(GCM,RCP,HUC))
+    HUCs = in_cells['HUC'].values
+    running = {}
+    for year,file in scenario_files(DIR,GCM,RCP,variable):
+        time, years, values = parse_cells([(year,file)],variable,in_cells['lat_idx'].values,in_cells['lon_idx'].values)
+        codes, average = huc_averages(values,HUCs)
+        for j,HUC in enumerate(codes):
+            running[HUC] = merge_events(running.get(HUC,[]),top_events(time,years,average[:,j],top_k),top_k)
+    print ('I am done with %s %s'%(GCM,RCP))
+    if output_folder is not None:
+        events = pd.DataFrame([(HUC,t,y,v,rank+1) for HUC in sorted(running)
+                               for rank,(v,t,y) in enumerate(running[HUC])],
+                              columns=['HUC','time','year','average','rank'])
+        write_table(events,os.path.join(output_folder,'events_%s_%s.csv'%(GCM,RCP)))
+    return running
 
-# In[6]:
+# In[7]:
+
+def event_tasks(GCMs,RCPs,nc,boundary,DIR,variable,top_k=1):
+    # split the event search into (GCM, RCP, yearly file) units; every unit
+    # reads one file for all the cells in the boundary
+    in_cells = cell_in_boundary(boundary,nc)
+    cells = (in_cells['lat_idx'].values,in_cells['lon_idx'].values,in_cells['HUC'].values)
+    tasks = []
+    for GCM in GCMs:
+        for RCP in RCPs:
+            for year,file in scenario_files(DIR,GCM,RCP,variable):
+                tasks.append((GCM,RCP,year,file,variable,top_k)+cells)
+    return tasks
+
+
+def file_event(task):
+    # find the top_k dates with the highest HUC-average value in one yearly
+    # file, for every HUC in the boundary
+    GCM,RCP,year,file,variable,top_k,lat_idx,lon_idx,HUCs = task
+    time, years, values = parse_cells([(year,file)],variable,lat_idx,lon_idx)
+    codes, average = huc_averages(values,HUCs)
+    events = []
+    for j,HUC in enumerate(codes):
+        for value,t,y in top_events(time,years,average[:,j],top_k):
+            events.append((GCM,RCP,HUC,t,y,value))
+    return events
+
+
+def write_table(table,output):
+    # write a table as parquet (columnar) or csv, by the output extension
+    if output.endswith('.parquet'):
+        table.to_parquet(output,index=False)
+    else:
+        table.to_csv(output,index=False)
+    return output
 
-def main():
+
+def schedule_events(GCMs,RCPs,nc,boundary,DIR,variable,output,processes=8,top_k=1):
+    # find the top_k dates with the highest value for every (GCM, RCP, HUC). The
+    # yearly file units are handed out one at a time, so workers stay busy
+    # however uneven the HUCs are, and all events go to one table.
+    tasks = event_tasks(GCMs,RCPs,nc,boundary,DIR,variable,top_k)
+    print('I am scheduling %d files on %d workers'%(len(tasks),processes))
+    events = []
+    pool = multiprocessing.Pool(processes)
+    for result in pool.imap_unordered(file_event,tasks,chunksize=1):
+        events.extend(result)
+    pool.close()
+    pool.join()
+    events = pd.DataFrame(events,columns=['GCM','RCP','HUC','time','year','average'])
+    events = events.sort_values('average',ascending=False).groupby(['GCM','RCP','HUC']).head(top_k)
+    events['rank'] = events.groupby(['GCM','RCP','HUC']).cumcount()+1
+    events = events.sort_values(['GCM','RCP','HUC','rank']).reset_index(drop=True)
+    return write_table(events,output)
+
+
+# In[8]:
+
+def main(output_folder):
     GCMs = ['CanESM2','CNRM-CM5','HadGEM2-ES','MIROC5']
     RCPs = ['rcp45','rcp85']
     nc= r'J:\LOCA\CA_NV_VIC_output_2016-09-10\CA_NV_VIC_output_2016-09-10\CanESM2\rcp85\rainfall.2006.v0.CA_NV.nc'
     boundary = r"G:\3Di\LA\Dominguez_huc12.shp"
     DIR =  r'J:\LOCA\CA_NV_VIC_output_2016-09-10\CA_NV_VIC_output_2016-09-10'
     variable = 'rainfall'
-    
-    inputs = pd.DataFrame()
-    i=0
-    for GCM in GCMs:
-        for RCP in RCPs:
-            inputs.loc[i,'GCM'] = GCM
-            inputs.loc[i,'RCP'] = RCP
-            i=i+1
-    inputs['nc'] = nc
-    inputs['boundary'] = boundary
-    inputs['LOCA_DIR'] = DIR
-    inputs['variable'] = variable
+    output = os.path.join(output_folder,'events.csv')
 
     # run in parellel
-    pool = multiprocessing.Pool(8)
-    pool.starmap(find_event,inputs.as_matrix())
-    pool.close()
-    pool.join()
+    schedule_events(GCMs,RCPs,nc,boundary,DIR,variable,output,processes=8)
 
 
 # In[ ]:
 
 if __name__ == '__main__':
-    main()
+    # python parallel_process.py [output folder]
+    main(sys.argv[1] if len(sys.argv)>1 else os.getcwd())
@@ -0,0 +1,211 @@
+#-------------------------------------------------------------------------------
+# Name:        rasterArrays Tool
+# Purpose:     Moves rasters in and out of NumPy so that cell-by-cell work can
+#              be done on arrays instead of through geoprocessing tools.
+#              Nodata cells are carried as NaN while in NumPy. Intermediates
+#              are written tiled and compressed with overviews so later steps
+#              can read block-aligned windows instead of whole rasters.
+#
+# Author:      Peter Norton
+#
+# Created:     10/09/2017
+# Updated:     -
+# Copyright:   (c) Peter Norton 2017
+#-------------------------------------------------------------------------------
+#-----------------------------------------------
+#-----------------------------------------------
+# Import modules
+import arcpy
+import numpy as np
+from contextlib import contextmanager
+
+# Layout of intermediate rasters (cells per tile)
+tile_size = 256
+
+
+def rasterInfo(raster):
+  # Georeferencing needed to write an array back out on the same grid
+  ras = arcpy.Raster(raster)
+  return {
+    "x_min": ras.extent.XMin,
+    "y_min": ras.extent.YMin,
+    "y_max": ras.extent.YMax,
+    "cell_width": ras.meanCellWidth,
+    "cell_height": ras.meanCellHeight,
+    "rows": ras.height,
+    "cols": ras.width,
+    "nodata": ras.noDataValue,
+    "spatial_reference": ras.spatialReference
+  }
+
+def rasterToArray(raster, dtype="float32"):
+  # Returns (array, info). Nodata becomes NaN for float outputs.
+  info = rasterInfo(raster)
+  nodata = info["nodata"]
+  if nodata is None:
+    array = arcpy.RasterToNumPyArray(raster)
+  else:
+    array = arcpy.RasterToNumPyArray(raster, nodata_to_value=nodata)
+  array = array.astype(dtype)
+  if nodata is not None and np.issubdtype(array.dtype, np.floating):
+    array[array == nodata] = np.nan
+  return array, info
+
+def arrayToRaster(array, info, output, nodata=-9999, projection=None):
+  # Writes an array on the grid described by info. NaN cells are written as nodata;
+  # nodata=None writes no NoData value (integer bands where every value is valid).
+  array = np.asarray(array)
+  lower_left = arcpy.Point(info["x_min"], info["y_min"])
+  if nodata is None:
+    ras = arcpy.NumPyArrayToRaster(array, lower_left, info["cell_width"], info["cell_height"])
+  else:
+    if np.issubdtype(array.dtype, np.floating):
+      array = np.where(np.isnan(array), nodata, array)
+    ras = arcpy.NumPyArrayToRaster(array, lower_left, info["cell_width"], info["cell_height"], nodata)
+  ras.save(output)
+  if projection is not None:
+    arcpy.DefineProjection_management(output, projection)
+  elif info.get("spatial_reference") is not None:
+    arcpy.DefineProjection_management(output, info["spatial_reference"])
+  return output
+
+def asciiToArray(ascii_file, dtype="float32"):
+  # Reads an ESRI ASCII grid (e.g. FlamMap outputs) without ASCIIToRaster.
+  # Returns (array, info) with the same info keys as rasterToArray.
+  header = {}
+  with open(ascii_file) as f:
+    while True:
+      position = f.tell()
+      line = f.readline()
+      parts = line.split()
+      if not parts or not parts[0][0].isalpha():
+        f.seek(position)
+        break
+      header[parts[0].lower()] = float(parts[1])
+    array = np.loadtxt(f, dtype=dtype, ndmin=2)
+
+  rows, cols = int(header["nrows"]), int(header["ncols"])
+  cell_size = header["cellsize"]
+  if "xllcenter" in header:
+    header["xllcorner"] = header["xllcenter"] - cell_size / 2.0
+    header["yllcorner"] = header["yllcenter"] - cell_size / 2.0
+  nodata = header.get("nodata_value")
+  array = array.reshape(rows, cols)
+  if nodata is not None and np.issubdtype(array.dtype, np.floating):
+    array[array == nodata] = np.nan
+
+  info = {
+    "x_min": header["xllcorner"],
+    "y_min": header["yllcorner"],
+    "y_max": header["yllcorner"] + rows * cell_size,
+    "cell_width": cell_size,
+    "cell_height": cell_size,
+    "rows": rows,
+    "cols": cols,
+    "nodata": nodata,
+    "spatial_reference": None
+  }
+  return array, info
+
+def alignToGrid(array, info, target_info):
+  # Nearest-cell lookup of array onto the target grid by index arithmetic
+  # (equivalent to Resample NEAREST + snap raster). Cells outside array are NaN.
+  cols = np.arange(target_info["cols"])
+  rows = np.arange(target_info["rows"])
+  x = target_info["x_min"] + (cols + 0.5) * target_info["cell_width"]
+  y = target_info["y_max"] - (rows + 0.5) * target_info["cell_height"]
+  src_cols = np.floor((x - info["x_min"]) / info["cell_width"]).astype("int64")
+  src_rows = np.floor((info["y_max"] - y) / info["cell_height"]).astype("int64")
+  valid_cols = (src_cols >= 0) & (src_cols < info["cols"])
+  valid_rows = (src_rows >= 0) & (src_rows < info["rows"])
+
+  aligned = np.full((target_info["rows"], target_info["cols"]), np.nan, dtype="float32")
+  inside = np.ix_(valid_rows, valid_cols)
+  aligned[inside] = array[np.ix_(src_rows[valid_rows], src_cols[valid_cols])]
+  return aligned
+
+def arrayToAscii(array, info, ascii_file, nodata=-9999, fmt=None):
+  # Writes an ESRI ASCII grid (e.g. LCP inputs) on the grid described by info
+  array = np.asarray(array)
+  if fmt is None:
+    fmt = "%.4f" if np.issubdtype(array.dtype, np.floating) else "%d"
+  if np.issubdtype(array.dtype, np.floating):
+    array = np.where(np.isnan(array), nodata, array)
+  header = ("ncols " + str(array.shape[1]) + "\n" +
+            "nrows " + str(array.shape[0]) + "\n" +
+            "xllcorner " + repr(float(info["x_min"])) + "\n" +
+            "yllcorner " + repr(float(info["y_min"])) + "\n" +
+            "cellsize " + repr(float(info["cell_width"])) + "\n" +
+            "NODATA_value " + str(nodata))
+  np.savetxt(ascii_file, array, fmt=fmt, delimiter=" ", header=header, comments="")
+  return ascii_file
+
+def windowInfo(info, rows, cols):
+  # Grid info for the array[rows, cols] window of a grid (rows/cols are slices)
+  window = dict(info)
+  window["rows"] = rows.stop - rows.start
+  window["cols"] = cols.stop - cols.start
+  window["x_min"] = info["x_min"] + cols.start * info["cell_width"]
+  window["y_max"] = info["y_max"] - rows.start * info["cell_height"]
+  window["y_min"] = window["y_max"] - window["rows"] * info["cell_height"]
+  return window
+
+def windowSlices(info, window):
+  # (rows, cols) slices of a window (see windowInfo) on its parent grid
+  row = int(round((info["y_max"] - window["y_max"]) / info["cell_height"]))
+  col = int(round((window["x_min"] - info["x_min"]) / info["cell_width"]))
+  return slice(row, row + window["rows"]), slice(col, col + window["cols"])
+
+def windowToArray(raster, info, rows, cols, dtype="float32"):
+  # (array[rows, cols], window info) read directly from raster (bands first
+  # for multiband). Nodata becomes NaN for float outputs.
+  window = windowInfo(info, rows, cols)
+  lower_left = arcpy.Point(window["x_min"], window["y_min"])
+  nodata = info["nodata"]
+  if nodata is None:
+    array = arcpy.RasterToNumPyArray(raster, lower_left, window["cols"], window["rows"])
+  else:
+    array = arcpy.RasterToNumPyArray(raster, lower_left, window["cols"], window["rows"], nodata)
+  array = array.astype(dtype)
+  if nodata is not None and np.issubdtype(array.dtype, np.floating):
+    array[array == nodata] = np.nan
+  return array, window
+
+def blockWindows(info, block_size=tile_size):
+  # (rows, cols) slices of the tile-aligned blocks covering a grid
+  for row in range(0, info["rows"], block_size):
+    for col in range(0, info["cols"], block_size):
+      yield slice(row, min(row + block_size, info["rows"])), slice(col, min(col + block_size, info["cols"]))
+
+@contextmanager
+def tiledOutput(output):
+  # Environment for writing a tiled, compressed raster (LZW for files, LZ77
+  # in a geodatabase); the previous settings are restored afterwards
+  saved = (arcpy.env.tileSize, arcpy.env.compression)
+  arcpy.env.tileSize = "{0} {0}".format(tile_size)
+  arcpy.env.compression = "LZ77" if ".gdb" in output.lower() else "LZW"
+  try:
+    yield output
+  finally:
+    arcpy.env.tileSize, arcpy.env.compression = saved
+
+def writeIntermediate(array, info, output, nodata=-9999, projection=None, overviews=True):
+  # arrayToRaster for pipeline intermediates: tiled, compressed and with
+  # overviews (pyramids)
+  with tiledOutput(output):
+    arrayToRaster(array, info, output, nodata, projection)
+  if overviews:
+    arcpy.BuildPyramids_management(output)
+  return output
+
+def readIntermediate(raster, rows=None, cols=None, dtype="float32", info=None):
+  # (array, info) of a whole intermediate, or of the [rows, cols] window
+  # (best on tile-aligned windows, see blockWindows). Pass the raster's info
+  # when reading many windows so it is described once.
+  if rows is None and cols is None:
+    return rasterToArray(raster, dtype)
+  if info is None:
+    info = rasterInfo(raster)
+  rows = rows if rows is not None else slice(0, info["rows"])
+  cols = cols if cols is not None else slice(0, info["cols"])
+  return windowToArray(raster, info, rows, cols, dtype)
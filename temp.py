@@ -2,16 +2,18 @@
 # Name:			unpackFire.py
 # 
 # Description:	This script (1) unpacks the output shapefile from FARSITE, 
-#				(2) re-stacks the shapefiles, and (3) creates the image stack 
-#				needed to create a movie (.GIF) of the burn simulation.
+#				(2) re-stacks the shapefiles, and (3) renders the frames and 
+#				movie (.GIF) of the burn simulation.
 #
 # Inputs:		burn.shp, bnd.shp, bnd_template.lyr, fire_template.lyr
 #	
-# Outputs:		(shapefiles separated by minutes) burn_#.shp, burn_#.png, 
-#				burn_union.shp
+# Outputs:		burn_tot (burn count), burn_toa (time of arrival), burn_#.png,
+#				burn_union (tot)
 #
 # Usage:		no user specified parameters required
 #
+# Dependent scripts (kept next to this script): rasterArrays.py, fireLib.py
+#
 # Author:		Peter Norton
 # Created:		04/05/2017
 # Copyright:	(c) PeterNorton 2017
@@ -22,6 +24,8 @@ import arcpy
 import os
 import sys
 from arcpy import env
+from rasterArrays import arrayToRaster
+from fireLib import perimeterGrid, readPerimeters, burnStack, renderFrames
 scratchws = env.scratchWorkspace
 scriptpath = sys.path[0]
 toolpath = os.path.dirname(scriptpath)
@@ -41,8 +45,12 @@ gifpath = os.path.join(toolpath, "fire_gif")
 gif = os.path.join(gifpath, "fire_sim.gif")
 scratchgdb = os.path.join(scratchws, "Scratch.gdb")
 sms_fc = os.path.join(scratchgdb, "sms_fc")
+burn_tot = os.path.join(burn_gdb, "burn_tot")
+burn_toa = os.path.join(burn_gdb, "burn_toa")
 # Local variables
-attributes = []
+cell_size = 10		# Burn grid cell size (map units)
+frame_scale = 1		# Pixels per burn cell in the frames
+frame_delay = 20	# Hundredths of a second per frame
 name = "burn_"
 
 # Set projection
@@ -52,92 +60,36 @@ name = "burn_"
 # Repair geometry for multi-part features with negative area
 #arcpy.RepairGeometry_management(datapath, "DELETE_NULL")
 
-# Process: Iterate Feature Selection
+# Process: Stack perimeters
 #-------------------------------------------------------------
-# This step iterates through the overlayed, multi-part feature
-# by the user selected field and outputs a new feature class.
+# This step rasterizes the perimeter of every time step onto
+# one grid and counts how many perimeters cover each cell.
 
-# Create a layer from the shapefile and add it to the map
-name = "burn_"
-cursor = arcpy.da.SearchCursor(datapath, ["Elapsed Mi"], "", "")
-for row in cursor:
-	attr = str(row)[1:-4]
-	if attr not in attributes:
-		attributes.append(attr)
+# Read every perimeter once and stack them on a fixed grid
+perimeters = readPerimeters(datapath, "Elapsed Mi")
+attributes = sorted(perimeters)
 arcpy.AddMessage("Attributes used: {0}".format(attributes))
 attr_length = len(attributes)
-count = 0
-frames = []
-burn_list = []
-union_fields = ["stack#", "tot"]
-
-temp_attributes = []
-i = 0
-while i < 10:
-	temp_attributes.append(attributes[i])
-	i += 1
-for attr in temp_attributes:
-	out_name = attr
-	where_clause = "\"Elapsed Mi\"=" + attr
-	
-	temp_fire = os.path.join(outpath, "temp_fire.shp")
-	output_burn = os.path.join(outpath, out_name + ".shp")
-
-	#arcpy.Select_analysis(datapath, temp_fire, where_clause)
-	#arcpy.Clip_analysis(temp_fire, bndpath, output_burn)
-	
-	# Add fields and calculate
-	toa = os.path.join(burn_gdb, "T" + out_name)
-	#arcpy.FeatureClassToGeodatabase_conversion(output_burn, burn_gdb)
-	#arcpy.AddField_management(toa, "stack", "SHORT")
-	#arcpy.CalculateField_management(toa, "stack", 1)
-	burn_fields = [f.name for f in arcpy.ListFields(toa)]
-	delete_fields = ["Month", "Day", "Hour", "Elapsed_Mi", "Fire_Type"]
-	arcpy.DeleteField_management(toa, delete_fields)
-	burn_list.append(toa)
-	del temp_fire
-	del output_burn
 
-	count += 1
-	# png_name = out_name + ".png"
-	# output_png = os.path.join(gifpath, png_name)
-	# mxd = arcpy.mapping.MapDocument(mxd_path)
-	# df = arcpy.mapping.ListDataFrames(mxd)[0]
-	# bnd = arcpy.mapping.Layer(bndpath)
-	# layer = arcpy.mapping.Layer(output_burn)
-	# arcpy.ApplySymbologyFromLayer_management(layer,symbology_layer)
-	# arcpy.mapping.AddLayer(df, layer)
-	# arcpy.ApplySymbologyFromLayer_management(bnd,symbology_bnd)
-	# arcpy.mapping.AddLayer(df, bnd)
-	# df.extent = bnd.getExtent()
-	# arcpy.RefreshActiveView()
-	# arcpy.RefreshTOC()
-	# arcpy.mapping.ExportToPNG(mxd, output_png)
-	# #frames.append(imageio.imread(image))
-	# del layer
-	# del df
-	# del mxd
-	arcpy.AddMessage("{0} of {1}".format(count, attr_length))
+desc = arcpy.Describe(datapath)
+info = perimeterGrid(desc.extent, cell_size, desc.spatialReference)
+tot, toa = burnStack(perimeters, info)
+arcpy.AddMessage("{0} of {1}".format(attr_length, attr_length))
 
-# Create a list of feature classes in the current workspace
+# Burn count and time of arrival rasters
+arrayToRaster(tot, info, burn_tot, 0)
+arrayToRaster(toa, info, burn_toa)
 
-
-# Add fields and calculate
-arcpy.AddMessage(burn_list)
+# tot layer: polygons of equal burn count
 burn_union = os.path.join(burn_gdb, "burn_union")
-arcpy.Union_analysis(burn_list, burn_union, "NO_FID")
-arcpy.AddMessage("Union Complete")
-stack_fields = []
-union_stack_fields = [f.name for f in arcpy.ListFields(burn_union)]
-for field in union_stack_fields:
-	if field[:5] == "stack":
-		stack_fields.append(field)
-arcpy.AddMessage("{0} fields will be unioned".format(len(stack_fields)))
-expression = ""
-for field in stack_fields:
-	expression += "[" + field + "] + "
-expression = expression[:-2]
-arcpy.AddMessage(expression)
+arcpy.RasterToPolygon_conversion(burn_tot, burn_union, "NO_SIMPLIFY", "VALUE")
 arcpy.AddField_management(burn_union, "tot", "SHORT")
-arcpy.CalculateField_management(burn_union, "tot", expression)
-arcpy.DeleteField_management(burn_union, stack_fields)
+arcpy.CalculateField_management(burn_union, "tot", "!gridcode!", "PYTHON_9.3")
+arcpy.DeleteField_management(burn_union, ["gridcode"])
+arcpy.AddMessage("Union Complete")
+
+# Frames
+if not os.path.isdir(gifpath):
+	os.makedirs(gifpath)
+frame_count = renderFrames(toa, attributes, gifpath, gif, frame_scale, frame_delay, name)
+arcpy.AddMessage("{0} frames written to {1}".format(frame_count, gif))